@@ -1,29 +1,200 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, field_validator
-from library.mcmc_utils import target_distribution
-from library.mcmc_algorithms import metropolis_hastings, adaptive_metropolis_hastings
-from library.mcmc_utils import proposal_distribution
-from typing import List, Optional
+import asyncio
+import base64
+import io
+import json
+import os
+import queue
+import time
+from contextlib import asynccontextmanager, contextmanager
+import numpy as np
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, field_validator, model_validator
+from library.admission import (
+    AdmissionPolicy,
+    BudgetExceededError,
+    ClientQuotas,
+    QuotaExceededError,
+    estimate_cost,
+)
+from library.batch import run_batch, jsonable_record
+from library.job_store import job_store_from_url, FINISHED_STATUSES
+from library.mcmc_utils import target_distribution, lookup_target_distribution
+from library.metrics import (
+    CONTENT_TYPE,
+    REGISTRY,
+    SIZE_BUCKETS,
+    Counter,
+    Gauge,
+    Histogram,
+)
+from library.progress import SharedProgress
+from library.result_cache import ResultCache, result_cache_key
+from library.tasks import run_sampler, stream_sampler, TaskCancelledError
+from library.worker_pool import SamplerPool, PoolSaturatedError, TaskTimeoutError
+from typing import Dict, List, Literal, Optional, Union
 
 # Default distribution (standard normal)
 DEFAULT_DISTRIBUTION = "exp(-0.5 * x**2) / sqrt(2 * pi)"
 
+# Chunks a streaming response may have waiting for the client before the chain pauses
+STREAM_QUEUE_SIZE = 4
+
+# Most jobs a single batch request may hold
+MAX_BATCH_JOBS = 1000
+
+# Seconds between checks that the client of a running request is still connected
+DISCONNECT_POLL_INTERVAL = 0.25
+
+# Sample formats selected by the 'format' query parameter or the Accept header.
+# 'f8' and 'f4' are raw little-endian float64 and float32 arrays.
+SAMPLE_FORMATS = ("json", "base64", "f8", "f4", "npy")
+ACCEPT_FORMATS = {
+    "application/json": "json",
+    "application/octet-stream": "f8",
+    "application/x-npy": "npy",
+}
+
+# Sampling runs in worker processes so that long chains never block the event loop.
+# Configured by MCMC_WORKERS, MCMC_MAX_QUEUE and MCMC_REQUEST_TIMEOUT.
+sampler_pool = SamplerPool.from_environment()
+
+# Asynchronous jobs, stored in memory by default or in SQLite with
+# MCMC_JOB_STORE=sqlite:PATH. Finished jobs are kept for MCMC_JOB_TTL seconds.
+job_store = job_store_from_url(
+    os.environ.get("MCMC_JOB_STORE", "memory"),
+    ttl=float(os.environ.get("MCMC_JOB_TTL", "3600")),
+)
+# Budgets of a run's estimated cost, configured by MCMC_MAX_ITERATIONS, MCMC_MAX_SAMPLE_MB
+# and MCMC_MAX_RUN_SECONDS, which defaults to the request timeout
+admission_policy = AdmissionPolicy.from_environment(max_seconds=sampler_pool.timeout)
+# Jobs run for as long as they need, so only a set run time budget applies to them
+job_admission_policy = AdmissionPolicy.from_environment()
+# Per-client quotas of sampling time and concurrent runs, configured by MCMC_CLIENT_RATE,
+# MCMC_CLIENT_BURST and MCMC_CLIENT_MAX_CONCURRENT. Clients are told apart by the
+# header named by MCMC_CLIENT_HEADER, e.g. an API key set by a gateway, or by address
+client_quotas = ClientQuotas.from_environment()
+CLIENT_HEADER = os.environ.get("MCMC_CLIENT_HEADER")
+
+# Results of seeded requests, which are deterministic, by a hash of the compiled target
+# and the sampler parameters. Configured by MCMC_RESULT_CACHE_MB, MCMC_RESULT_CACHE_DIR
+# and MCMC_RESULT_CACHE_DISK_MB.
+result_cache = ResultCache.from_environment()
+
+# Request metrics, labelled by the route's path template rather than the URL, so that
+# job ids do not each make a new series. Sampler and compile metrics come from the library.
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response.",
+    ["method", "endpoint", "status"],
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "http_response_size_bytes",
+    "Size of response bodies.",
+    ["method", "endpoint"],
+    buckets=SIZE_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being handled, including streams."
+)
+SERIALIZATION_SECONDS = Histogram(
+    "mcmc_serialization_seconds",
+    "Time to encode sampler results, by format.",
+    ["format"],
+)
+RESULT_CACHE_REQUESTS = Counter(
+    "mcmc_result_cache_requests_total",
+    "Result cache lookups of seeded requests.",
+    ["result"],
+)
+ADMISSION_REJECTIONS = Counter(
+    "mcmc_admission_rejections_total",
+    "Sampling requests rejected before running, by reason.",
+    ["reason"],
+)
+SAMPLER_TASKS_PENDING = Gauge(
+    "mcmc_sampler_tasks_pending", "Sampling tasks running or waiting for a worker."
+)
+
+# Futures, cancellation events and shared progress of jobs submitted by this process
+job_tasks = {}
+job_progress = None
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    # Pre-warm the workers before serving, and let running chains finish on shutdown
+    job_store.fail_unfinished()
+    sampler_pool.start()
+    yield
+    sampler_pool.shutdown(wait=True)
+
+
 app = FastAPI(
     title="MCMC Sampling API",
-    description="API for Metropolis-Hastings and Adaptive Metropolis-Hastings MCMC sampling",
+    description="API for Metropolis-Hastings, Adaptive Metropolis-Hastings, "
+    "parallel tempering, MALA and Hamiltonian Monte Carlo sampling",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
+class MetricsMiddleware:
+    """ASGI middleware that records the latency and response size of every request."""
+
+    def __init__(self, asgi_app):
+        self.app = asgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_and_measure(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            # Set by the router once a route matched
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start_time,
+                method=scope["method"],
+                endpoint=endpoint,
+                status=status,
+            )
+            HTTP_RESPONSE_BYTES.observe(size, method=scope["method"], endpoint=endpoint)
+
+
+app.add_middleware(MetricsMiddleware)
+
+
 # Update the response models to include new statistics
 class MCMCRequest(BaseModel):
     expression: Optional[str] = DEFAULT_DISTRIBUTION
+    log_density: bool = False
     initial: float = 0.0
     iterations: int = 10000
     burn_in: int = 1000
     thin: int = 1
     seed: Optional[int] = None
     credible_interval: float = 0.95
+    return_samples: bool = True
+    profile: bool = False
+    profile_report: Optional[Literal["cprofile", "memory"]] = None
 
     @field_validator("credible_interval")
     @classmethod
@@ -32,14 +203,73 @@ class MCMCRequest(BaseModel):
             raise ValueError("Credible interval must be between 0 and 1")
         return v
 
+    @field_validator("iterations", "thin")
+    @classmethod
+    def validate_positive(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("Must be at least 1")
+        return v
+
+    @field_validator("burn_in")
+    @classmethod
+    def validate_burn_in(cls, v: int) -> int:
+        if v < 0:
+            raise ValueError("Burn-in must be non-negative")
+        return v
+
+    @model_validator(mode="after")
+    def default_log_density_expression(self):
+        # The default expression is a density; with log_density and no expression
+        # fall back to the library's default log-density instead.
+        if self.log_density and "expression" not in self.model_fields_set:
+            self.expression = None
+        return self
+
+    @model_validator(mode="after")
+    def report_implies_profile(self):
+        if self.profile_report is not None:
+            self.profile = True
+        return self
+
+
+class Diagnostics(BaseModel):
+    ess: Optional[float]
+    ess_per_second: Optional[float]
+    mcse: Optional[float]
+    r_hat: Optional[float]
+
+
+class Allocation(BaseModel):
+    location: str
+    bytes: int
+    count: int
+
+
+class MemoryReport(BaseModel):
+    peak_bytes: int
+    top_allocations: List[Allocation]
+
+
+class Profile(BaseModel):
+    phases: Dict[str, float]
+    total_time: float
+    iterations: int
+    seconds_per_iteration: float
+    target_evaluations: int
+    gradient_evaluations: int
+    cprofile: Optional[str] = None
+    memory: Optional[MemoryReport] = None
+
 
 class MCMCResponse(BaseModel):
-    samples: List[float]
+    samples: Optional[List[float]] = None
     elapsed_time: float
     acceptance_rate: float
     mean: float
     median: float
     credible_interval: tuple[float, float]
+    diagnostics: Optional[Diagnostics] = None
+    profile: Optional[Profile] = None
 
 
 class AdaptiveMCMCResponse(MCMCResponse):
@@ -52,71 +282,816 @@ class AdaptiveMCMCRequest(MCMCRequest):
     increase_factor: float = 1.1
     decrease_factor: float = 0.9
 
+    @field_validator("check_interval")
+    @classmethod
+    def validate_check_interval(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("Check interval must be at least 1")
+        return v
+
 
-@app.post("/mcmc/mh", response_model=MCMCResponse)
-async def run_metropolis_hastings(request: MCMCRequest):
-    """Run standard Metropolis-Hastings MCMC sampler."""
+class TemperingMCMCRequest(MCMCRequest):
+    temperatures: Optional[List[float]] = None
+    n_temperatures: int = 8
+    max_temperature: float = 100.0
+    proposal_scale: float = 1.0
+    swap_interval: int = 1
+
+    @field_validator("temperatures")
+    @classmethod
+    def validate_temperatures(cls, v: Optional[List[float]]) -> Optional[List[float]]:
+        if v is not None:
+            if not v or v[0] != 1:
+                raise ValueError("Temperatures must start at 1")
+            if any(hotter <= colder for colder, hotter in zip(v, v[1:])):
+                raise ValueError("Temperatures must be strictly increasing")
+        return v
+
+    @field_validator("n_temperatures", "swap_interval")
+    @classmethod
+    def validate_positive(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("Must be at least 1")
+        return v
+
+    @field_validator("max_temperature")
+    @classmethod
+    def validate_max_temperature(cls, v: float) -> float:
+        if v < 1:
+            raise ValueError("Maximum temperature must be at least 1")
+        return v
+
+    @field_validator("proposal_scale")
+    @classmethod
+    def validate_proposal_scale(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError("Proposal scale must be positive")
+        return v
+
+
+class TemperingMCMCResponse(MCMCResponse):
+    temperatures: List[float]
+    swap_rates: List[float]
+
+
+class LangevinMCMCRequest(MCMCRequest):
+    step_size: float = 1.0
+    target_acceptance: float = 0.574
+
+    @field_validator("step_size")
+    @classmethod
+    def validate_step_size(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError("Step size must be positive")
+        return v
+
+    @field_validator("target_acceptance")
+    @classmethod
+    def validate_target_acceptance(cls, v: float) -> float:
+        if v <= 0 or v >= 1:
+            raise ValueError("Target acceptance must be between 0 and 1")
+        return v
+
+
+class HamiltonianMCMCRequest(LangevinMCMCRequest):
+    step_size: float = 0.5
+    n_leapfrog: int = 10
+    target_acceptance: float = 0.8
+
+    @field_validator("n_leapfrog")
+    @classmethod
+    def validate_n_leapfrog(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("Must be at least 1")
+        return v
+
+
+class GradientMCMCResponse(MCMCResponse):
+    step_size: float
+
+
+class JobRequest(AdaptiveMCMCRequest):
+    sampler: Literal["mh", "amh"] = "mh"
+
+
+class BatchRequest(BaseModel):
+    jobs: List[JobRequest]
+
+    @field_validator("jobs")
+    @classmethod
+    def validate_jobs(cls, v: List[JobRequest]) -> List[JobRequest]:
+        if not 1 <= len(v) <= MAX_BATCH_JOBS:
+            raise ValueError(f"A batch must hold between 1 and {MAX_BATCH_JOBS} jobs")
+        return v
+
+
+class BatchResult(BaseModel):
+    index: int
+    result: Optional[Union[AdaptiveMCMCResponse, MCMCResponse]] = None
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    sampler: str
+    status: str
+    progress: float
+    created_at: float
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+@contextmanager
+def sampling_errors():
+    """Map failures of sampler tasks in the worker pool to HTTP errors."""
     try:
-        target_dist = target_distribution(request.expression)
-
-        samples, elapsed_time, acceptance_rate, mean, median, ci = metropolis_hastings(
-            target_dist,
-            proposal_distribution,
-            request.initial,
-            request.iterations,
-            burn_in=request.burn_in,
-            thin=request.thin,
-            seed=request.seed,
-            credible_interval=request.credible_interval,
+        yield
+    except (PoolSaturatedError, QuotaExceededError) as e:
+        reason = "saturated" if isinstance(e, PoolSaturatedError) else "quota"
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        ) from e
+    except BudgetExceededError as e:
+        ADMISSION_REJECTIONS.inc(reason="budget")
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    except TaskTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e)) from e
+    except TaskCancelledError as e:
+        # The client has disconnected, so no one reads the response
+        raise HTTPException(status_code=499, detail=str(e)) from e
+    except ValueError as e:
+        # Invalid expression or sampler parameters
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except RuntimeError as e:
+        # A worker died (BrokenProcessPool) or the pool is shutting down
+        raise HTTPException(
+            status_code=503, detail=f"Sampling workers are unavailable: {e}"
+        ) from e
+
+
+def client_id(request: Request) -> str:
+    """Identity of the client that per-client quotas apply to."""
+    if CLIENT_HEADER and request.headers.get(CLIENT_HEADER):
+        return request.headers[CLIENT_HEADER]
+    return request.client.host if request.client else "unknown"
+
+
+def compile_target(expression, log_density):
+    """Compile a target and measure its cost per evaluation, for use off the event loop."""
+    target = target_distribution(expression, log_density)
+    # Measured once per compiled target, and cached with it
+    _ = target.evaluation_seconds
+    return target
+
+
+async def compiled_target(params):
+    """Return a request's compiled target, compiling a new one off the event loop."""
+    with sampling_errors():
+        target = lookup_target_distribution(params["expression"], params["log_density"])
+        if target is None:
+            target = await asyncio.to_thread(
+                compile_target, params["expression"], params["log_density"]
+            )
+    return target
+
+
+def admit(sampler, params, target, client, policy=None):
+    """
+    Admit a run if its estimated cost is within the budgets and the client's quota.
+
+    Every admitted run must be released with ``client_quotas.release(client)``.
+
+    Args:
+        sampler (str): Sampler of the run
+        params (dict): Sampler parameters of the run
+        target (CompiledTarget): Compiled target, or None for a target that does not
+            compile, whose run fails at once
+        client (str): Client identity from ``client_id``
+        policy (AdmissionPolicy, optional): Budgets to check. Defaults to
+            ``admission_policy``
+
+    Raises:
+        HTTPException: 422 if the run is over a budget, 429 with Retry-After if the
+            client is over its quota
+    """
+    with sampling_errors():
+        seconds = 0.0
+        if target is not None:
+            cost = estimate_cost(sampler, params, target)
+            (policy or admission_policy).check(cost)
+            seconds = cost.seconds
+        client_quotas.acquire(client, seconds)
+
+
+async def cancel_on_disconnect(http_request, cancel_event):
+    """Set a run's cancel event once its client disconnects, freeing the worker."""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+    cancel_event.set()
+
+
+async def run_in_pool(sampler, request, http_request):
+    """
+    Run a sampler task in the worker pool, mapping failures to HTTP errors.
+
+    The run stops, freeing its worker within milliseconds, if the client
+    disconnects. A profiled run's phases gain 'dispatch', the time the task spent
+    waiting for a worker and passing between processes.
+    """
+    start_time = time.perf_counter()
+    cancel_event = sampler_pool.shared_event()
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, cancel_event))
+    try:
+        with sampling_errors():
+            result = await sampler_pool.run(
+                run_sampler,
+                sampler,
+                request.model_dump(),
+                deadline=time.time() + sampler_pool.timeout,
+                cancel_event=cancel_event,
+            )
+    finally:
+        watcher.cancel()
+    profile = result.get("profile")
+    if profile is not None:
+        dispatch_time = time.perf_counter() - start_time - profile["total_time"]
+        profile["phases"]["dispatch"] = max(0.0, dispatch_time)
+    return result
+
+
+async def cached_run(sampler, request, http_request):
+    """
+    Return the cached result of an identical seeded request, or run the sampler.
+
+    Unseeded requests are random, and profiled requests must time a real run, so
+    neither is cached. Runs that are not cached must be admitted (see ``admit``),
+    and stop if the client disconnects.
+
+    Returns:
+        tuple: The result and whether it came from the cache ('hit' or 'miss')
+    """
+    params = request.model_dump()
+    target = await compiled_target(params)
+    key = None
+    if request.seed is not None and not request.profile and result_cache.enabled:
+        key = result_cache_key(sampler, target, params)
+        result = await asyncio.to_thread(result_cache.get, key)
+        if result is not None:
+            RESULT_CACHE_REQUESTS.inc(result="hit")
+            return result, "hit"
+        RESULT_CACHE_REQUESTS.inc(result="miss")
+
+    client = client_id(http_request)
+    admit(sampler, params, target, client)
+    try:
+        result = await run_in_pool(sampler, request, http_request)
+    finally:
+        client_quotas.release(client)
+    if key is not None:
+        # Writing the disk tier may take a while for many samples
+        await asyncio.to_thread(result_cache.put, key, result)
+    return result, "miss"
+
+
+async def stream_from_pool(sampler, request, chunk_size, client):
+    """
+    Stream a sampler task's chunks from the worker pool as NDJSON records.
+
+    Each line is either {"samples": [...]} or, last, {"summary": {...}}. Errors
+    before the first chunk become HTTP errors; later ones end the stream with an
+    {"error": "..."} record. The chain stops if the client disconnects. The run is
+    admitted like any other (see ``admit``) and released when the stream ends.
+    """
+    if request.profile:
+        raise HTTPException(
+            status_code=400, detail="Profiling is not supported for streamed runs"
         )
+    params = request.model_dump()
+    target = await compiled_target(params)
+    # Created before the run is admitted, so that admitted runs fail only inside the
+    # block that releases them
+    records = sampler_pool.shared_queue(maxsize=STREAM_QUEUE_SIZE)
+    cancel_event = sampler_pool.shared_event()
+    admit(sampler, params, target, client)
 
-        return {
-            "samples": samples.tolist(),
-            "elapsed_time": elapsed_time,
-            "acceptance_rate": acceptance_rate,
-            "mean": mean,
-            "median": median,
-            "credible_interval": ci,
+    def next_record():
+        while not future.done():
+            try:
+                return records.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        # The task has finished (or failed), so all its records are already queued
+        future.result()
+        return records.get_nowait()
+
+    try:
+        with sampling_errors():
+            future = sampler_pool.submit(
+                stream_sampler,
+                sampler,
+                params,
+                records,
+                chunk_size=chunk_size,
+                deadline=time.time() + sampler_pool.timeout,
+                cancel_event=cancel_event,
+            )
+            try:
+                first = await asyncio.to_thread(next_record)
+            except BaseException:
+                cancel_event.set()
+                raise
+    except BaseException:
+        client_quotas.release(client)
+        raise
+
+    async def ndjson():
+        record = first
+        try:
+            while True:
+                kind, payload = record
+                with SERIALIZATION_SECONDS.time(format="ndjson"):
+                    if kind == "samples":
+                        line = json.dumps({"samples": payload.tolist()}) + "\n"
+                    else:
+                        line = json.dumps({"summary": payload}) + "\n"
+                yield line
+                if kind != "samples":
+                    return
+                record = await asyncio.to_thread(next_record)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            # Stops the chain if the client has gone away
+            cancel_event.set()
+            client_quotas.release(client)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/health")
+async def health():
+    """Report that the server is responsive and how many sampling tasks are in flight."""
+    return {"status": "ok", "pending_tasks": sampler_pool.pending}
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Report metrics in the Prometheus text format, for scraping.
+
+    Sampler and compile metrics are summed over this process and the sampling
+    workers, as of each worker's last finished task.
+    """
+    SAMPLER_TASKS_PENDING.set(sampler_pool.pending)
+    snapshots = await asyncio.to_thread(sampler_pool.worker_metrics)
+    return Response(REGISTRY.render(snapshots), media_type=CONTENT_TYPE)
+
+
+def negotiate_sample_format(sample_format, accept):
+    """Pick the sample format from the 'format' query parameter, then the Accept header."""
+    if sample_format is not None:
+        return sample_format
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in ACCEPT_FORMATS:
+            return ACCEPT_FORMATS[media_type]
+    return "json"
+
+
+def sampling_response(result, sample_format, headers=None):
+    """
+    Encode a sampler result in the requested sample format.
+
+    The JSON formats return the usual response body ('base64' replaces 'samples' with
+    'samples_base64', little-endian float64 bytes in base64, and 'samples_dtype').
+    The binary formats return only the samples in the body and the remaining fields
+    as JSON in the X-MCMC-Metadata header, together with 'dtype' and 'count'.
+    Per-interval acceptance rates and a profile's detailed reports can be long, so
+    that header leaves them out.
+
+    Summary-only results (run with return_samples false) have no samples, and are
+    returned as the JSON summary whatever the format. ``headers`` are added to the
+    response. The encoding time is recorded in the serialization metrics and, for
+    profiled runs, reported with the profile's phases in a Server-Timing header.
+    """
+    start_time = time.perf_counter()
+    with SERIALIZATION_SECONDS.time(format=sample_format):
+        response = encode_result(result, sample_format, headers)
+    profile = result.get("profile")
+    if profile is not None:
+        phases = {
+            **profile["phases"],
+            "serialization": time.perf_counter() - start_time,
         }
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={1000 * seconds:.3f}" for name, seconds in phases.items()
+        )
+    return response
+
+
+def encode_result(result, sample_format, headers):
+    """Build the response of ``sampling_response``."""
+    headers = dict(headers or {})
+    samples = result.get("samples")
+    metadata = {key: value for key, value in result.items() if key != "samples"}
+
+    if samples is None:
+        return JSONResponse(metadata, headers=headers)
+
+    # Responses are built directly, skipping per-float pydantic validation
+    if sample_format == "json":
+        return JSONResponse({"samples": samples.tolist(), **metadata}, headers=headers)
+    if sample_format == "base64":
+        data = np.asarray(samples, dtype="<f8").tobytes()
+        return JSONResponse(
+            {
+                "samples_base64": base64.b64encode(data).decode("ascii"),
+                "samples_dtype": "<f8",
+                **metadata,
+            },
+            headers=headers,
+        )
+
+    dtype = "<f4" if sample_format == "f4" else "<f8"
+    samples = np.asarray(samples, dtype=dtype)
+    metadata.pop("acceptance_rates", None)
+    if "profile" in metadata:
+        metadata["profile"] = {
+            key: value
+            for key, value in metadata["profile"].items()
+            if key not in ("cprofile", "memory")
+        }
+    headers["X-MCMC-Metadata"] = json.dumps(
+        {**metadata, "dtype": dtype, "count": len(samples)}
+    )
+    if sample_format == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, samples)
+        return Response(
+            buffer.getvalue(), media_type="application/x-npy", headers=headers
+        )
+    return Response(
+        samples.tobytes(), media_type="application/octet-stream", headers=headers
+    )
+
+
+SampleFormat = Optional[Literal[SAMPLE_FORMATS]]
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) from e
+
+@app.post("/mcmc/mh", response_model=MCMCResponse)
+async def run_metropolis_hastings(
+    request: MCMCRequest,
+    http_request: Request,
+    sample_format: SampleFormat = Query(None, alias="format"),
+    accept: Optional[str] = Header(None),
+):
+    """Run standard Metropolis-Hastings MCMC sampler. Seeded requests are cached."""
+    result, cache_status = await cached_run("mh", request, http_request)
+    return sampling_response(
+        result,
+        negotiate_sample_format(sample_format, accept),
+        headers={"X-Cache": cache_status},
+    )
 
 
 @app.post("/mcmc/amh", response_model=AdaptiveMCMCResponse)
-async def run_adaptive_metropolis_hastings(request: AdaptiveMCMCRequest):
-    """Run adaptive Metropolis-Hastings MCMC sampler."""
+async def run_adaptive_metropolis_hastings(
+    request: AdaptiveMCMCRequest,
+    http_request: Request,
+    sample_format: SampleFormat = Query(None, alias="format"),
+    accept: Optional[str] = Header(None),
+):
+    """Run adaptive Metropolis-Hastings MCMC sampler. Seeded requests are cached."""
+    result, cache_status = await cached_run("amh", request, http_request)
+    return sampling_response(
+        result,
+        negotiate_sample_format(sample_format, accept),
+        headers={"X-Cache": cache_status},
+    )
+
+
+@app.post("/mcmc/pt", response_model=TemperingMCMCResponse)
+async def run_parallel_tempering(
+    request: TemperingMCMCRequest,
+    http_request: Request,
+    sample_format: SampleFormat = Query(None, alias="format"),
+    accept: Optional[str] = Header(None),
+):
+    """Run the parallel tempering MCMC sampler. Seeded requests are cached."""
+    result, cache_status = await cached_run("pt", request, http_request)
+    return sampling_response(
+        result,
+        negotiate_sample_format(sample_format, accept),
+        headers={"X-Cache": cache_status},
+    )
+
+
+@app.post("/mcmc/mala", response_model=GradientMCMCResponse)
+async def run_metropolis_adjusted_langevin(
+    request: LangevinMCMCRequest,
+    http_request: Request,
+    sample_format: SampleFormat = Query(None, alias="format"),
+    accept: Optional[str] = Header(None),
+):
+    """Run the Metropolis-adjusted Langevin (MALA) sampler. Seeded requests are cached."""
+    result, cache_status = await cached_run("mala", request, http_request)
+    return sampling_response(
+        result,
+        negotiate_sample_format(sample_format, accept),
+        headers={"X-Cache": cache_status},
+    )
+
+
+@app.post("/mcmc/hmc", response_model=GradientMCMCResponse)
+async def run_hamiltonian_monte_carlo(
+    request: HamiltonianMCMCRequest,
+    http_request: Request,
+    sample_format: SampleFormat = Query(None, alias="format"),
+    accept: Optional[str] = Header(None),
+):
+    """Run the Hamiltonian Monte Carlo sampler. Seeded requests are cached."""
+    result, cache_status = await cached_run("hmc", request, http_request)
+    return sampling_response(
+        result,
+        negotiate_sample_format(sample_format, accept),
+        headers={"X-Cache": cache_status},
+    )
+
+
+@app.post("/mcmc/mh/stream")
+async def stream_metropolis_hastings(
+    request: MCMCRequest,
+    chunk_size: int = Query(10000, ge=1, le=1_000_000),
+    client: str = Depends(client_id),
+):
+    """Run standard Metropolis-Hastings and stream its samples as NDJSON chunks."""
+    return await stream_from_pool("mh", request, chunk_size, client)
+
+
+@app.post("/mcmc/amh/stream")
+async def stream_adaptive_metropolis_hastings(
+    request: AdaptiveMCMCRequest,
+    chunk_size: int = Query(10000, ge=1, le=1_000_000),
+    client: str = Depends(client_id),
+):
+    """Run adaptive Metropolis-Hastings and stream its samples as NDJSON chunks."""
+    return await stream_from_pool("amh", request, chunk_size, client)
+
+
+@app.post("/mcmc/pt/stream")
+async def stream_parallel_tempering(
+    request: TemperingMCMCRequest,
+    chunk_size: int = Query(10000, ge=1, le=1_000_000),
+    client: str = Depends(client_id),
+):
+    """Run parallel tempering and stream its cold replica's samples as NDJSON chunks."""
+    return await stream_from_pool("pt", request, chunk_size, client)
+
+
+@app.post("/mcmc/mala/stream")
+async def stream_metropolis_adjusted_langevin(
+    request: LangevinMCMCRequest,
+    chunk_size: int = Query(10000, ge=1, le=1_000_000),
+    client: str = Depends(client_id),
+):
+    """Run MALA and stream its samples as NDJSON chunks."""
+    return await stream_from_pool("mala", request, chunk_size, client)
+
+
+@app.post("/mcmc/hmc/stream")
+async def stream_hamiltonian_monte_carlo(
+    request: HamiltonianMCMCRequest,
+    chunk_size: int = Query(10000, ge=1, le=1_000_000),
+    client: str = Depends(client_id),
+):
+    """Run Hamiltonian Monte Carlo and stream its samples as NDJSON chunks."""
+    return await stream_from_pool("hmc", request, chunk_size, client)
+
+
+def batch_cost(jobs):
+    """
+    Check every job of a batch against the budgets and return their total run time.
+
+    Jobs whose target does not compile are skipped, as they report their own error.
+
+    Raises:
+        BudgetExceededError: If any job is over a budget
+    """
+    seconds = 0.0
+    for index, (sampler, params) in enumerate(jobs):
+        try:
+            target = compile_target(params["expression"], params["log_density"])
+        except ValueError:
+            continue
+        cost = estimate_cost(sampler, params, target)
+        try:
+            admission_policy.check(cost)
+        except BudgetExceededError as e:
+            raise BudgetExceededError(f"Job {index}: {e}") from e
+        seconds += cost.seconds
+    return seconds
+
+
+@app.post("/mcmc/batch", response_model=BatchResponse)
+async def run_batch_jobs(
+    request: BatchRequest,
+    http_request: Request,
+    stream: bool = Query(False),
+):
+    """
+    Run many MH and AMH jobs in parallel across the sampling workers.
+
+    Each worker compiles a distinct expression at most once, however many jobs share
+    it. A job that fails reports its error in its own result; the batch fails only
+    if the workers are unavailable. Results are returned in job order or, with
+    ``stream=true``, as newline-delimited JSON records in the order jobs finish,
+    each holding its job's ``index``. The batch stops if the client disconnects.
+    Each job may run for the request timeout.
+
+    Every job must be within the budgets, and the batch is admitted as one run
+    costing the jobs' total time.
+    """
+    jobs = [(job.sampler, job.model_dump(exclude={"sampler"})) for job in request.jobs]
+    client = client_id(http_request)
+    cancel_event = sampler_pool.shared_event()
+    with sampling_errors():
+        seconds = await asyncio.to_thread(batch_cost, jobs)
+        client_quotas.acquire(client, seconds)
+    records = run_batch(
+        sampler_pool,
+        jobs,
+        timeout=sampler_pool.timeout,
+        cancel_event=cancel_event,
+        ordered=not stream,
+    )
+
+    if not stream:
+        watcher = asyncio.create_task(cancel_on_disconnect(http_request, cancel_event))
+        try:
+            with sampling_errors():
+                results = await asyncio.to_thread(list, records)
+        finally:
+            watcher.cancel()
+            client_quotas.release(client)
+        with SERIALIZATION_SECONDS.time(format="json"):
+            return JSONResponse({"results": [jsonable_record(r) for r in results]})
+
+    try:
+        with sampling_errors():
+            first = await asyncio.to_thread(next, records)
+    except BaseException:
+        client_quotas.release(client)
+        raise
+
+    async def ndjson():
+        record = first
+        try:
+            while record is not None:
+                with SERIALIZATION_SECONDS.time(format="ndjson"):
+                    line = json.dumps(jsonable_record(record)) + "\n"
+                yield line
+                record = await asyncio.to_thread(next, records, None)
+        finally:
+            # Stops the batch if the client has gone away
+            cancel_event.set()
+            client_quotas.release(client)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+def get_job_or_404(job_id):
+    """Return a job with its latest progress, or raise a 404 error."""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    if job["status"] not in FINISHED_STATUSES and job_progress is not None:
+        progress = job_progress.get(job_id)
+        if progress is not None:
+            status = "running" if job["status"] == "queued" else job["status"]
+            job.update(status=status, progress=progress)
+            job_store.update(job_id, status=status, progress=progress)
+    return job
+
+
+def finish_job(job_id, future):
+    """Store the outcome of a job's task once its future completes."""
+    job_tasks.pop(job_id, None)
+    if job_progress is not None:
+        job_progress.pop(job_id, None)
+    if future.cancelled() or isinstance(future.exception(), TaskCancelledError):
+        job_store.finish(job_id, "cancelled")
+    elif future.exception() is not None:
+        job_store.finish(job_id, "failed", error=str(future.exception()))
+    else:
+        job_store.finish(job_id, "succeeded", result=future.result())
+
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(request: JobRequest, client: str = Depends(client_id)):
+    """
+    Submit a sampling job and return its id without waiting for it to run.
+
+    The job is admitted like a synchronous run (see ``admit``), but without the
+    request timeout as a run time budget, and counts against the client's quota
+    until it finishes.
+    """
+    global job_progress  # pylint: disable=global-statement
+    if job_progress is None:
+        job_progress = sampler_pool.shared_dict()
+
+    params = request.model_dump(exclude={"sampler"})
     try:
-        target_dist = target_distribution(request.expression)
-
-        samples, elapsed_time, acceptance_rate, acceptance_rates, mean, median, ci = (
-            adaptive_metropolis_hastings(
-                target_dist,
-                request.initial,
-                request.iterations,
-                initial_variance=request.initial_variance,
-                check_interval=request.check_interval,
-                increase_factor=request.increase_factor,
-                decrease_factor=request.decrease_factor,
-                burn_in=request.burn_in,
-                thin=request.thin,
-                seed=request.seed,
-                credible_interval=request.credible_interval,
+        target = await compiled_target(params)
+    except HTTPException as e:
+        if e.status_code != 400:
+            raise
+        # The job fails with the expression's error when it runs
+        target = None
+    cancel_event = sampler_pool.shared_event()
+    admit(request.sampler, params, target, client, job_admission_policy)
+    job = None
+    try:
+        job = job_store.create(request.sampler, params)
+        progress = SharedProgress(job_progress, job["job_id"])
+        with sampling_errors():
+            future = sampler_pool.submit(
+                run_sampler,
+                request.sampler,
+                params,
+                progress,
+                cancel_event=cancel_event,
             )
+    except BaseException:
+        # E.g. the queue is full (429) or the pool is shutting down (503)
+        if job is not None:
+            job_store.delete(job["job_id"])
+        client_quotas.release(client)
+        raise
+
+    def job_done(future):
+        client_quotas.release(client)
+        finish_job(job["job_id"], future)
+
+    job_tasks[job["job_id"]] = (future, cancel_event)
+    future.add_done_callback(job_done)
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Report the status and progress of a job."""
+    return get_job_or_404(job_id)
+
+
+@app.get(
+    "/jobs/{job_id}/result",
+    response_model=Union[AdaptiveMCMCResponse, MCMCResponse],
+)
+async def get_job_result(
+    job_id: str,
+    sample_format: SampleFormat = Query(None, alias="format"),
+    accept: Optional[str] = Header(None),
+):
+    """Return the result of a finished job."""
+    job = get_job_or_404(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=400, detail=job["error"])
+    if job["status"] != "succeeded":
+        raise HTTPException(
+            status_code=409, detail=f"Job is {job['status']}, no result available"
         )
+    result = job_store.get_result(job_id)
+    return sampling_response(result, negotiate_sample_format(sample_format, accept))
 
-        return {
-            "samples": samples.tolist(),
-            "elapsed_time": elapsed_time,
-            "acceptance_rate": acceptance_rate,
-            "acceptance_rates": acceptance_rates,
-            "mean": mean,
-            "median": median,
-            "credible_interval": ci,
-        }
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) from e
+@app.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job, or delete a finished one.
+
+    A queued job is cancelled at once. A running job is asked to stop and reported
+    as 'cancelling' until its sampler has stopped and freed the worker.
+    """
+    job = get_job_or_404(job_id)
+    if job["status"] in FINISHED_STATUSES:
+        job_store.delete(job_id)
+        return job
+
+    future, cancel_event = job_tasks.get(job_id, (None, None))
+    if future is not None and not future.cancel():
+        cancel_event.set()
+        job_store.update(job_id, status="cancelling")
+    else:
+        # Cancelled before it started, or submitted by a previous server process
+        job_store.finish(job_id, "cancelled")
+    return get_job_or_404(job_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import click
+import httpx
+import numpy as np
+import api
+from library.diagnostics import chain_diagnostics
+from library.mcmc_utils import (
+    target_distribution,
+    proposal_distribution,
+    clear_target_cache,
+)
+from library.mcmc_algorithms import (
+    metropolis_hastings,
+    adaptive_metropolis_hastings,
+    metropolis_adjusted_langevin,
+    hamiltonian_monte_carlo,
+)
+
+# Fixed catalogue of targets: name -> (expression, log_density)
+TARGETS = {
+    "normal": ("exp(-0.5 * x**2) / sqrt(2 * pi)", False),
+    "heavy_tailed": ("1 / (pi * (1 + x**2))", False),
+    "multimodal": ("exp(-0.5 * (x - 3)**2) + exp(-0.5 * (x + 3)**2)", False),
+    "narrow": ("-1000 * x**2", True),
+}
+
+# Samplers run on every target
+SAMPLERS = ("mh", "amh", "mala", "hmc")
+
+# Sample formats timed end to end through the API
+API_FORMATS = ("json", "base64", "f8", "summary")
+
+# Whether a larger value of each metric is better, for comparisons
+METRICS = {
+    "iterations_per_second": True,
+    "ess_per_second": True,
+    "peak_memory_mb": False,
+    "compile_ms": False,
+    "latency_ms": False,
+}
+
+BURN_IN = 1000
+SEED = 42
+
+
+def benchmark_compile(expression, log_density, repeat):
+    """Best time to compile a target with an empty cache, and to look it up cached."""
+    compile_times = []
+    for _ in range(repeat):
+        clear_target_cache()
+        start = time.perf_counter()
+        target_distribution(expression, log_density=log_density)
+        compile_times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    target_distribution(expression, log_density=log_density)
+    lookup_time = time.perf_counter() - start
+    return {
+        "compile_ms": 1e3 * min(compile_times),
+        "cached_lookup_us": 1e6 * lookup_time,
+    }
+
+
+def benchmark_sampler(sampler, target, iterations, repeat):
+    """Throughput, sampling efficiency and peak memory of one sampler on one target."""
+
+    def sample():
+        if sampler == "mh":
+            return metropolis_hastings(
+                target,
+                proposal_distribution,
+                0.0,
+                iterations,
+                burn_in=BURN_IN,
+                seed=SEED,
+            )
+        if sampler == "amh":
+            return adaptive_metropolis_hastings(
+                target, 0.0, iterations, burn_in=BURN_IN, seed=SEED
+            )
+        if sampler == "mala":
+            return metropolis_adjusted_langevin(
+                target, 0.0, iterations, burn_in=BURN_IN, seed=SEED
+            )
+        return hamiltonian_monte_carlo(
+            target, 0.0, iterations, burn_in=BURN_IN, seed=SEED
+        )
+
+    elapsed_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = sample()
+        elapsed_times.append(time.perf_counter() - start)
+    elapsed_time = min(elapsed_times)
+    diagnostics = chain_diagnostics(result[0], elapsed_time)
+
+    # A separate run, since tracing allocations slows sampling down
+    tracemalloc.start()
+    try:
+        sample()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations_per_second": (iterations + BURN_IN) / elapsed_time,
+        "ess": diagnostics["ess"],
+        "ess_per_second": diagnostics["ess_per_second"],
+        "acceptance_rate": float(result[2]),
+        "peak_memory_mb": peak / 2**20,
+    }
+
+
+async def benchmark_api(iterations, repeat):
+    """Median end-to-end latency and response size of the sampling endpoints per format."""
+    results = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.lifespan(api.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            params = {"iterations": iterations, "burn_in": BURN_IN, "seed": SEED}
+            # Warm up the worker processes and their target caches
+            await client.post("/mcmc/mh", json=params)
+
+            for sampler in ("mh", "amh"):
+                for sample_format in API_FORMATS:
+                    body, url = dict(params), f"/mcmc/{sampler}"
+                    if sample_format == "summary":
+                        body["return_samples"] = False
+                    else:
+                        url += f"?format={sample_format}"
+
+                    latencies = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        response = await client.post(url, json=body)
+                        latencies.append(time.perf_counter() - start)
+                        response.raise_for_status()
+                    results[f"api/{sampler}/{sample_format}"] = {
+                        "latency_ms": 1e3 * statistics.median(latencies),
+                        "response_bytes": len(response.content),
+                    }
+    return results
+
+
+def run_benchmarks(
+    iterations=200000, repeat=3, api_iterations=100000, include_api=True
+):
+    """
+    Run the benchmark catalogue.
+
+    Args:
+        iterations (int, optional): Iterations per sampler run. Defaults to 200000
+        repeat (int, optional): Runs per measurement; the best (or, for the API, the
+            median) time is kept. Defaults to 3
+        api_iterations (int, optional): Iterations per API request. Defaults to 100000
+        include_api (bool, optional): Whether to time the API endpoints. Defaults to True
+
+    Returns:
+        dict: 'metadata' about the run and 'results', mapping benchmark names such as
+            'mh/normal' to dictionaries of metrics
+    """
+    results = {}
+    for name, (expression, log_density) in TARGETS.items():
+        results[f"compile/{name}"] = benchmark_compile(expression, log_density, repeat)
+        target = target_distribution(expression, log_density=log_density)
+        for sampler in SAMPLERS:
+            results[f"{sampler}/{name}"] = benchmark_sampler(
+                sampler, target, iterations, repeat
+            )
+    if include_api:
+        results.update(asyncio.run(benchmark_api(api_iterations, repeat)))
+
+    return {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "iterations": iterations,
+            "api_iterations": api_iterations,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.2):
+    """
+    Find metrics that got worse than a baseline by more than a relative threshold.
+
+    Args:
+        baseline (dict): Benchmark results as returned by ``run_benchmarks``
+        current (dict): Benchmark results to check
+        threshold (float, optional): Tolerated relative change. Defaults to 0.2 (20%)
+
+    Returns:
+        list[dict]: One entry per regression with the benchmark 'name', 'metric',
+            'baseline' and 'current' values and the relative 'change'
+    """
+    regressions = []
+    for name, metrics in current["results"].items():
+        baseline_metrics = baseline["results"].get(name, {})
+        for metric, higher_is_better in METRICS.items():
+            old, new = baseline_metrics.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(
+                    {
+                        "name": name,
+                        "metric": metric,
+                        "baseline": old,
+                        "current": new,
+                        "change": change,
+                    }
+                )
+    return regressions
+
+
+def report_regressions(regressions, threshold):
+    """Print regressions and return the exit code (1 if there are any)."""
+    if not regressions:
+        click.echo(f"No regressions beyond {threshold:.0%}.")
+        return 0
+    click.echo(f"{len(regressions)} regression(s) beyond {threshold:.0%}:")
+    for regression in regressions:
+        click.echo(
+            f"  {regression['name']} {regression['metric']}: "
+            f"{regression['baseline']:.4g} -> {regression['current']:.4g} "
+            f"({regression['change']:+.1%})"
+        )
+    return 1
+
+
+@click.group()
+def bench():
+    """Benchmarks for the samplers, target compilation and API serialisation."""
+
+
+@bench.command()
+@click.option(
+    "--iterations", "-n", default=200000, type=int, help="Iterations per sampler run."
+)
+@click.option(
+    "--repeat", "-r", default=3, type=int, help="Runs per measurement (best is kept)."
+)
+@click.option(
+    "--api-iterations", default=100000, type=int, help="Iterations per API request."
+)
+@click.option(
+    "--api/--no-api",
+    "include_api",
+    default=True,
+    help="Whether to time the API endpoints.",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=os.path.join("output", "benchmarks", "latest.json"),
+    help="JSON file to write the results to.",
+)
+@click.option(
+    "--baseline",
+    default=None,
+    help="Results file to compare against. Missing files are skipped.",
+)
+@click.option(
+    "--threshold", default=0.2, type=float, help="Tolerated relative slowdown."
+)
+def run(iterations, repeat, api_iterations, include_api, output, baseline, threshold):
+    """Run the benchmark catalogue and write the results to a JSON file."""
+    current = run_benchmarks(iterations, repeat, api_iterations, include_api)
+    for name, metrics in current["results"].items():
+        formatted = ", ".join(f"{key}={value:.4g}" for key, value in metrics.items())
+        click.echo(f"{name}: {formatted}")
+
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(current, file, indent=2)
+    click.echo(f"Results saved to {output}")
+
+    if baseline is not None and os.path.exists(baseline):
+        with open(baseline, encoding="utf-8") as file:
+            regressions = compare_results(json.load(file), current, threshold)
+        sys.exit(report_regressions(regressions, threshold))
+
+
+@bench.command()
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--threshold", default=0.2, type=float, help="Tolerated relative slowdown."
+)
+def compare(baseline, current, threshold):
+    """Compare two results files and fail on regressions."""
+    with open(baseline, encoding="utf-8") as file:
+        baseline_results = json.load(file)
+    with open(current, encoding="utf-8") as file:
+        current_results = json.load(file)
+    sys.exit(
+        report_regressions(
+            compare_results(baseline_results, current_results, threshold), threshold
+        )
+    )
+
+
+if __name__ == "__main__":
+    bench()
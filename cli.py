@@ -1,13 +1,43 @@
-import matplotlib
-
-matplotlib.use("Agg")  # Use non-interactive backend
+import contextlib
+import json
 import os
+import signal
 import time
 import click
-import numpy as np
-import matplotlib.pyplot as plt
+from library.batch import run_batch, jsonable_record
 from library.mcmc_utils import target_distribution, proposal_distribution
-from library.mcmc_algorithms import metropolis_hastings, adaptive_metropolis_hastings
+from library.mcmc_algorithms import (
+    metropolis_hastings,
+    adaptive_metropolis_hastings,
+    parallel_tempering,
+    temperature_ladder,
+    metropolis_adjusted_langevin,
+    hamiltonian_monte_carlo,
+)
+from library.cancellation import CancellationToken
+from library.checkpoint import Checkpoint
+from library.diagnostics import chain_diagnostics
+from library.metrics import REGISTRY
+from library.profiling import PROFILE_REPORTS, RunProfiler, format_profile
+from library.plot_data import binned_histogram, density_curve, downsample_trace
+from library.progress import TqdmProgress
+from library.sample_store import (
+    SAMPLE_FORMATS,
+    open_sample_file,
+    sample_count,
+    save_samples,
+)
+
+# Runs keeping more samples than this write them to a memory-mapped file
+IN_MEMORY_SAMPLES = 2**25
+
+# Diagnostics of longer runs use this many of the last samples, bounding the FFT's memory
+DIAGNOSTIC_SAMPLES = 2**24
+
+# Help text of --burn-in for the samplers that adapt their step size during burn-in
+BURN_IN_ADAPTATION_HELP = (
+    "Number of initial samples to discard, during which the step size adapts."
+)
 
 
 def validate_credible_interval(_ctx, _param, value):
@@ -33,90 +63,581 @@ def validate_credible_interval(_ctx, _param, value):
         raise click.BadParameter("Credible interval must be a valid number") from exc
 
 
-@click.group()
-def cli():
-    """MCMC sampling command line interface."""
+def parse_temperatures(_ctx, _param, value):
+    """
+    Parse a comma-separated temperature ladder, such as '1,2,4,8'.
 
+    Returns:
+        list[float]: The temperatures, or None if not given
 
-@cli.command()
+    Raises:
+        click.BadParameter: If a temperature is not a number
+    """
+    if value is None:
+        return None
+    try:
+        return [float(temperature) for temperature in value.split(",")]
+    except ValueError as exc:
+        raise click.BadParameter(
+            "Temperatures must be comma-separated numbers"
+        ) from exc
+
+
+@click.group()
 @click.option(
-    "--expression",
-    "-e",
+    "--metrics-file",
     default=None,
-    help="Mathematical expression for target distribution. Default is standard normal.",
-)
-@click.option(
-    "--initial", "-i", default=0.0, type=float, help="Initial value to start the chain."
+    type=click.Path(dir_okay=False),
+    help="When the command finishes, write its sampler and compile metrics to this "
+    "file in the Prometheus text format, e.g. for node_exporter's textfile collector.",
 )
+@click.pass_context
+def cli(ctx, metrics_file):
+    """MCMC sampling command line interface."""
+    if metrics_file is not None:
+        ctx.call_on_close(lambda: write_metrics(metrics_file, ctx.meta))
+
+
+def write_metrics(path, meta):
+    """
+    Write the metrics registry to a file, replacing it atomically.
+
+    Args:
+        path (str): File to write
+        meta (dict): The click context's meta, where the batch command leaves its
+            workers' metrics under 'worker_metrics'
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(REGISTRY.render(meta.get("worker_metrics", [])))
+    os.replace(temporary_path, path)
+
+
+def target_options(command):
+    """Add the target distribution and chain length options to a sampler command."""
+    for option in reversed(
+        [
+            click.option(
+                "--expression",
+                "-e",
+                default=None,
+                help="Mathematical expression for target distribution. "
+                "Default is standard normal.",
+            ),
+            click.option(
+                "--log-density",
+                is_flag=True,
+                default=False,
+                help="Interpret the expression as a log-density.",
+            ),
+            click.option(
+                "--initial",
+                "-i",
+                default=0.0,
+                type=float,
+                help="Initial value to start the chain.",
+            ),
+            click.option(
+                "--iterations",
+                "-n",
+                default=10000,
+                type=int,
+                help="Number of iterations to run.",
+            ),
+        ]
+    ):
+        command = option(command)
+    return command
+
+
+def run_options(burn_in_help="Number of initial samples to discard."):
+    """
+    Decorator adding the burn-in, thinning, seed, statistics and output options to a
+    sampler command.
+
+    Args:
+        burn_in_help (str, optional): Help text of --burn-in, for samplers that adapt
+            during burn-in
+    """
+
+    def decorator(command):
+        for option in reversed(
+            [
+                click.option(
+                    "--burn-in", "-b", default=1000, type=int, help=burn_in_help
+                ),
+                click.option(
+                    "--thin", "-t", default=1, type=int, help="Keep every nth sample."
+                ),
+                click.option(
+                    "--seed",
+                    "-s",
+                    default=None,
+                    type=int,
+                    help="Random seed for reproducibility.",
+                ),
+                click.option(
+                    "--plot/--no-plot", default=True, help="Whether to display plots."
+                ),
+                click.option(
+                    "--save/--no-save",
+                    default=False,
+                    help="Whether to save the samples to a file.",
+                ),
+                click.option(
+                    "--output",
+                    "-o",
+                    default=None,
+                    help="Output file name for saving samples. "
+                    "Defaults to samples.<format>.",
+                ),
+                click.option(
+                    "--format",
+                    "sample_format",
+                    default="txt",
+                    type=click.Choice(SAMPLE_FORMATS),
+                    help="File format of saved samples: NumPy .npy, raw little-endian "
+                    "float64 or text.",
+                ),
+                click.option(
+                    "--credible-interval",
+                    default=0.95,
+                    type=float,
+                    help="Credible interval level (0 to 1).",
+                    callback=validate_credible_interval,
+                ),
+                click.option(
+                    "--summary-only",
+                    is_flag=True,
+                    default=False,
+                    help="Report only the summary statistics, without keeping the "
+                    "samples. Memory use stays constant however many iterations are "
+                    "run.",
+                ),
+            ]
+        ):
+            command = option(command)
+        return command
+
+    return decorator
+
+
+def checkpoint_options(command):
+    """Add the checkpoint and resume options to a sampler command."""
+    command = click.option(
+        "--resume",
+        is_flag=True,
+        default=False,
+        help="Continue the run saved in --checkpoint with its saved parameters.",
+    )(command)
+    command = click.option(
+        "--checkpoint-interval",
+        default=5.0,
+        type=float,
+        help="Seconds between checkpoint saves.",
+    )(command)
+    return click.option(
+        "--checkpoint",
+        "checkpoint_path",
+        default=None,
+        help="Save the chain's state to this file periodically, to be resumed with --resume.",
+    )(command)
+
+
+def profile_options(command):
+    """Add the profiling options to a sampler command."""
+    command = click.option(
+        "--profile-report",
+        default=None,
+        type=click.Choice(PROFILE_REPORTS),
+        help="Also profile the run with cProfile, or trace its peak memory and "
+        "largest allocations with tracemalloc. Implies --profile. Slows the run down.",
+    )(command)
+    return click.option(
+        "--profile",
+        is_flag=True,
+        default=False,
+        help="Report the time spent in each phase of the run, the time per iteration "
+        "and the number of target evaluations.",
+    )(command)
+
+
+def report_profile(profiler, iterations):
+    """Print a profiled run's breakdown, if profiling was enabled."""
+    if profiler.enabled:
+        click.echo("\n".join(format_profile(profiler.result(iterations))))
+
+
+@contextlib.contextmanager
+def interruptible():
+    """
+    Let Ctrl-C stop a run early, keeping its samples so far.
+
+    The first Ctrl-C cancels the yielded token, so the sampler it is passed to stops
+    within one block of iterations, and the results so far are reported and saved
+    as usual. A second Ctrl-C aborts at once.
+
+    Yields:
+        CancellationToken: The token to pass to the sampler
+    """
+    cancel = CancellationToken()
+
+    def stop(_signum, _frame):
+        if cancel.cancelled:
+            raise KeyboardInterrupt
+        cancel.cancel()
+        click.echo("\nStopping the run... Press Ctrl-C again to abort.", err=True)
+
+    try:
+        previous = signal.signal(signal.SIGINT, stop)
+    except ValueError:
+        # Signal handlers can only be set in the main thread
+        yield cancel
+        return
+    try:
+        yield cancel
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def report_interruption(cancel, total_iterations, checkpoint=None):
+    """Print how far a run stopped early by Ctrl-C got, and how to resume it."""
+    if cancel.stopped_at is None:
+        return
+    click.echo(
+        f"Interrupted after {cancel.stopped_at} of {total_iterations} iterations; "
+        "results are for the samples so far."
+    )
+    if checkpoint is not None:
+        click.echo(f"Continue the run with --resume --checkpoint {checkpoint.path}")
+
+
+def sample_path(output, sample_format):
+    """Path of the samples file under output/samples, creating the directory."""
+    samples_dir = os.path.join("output", "samples")
+    os.makedirs(samples_dir, exist_ok=True)
+    return os.path.join(samples_dir, output or f"samples.{sample_format}")
+
+
+@contextlib.contextmanager
+def sample_storage(n_samples, save, output, sample_format):
+    """
+    Preallocate the memory-mapped file a run writes its samples into, if any.
+
+    Samples saved in a binary format are written straight to their output file as
+    the chain runs. Samples of runs longer than IN_MEMORY_SAMPLES that are not saved
+    in a binary format go to a scratch file next to it, deleted afterwards. Either
+    way, the samples need not fit in memory. ``n_samples`` is 0 for summary-only
+    runs, which keep no samples.
+
+    Yields:
+        numpy.memmap: The array to pass as the sampler's ``out``, or None to keep
+            the samples in memory
+    """
+    if n_samples == 0:
+        yield None
+        return
+    if save and sample_format != "txt":
+        yield open_sample_file(
+            sample_path(output, sample_format), n_samples, sample_format
+        )
+        return
+    if n_samples <= IN_MEMORY_SAMPLES:
+        yield None
+        return
+
+    scratch_path = f"{sample_path(output, sample_format)}.scratch.npy"
+    try:
+        yield open_sample_file(scratch_path, n_samples)
+    finally:
+        try:
+            os.remove(scratch_path)
+        except OSError:
+            # E.g. on Windows, where a file cannot be deleted while it is mapped
+            click.echo(f"Could not delete scratch file {scratch_path}", err=True)
+
+
+def prepare_checkpoint(checkpoint_path, checkpoint_interval, resume, params):
+    """
+    Create a run's checkpoint, and take the saved run's parameters when resuming.
+
+    Args:
+        checkpoint_path (str): Checkpoint file path, or None for no checkpoint
+        checkpoint_interval (float): Seconds between saves
+        resume (bool): Whether to resume the run saved at checkpoint_path
+        params (dict): The sampler parameters given on the command line
+
+    Returns:
+        tuple: The Checkpoint (or None) and the parameters to run with
+
+    Raises:
+        click.UsageError: If resume is set without an existing checkpoint
+    """
+    if checkpoint_path is None:
+        if resume:
+            raise click.UsageError("--resume requires --checkpoint")
+        return None, params
+
+    checkpoint = Checkpoint(checkpoint_path, interval=checkpoint_interval)
+    if resume:
+        if not checkpoint.exists():
+            raise click.UsageError(f"No checkpoint found at {checkpoint_path}")
+        params = checkpoint.read_metadata()
+        click.echo(f"Resuming from checkpoint {checkpoint_path}")
+    checkpoint.metadata = params
+    return checkpoint, params
+
+
+@cli.command()
+@target_options
+@run_options()
+@checkpoint_options
+@profile_options
+def mh(
+    expression,
+    log_density,
+    initial,
+    iterations,
+    burn_in,
+    thin,
+    seed,
+    plot,
+    save,
+    output,
+    sample_format,
+    credible_interval,
+    summary_only,
+    checkpoint_path,
+    checkpoint_interval,
+    resume,
+    profile,
+    profile_report,
+):
+    """Run standard Metropolis-Hastings MCMC sampler."""
+    try:
+        profiler = RunProfiler(profile, profile_report)
+        with profiler:
+            checkpoint, params = prepare_checkpoint(
+                checkpoint_path,
+                checkpoint_interval,
+                resume,
+                {
+                    "sampler": "mh",
+                    "expression": expression,
+                    "log_density": log_density,
+                    "initial": initial,
+                    "iterations": iterations,
+                    "burn_in": burn_in,
+                    "thin": thin,
+                    "seed": seed,
+                },
+            )
+            with profiler.phase("compile"):
+                target_dist = target_distribution(
+                    params["expression"], log_density=params["log_density"]
+                )
+
+            n_samples = (
+                0
+                if summary_only
+                else sample_count(params["iterations"], params["thin"])
+            )
+            with sample_storage(n_samples, save, output, sample_format) as out:
+                click.echo("Running Metropolis-Hastings sampler...")
+                with profiler.phase("sampling"), interruptible() as cancel:
+                    samples, elapsed_time, acceptance_rate, mean, median, ci = (
+                        metropolis_hastings(
+                            profiler.count_evaluations(target_dist),
+                            proposal_distribution,
+                            params["initial"],
+                            params["iterations"],
+                            burn_in=params["burn_in"],
+                            thin=params["thin"],
+                            seed=params["seed"],
+                            credible_interval=credible_interval,
+                            progress=TqdmProgress(),
+                            cancel=cancel,
+                            return_samples=not summary_only,
+                            checkpoint=checkpoint,
+                            resume=resume,
+                            out=out,
+                        )
+                    )
+                profiler.split("sampling", "statistics", elapsed_time)
+                report_interruption(
+                    cancel, params["iterations"] + params["burn_in"], checkpoint
+                )
+
+                with profiler.phase("results"):
+                    process_results(
+                        samples,
+                        elapsed_time,
+                        acceptance_rate,
+                        target_dist,
+                        plot,
+                        save,
+                        output,
+                        mean=mean,
+                        median=median,
+                        credible_interval=ci,
+                        ci_level=credible_interval,
+                        sample_format=sample_format,
+                        truncated=cancel.stopped_at is not None,
+                    )
+        report_profile(
+            profiler, cancel.stopped_at or params["iterations"] + params["burn_in"]
+        )
+        # An interrupted run keeps its checkpoint, to be resumed
+        if checkpoint is not None and cancel.stopped_at is None:
+            checkpoint.remove()
+        return 0
+
+    except (ValueError, TypeError, SyntaxError) as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        return 1
+    except (RuntimeError, OverflowError, ZeroDivisionError) as e:
+        click.echo(f"Error: Computation failed - {str(e)}", err=True)
+        return 1
+    except MemoryError as e:
+        click.echo("Error: Not enough memory to complete operation", err=True)
+        return 1
+
+
+@cli.command()
+@target_options
 @click.option(
-    "--iterations", "-n", default=10000, type=int, help="Number of iterations to run."
+    "--initial-variance", default=1.0, type=float, help="Initial proposal variance."
 )
 @click.option(
-    "--burn-in",
-    "-b",
-    default=1000,
+    "--check-interval",
+    default=200,
     type=int,
-    help="Number of initial samples to discard.",
-)
-@click.option("--thin", "-t", default=1, type=int, help="Keep every nth sample.")
-@click.option(
-    "--seed", "-s", default=None, type=int, help="Random seed for reproducibility."
-)
-@click.option("--plot/--no-plot", default=True, help="Whether to display plots.")
-@click.option(
-    "--save/--no-save", default=False, help="Whether to save the samples to a file."
+    help="Interval for checking acceptance rate.",
 )
 @click.option(
-    "--output", "-o", default="samples.txt", help="Output file name for saving samples."
+    "--increase-factor", default=1.1, type=float, help="Factor to increase variance."
 )
 @click.option(
-    "--credible-interval",
-    default=0.95,
-    type=float,
-    help="Credible interval level (0 to 1).",
-    callback=validate_credible_interval,
+    "--decrease-factor", default=0.9, type=float, help="Factor to decrease variance."
 )
-def mh(
+@run_options()
+@checkpoint_options
+@profile_options
+def amh(
     expression,
+    log_density,
     initial,
     iterations,
+    initial_variance,
+    check_interval,
+    increase_factor,
+    decrease_factor,
     burn_in,
     thin,
     seed,
     plot,
     save,
     output,
+    sample_format,
     credible_interval,
+    summary_only,
+    checkpoint_path,
+    checkpoint_interval,
+    resume,
+    profile,
+    profile_report,
 ):
-    """Run standard Metropolis-Hastings MCMC sampler."""
+    """Run adaptive Metropolis-Hastings MCMC sampler."""
     try:
-        target_dist = target_distribution(expression)
-
-        click.echo("Running Metropolis-Hastings sampler...")
-        samples, elapsed_time, acceptance_rate, mean, median, ci = metropolis_hastings(
-            target_dist,
-            proposal_distribution,
-            initial,
-            iterations,
-            burn_in=burn_in,
-            thin=thin,
-            seed=seed,
-            credible_interval=credible_interval,
-        )
+        profiler = RunProfiler(profile, profile_report)
+        with profiler:
+            checkpoint, params = prepare_checkpoint(
+                checkpoint_path,
+                checkpoint_interval,
+                resume,
+                {
+                    "sampler": "amh",
+                    "expression": expression,
+                    "log_density": log_density,
+                    "initial": initial,
+                    "iterations": iterations,
+                    "initial_variance": initial_variance,
+                    "check_interval": check_interval,
+                    "increase_factor": increase_factor,
+                    "decrease_factor": decrease_factor,
+                    "burn_in": burn_in,
+                    "thin": thin,
+                    "seed": seed,
+                },
+            )
+            with profiler.phase("compile"):
+                target_dist = target_distribution(
+                    params["expression"], log_density=params["log_density"]
+                )
+
+            n_samples = (
+                0
+                if summary_only
+                else sample_count(params["iterations"], params["thin"])
+            )
+            with sample_storage(n_samples, save, output, sample_format) as out:
+                click.echo("Running Adaptive Metropolis-Hastings sampler...")
+                with profiler.phase("sampling"), interruptible() as cancel:
+                    (
+                        samples,
+                        elapsed_time,
+                        acceptance_rate,
+                        acceptance_rates,
+                        mean,
+                        median,
+                        ci,
+                    ) = adaptive_metropolis_hastings(
+                        profiler.count_evaluations(target_dist),
+                        params["initial"],
+                        params["iterations"],
+                        initial_variance=params["initial_variance"],
+                        check_interval=params["check_interval"],
+                        increase_factor=params["increase_factor"],
+                        decrease_factor=params["decrease_factor"],
+                        burn_in=params["burn_in"],
+                        thin=params["thin"],
+                        seed=params["seed"],
+                        credible_interval=credible_interval,
+                        progress=TqdmProgress(),
+                        cancel=cancel,
+                        return_samples=not summary_only,
+                        checkpoint=checkpoint,
+                        resume=resume,
+                        out=out,
+                    )
+                profiler.split("sampling", "statistics", elapsed_time)
+                report_interruption(
+                    cancel, params["iterations"] + params["burn_in"], checkpoint
+                )
 
-        process_results(
-            samples,
-            elapsed_time,
-            acceptance_rate,
-            target_dist,
-            plot,
-            save,
-            output,
-            mean=mean,
-            median=median,
-            credible_interval=ci,
-            ci_level=credible_interval,
+                with profiler.phase("results"):
+                    process_results(
+                        samples,
+                        elapsed_time,
+                        acceptance_rate,
+                        target_dist,
+                        plot,
+                        save,
+                        output,
+                        acceptance_rates=acceptance_rates,
+                        mean=mean,
+                        median=median,
+                        credible_interval=ci,
+                        ci_level=credible_interval,
+                        sample_format=sample_format,
+                        truncated=cancel.stopped_at is not None,
+                    )
+        report_profile(
+            profiler, cancel.stopped_at or params["iterations"] + params["burn_in"]
         )
+        # An interrupted run keeps its checkpoint, to be resumed
+        if checkpoint is not None and cancel.stopped_at is None:
+            checkpoint.remove()
         return 0
 
     except (ValueError, TypeError, SyntaxError) as e:
@@ -131,109 +652,278 @@ def mh(
 
 
 @cli.command()
+@target_options
 @click.option(
-    "--expression",
-    "-e",
+    "--temperatures",
     default=None,
-    help="Mathematical expression for target distribution. Default is standard normal.",
+    callback=parse_temperatures,
+    help="Comma-separated, increasing temperatures starting at 1, e.g. 1,2,4,8. "
+    "Defaults to a geometric ladder.",
 )
 @click.option(
-    "--initial", "-i", default=0.0, type=float, help="Initial value to start the chain."
+    "--n-temperatures",
+    default=8,
+    type=int,
+    help="Number of temperatures of the default ladder.",
 )
 @click.option(
-    "--iterations", "-n", default=10000, type=int, help="Number of iterations to run."
+    "--max-temperature",
+    default=100.0,
+    type=float,
+    help="Hottest temperature of the default ladder.",
 )
 @click.option(
-    "--initial-variance", default=1.0, type=float, help="Initial proposal variance."
+    "--proposal-scale",
+    default=1.0,
+    type=float,
+    help="Proposal standard deviation at temperature 1, scaled by sqrt(T) above it.",
 )
 @click.option(
-    "--check-interval",
-    default=200,
+    "--swap-interval",
+    default=1,
     type=int,
-    help="Interval for checking acceptance rate.",
-)
-@click.option(
-    "--increase-factor", default=1.1, type=float, help="Factor to increase variance."
-)
-@click.option(
-    "--decrease-factor", default=0.9, type=float, help="Factor to decrease variance."
+    help="Iterations between swaps of adjacent replicas.",
 )
+@run_options()
+@profile_options
+def pt(
+    expression,
+    log_density,
+    initial,
+    iterations,
+    temperatures,
+    n_temperatures,
+    max_temperature,
+    proposal_scale,
+    swap_interval,
+    burn_in,
+    thin,
+    seed,
+    plot,
+    save,
+    output,
+    sample_format,
+    credible_interval,
+    summary_only,
+    profile,
+    profile_report,
+):
+    """Run parallel tempering MCMC sampler for multimodal targets."""
+    try:
+        profiler = RunProfiler(profile, profile_report)
+        with profiler:
+            with profiler.phase("compile"):
+                target_dist = target_distribution(expression, log_density=log_density)
+            temperatures = temperature_ladder(
+                n_temperatures, max_temperature, temperatures
+            )
+
+            n_samples = 0 if summary_only else sample_count(iterations, thin)
+            with sample_storage(n_samples, save, output, sample_format) as out:
+                click.echo(
+                    f"Running parallel tempering sampler with {len(temperatures)} temperatures..."
+                )
+                with profiler.phase("sampling"), interruptible() as cancel:
+                    (
+                        samples,
+                        elapsed_time,
+                        acceptance_rate,
+                        swap_rates,
+                        mean,
+                        median,
+                        ci,
+                    ) = parallel_tempering(
+                        profiler.count_evaluations(target_dist),
+                        initial,
+                        iterations,
+                        temperatures=temperatures,
+                        proposal_scale=proposal_scale,
+                        swap_interval=swap_interval,
+                        burn_in=burn_in,
+                        thin=thin,
+                        seed=seed,
+                        credible_interval=credible_interval,
+                        progress=TqdmProgress(),
+                        cancel=cancel,
+                        return_samples=not summary_only,
+                        out=out,
+                    )
+                profiler.split("sampling", "statistics", elapsed_time)
+                report_interruption(cancel, iterations + burn_in)
+
+                with profiler.phase("results"):
+                    for colder, hotter, swap_rate in zip(
+                        temperatures, temperatures[1:], swap_rates
+                    ):
+                        click.echo(
+                            f"Swap rate T={colder:.2f} <-> T={hotter:.2f}: {swap_rate:.2f}"
+                        )
+                    process_results(
+                        samples,
+                        elapsed_time,
+                        acceptance_rate,
+                        target_dist,
+                        plot,
+                        save,
+                        output,
+                        swap_rates=swap_rates,
+                        mean=mean,
+                        median=median,
+                        credible_interval=ci,
+                        ci_level=credible_interval,
+                        sample_format=sample_format,
+                        truncated=cancel.stopped_at is not None,
+                    )
+        report_profile(profiler, cancel.stopped_at or iterations + burn_in)
+        return 0
+
+    except (ValueError, TypeError, SyntaxError) as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        return 1
+    except (RuntimeError, OverflowError, ZeroDivisionError) as e:
+        click.echo(f"Error: Computation failed - {str(e)}", err=True)
+        return 1
+    except MemoryError as e:
+        click.echo("Error: Not enough memory to complete operation", err=True)
+        return 1
+
+
+@cli.command()
+@target_options
 @click.option(
-    "--burn-in",
-    "-b",
-    default=1000,
-    type=int,
-    help="Number of initial samples to discard.",
+    "--step-size",
+    default=1.0,
+    type=float,
+    help="Initial step size, adapted during burn-in.",
 )
-@click.option("--thin", "-t", default=1, type=int, help="Keep every nth sample.")
 @click.option(
-    "--seed", "-s", default=None, type=int, help="Random seed for reproducibility."
+    "--target-acceptance",
+    default=0.574,
+    type=float,
+    help="Acceptance rate the step size is adapted towards.",
 )
-@click.option("--plot/--no-plot", default=True, help="Whether to display plots.")
+@run_options(BURN_IN_ADAPTATION_HELP)
+@profile_options
+def mala(step_size, target_acceptance, **options):
+    """Run Metropolis-adjusted Langevin (MALA) sampler, using the target's gradient."""
+    return run_gradient_sampler(
+        "Metropolis-adjusted Langevin",
+        metropolis_adjusted_langevin,
+        {"step_size": step_size, "target_acceptance": target_acceptance},
+        **options,
+    )
+
+
+@cli.command()
+@target_options
 @click.option(
-    "--save/--no-save", default=False, help="Whether to save the samples to a file."
+    "--step-size",
+    default=0.5,
+    type=float,
+    help="Initial leapfrog step size, adapted during burn-in.",
 )
 @click.option(
-    "--output", "-o", default="samples.txt", help="Output file name for saving samples."
+    "--n-leapfrog",
+    default=10,
+    type=int,
+    help="Most leapfrog steps per iteration; each iteration draws from 1 to this.",
 )
 @click.option(
-    "--credible-interval",
-    default=0.95,
+    "--target-acceptance",
+    default=0.8,
     type=float,
-    help="Credible interval level (0 to 1).",
-    callback=validate_credible_interval,
+    help="Acceptance rate the step size is adapted towards.",
 )
-def amh(
+@run_options(BURN_IN_ADAPTATION_HELP)
+@profile_options
+def hmc(step_size, n_leapfrog, target_acceptance, **options):
+    """Run Hamiltonian Monte Carlo sampler, using the target's gradient."""
+    return run_gradient_sampler(
+        "Hamiltonian Monte Carlo",
+        hamiltonian_monte_carlo,
+        {
+            "step_size": step_size,
+            "n_leapfrog": n_leapfrog,
+            "target_acceptance": target_acceptance,
+        },
+        **options,
+    )
+
+
+def run_gradient_sampler(
+    name,
+    sample,
+    sampler_kwargs,
     expression,
+    log_density,
     initial,
     iterations,
-    initial_variance,
-    check_interval,
-    increase_factor,
-    decrease_factor,
     burn_in,
     thin,
     seed,
     plot,
     save,
     output,
+    sample_format,
     credible_interval,
+    summary_only,
+    profile,
+    profile_report,
 ):
-    """Run adaptive Metropolis-Hastings MCMC sampler."""
+    """Run a gradient-based sampler command, which takes the sampler's own options."""
     try:
-        target_dist = target_distribution(expression)
-
-        click.echo("Running Adaptive Metropolis-Hastings sampler...")
-        samples, elapsed_time, acceptance_rate, acceptance_rates, mean, median, ci = (
-            adaptive_metropolis_hastings(
-                target_dist,
-                initial,
-                iterations,
-                initial_variance=initial_variance,
-                check_interval=check_interval,
-                increase_factor=increase_factor,
-                decrease_factor=decrease_factor,
-                burn_in=burn_in,
-                thin=thin,
-                seed=seed,
-                credible_interval=credible_interval,
-            )
-        )
+        profiler = RunProfiler(profile, profile_report)
+        with profiler:
+            with profiler.phase("compile"):
+                target_dist = target_distribution(expression, log_density=log_density)
 
-        process_results(
-            samples,
-            elapsed_time,
-            acceptance_rate,
-            target_dist,
-            plot,
-            save,
-            output,
-            acceptance_rates=acceptance_rates,
-            mean=mean,
-            median=median,
-            credible_interval=ci,
-            ci_level=credible_interval,
-        )
+            n_samples = 0 if summary_only else sample_count(iterations, thin)
+            with sample_storage(n_samples, save, output, sample_format) as out:
+                click.echo(f"Running {name} sampler...")
+                with profiler.phase("sampling"), interruptible() as cancel:
+                    (
+                        samples,
+                        elapsed_time,
+                        acceptance_rate,
+                        step_size,
+                        mean,
+                        median,
+                        ci,
+                    ) = sample(
+                        profiler.count_evaluations(target_dist),
+                        initial,
+                        iterations,
+                        **sampler_kwargs,
+                        burn_in=burn_in,
+                        thin=thin,
+                        seed=seed,
+                        credible_interval=credible_interval,
+                        progress=TqdmProgress(),
+                        cancel=cancel,
+                        return_samples=not summary_only,
+                        out=out,
+                    )
+                profiler.split("sampling", "statistics", elapsed_time)
+                report_interruption(cancel, iterations + burn_in)
+
+                with profiler.phase("results"):
+                    click.echo(f"Adapted step size: {step_size:.4g}")
+                    process_results(
+                        samples,
+                        elapsed_time,
+                        acceptance_rate,
+                        target_dist,
+                        plot,
+                        save,
+                        output,
+                        mean=mean,
+                        median=median,
+                        credible_interval=ci,
+                        ci_level=credible_interval,
+                        sample_format=sample_format,
+                        truncated=cancel.stopped_at is not None,
+                    )
+        report_profile(profiler, cancel.stopped_at or iterations + burn_in)
         return 0
 
     except (ValueError, TypeError, SyntaxError) as e:
@@ -247,6 +937,106 @@ def amh(
         return 1
 
 
+@cli.command()
+@click.argument("jobs_file", type=click.File("r"))
+@click.option(
+    "--workers",
+    "-w",
+    default=None,
+    type=click.IntRange(min=0),
+    help="Worker processes to run jobs in. 0 runs them one at a time in this "
+    "process. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--output",
+    "-o",
+    default="-",
+    type=click.File("w"),
+    help="JSON Lines file to write results to. Defaults to standard output.",
+)
+@click.option(
+    "--as-completed",
+    is_flag=True,
+    default=False,
+    help="Write each result as soon as its job finishes, instead of in job order.",
+)
+@click.option(
+    "--timeout",
+    default=None,
+    type=float,
+    help="Seconds each job may run before it fails. Defaults to no limit.",
+)
+def batch(jobs_file, workers, output, as_completed, timeout):
+    """
+    Run a JSON Lines file of sampling jobs in parallel.
+
+    Each line of JOBS_FILE is a JSON object with a 'sampler' ('mh' by default,
+    'amh', 'pt', 'mala' or 'hmc') and that sampler's parameters, named as in the
+    API requests, e.g. {"sampler": "amh", "expression": "exp(-x**4)", "seed": 1}.
+    Each worker compiles a distinct expression at most once. One result is written
+    per job as {"index": ..., "result": {...}} or {"index": ..., "error": "..."}.
+    A failed job does not stop the others.
+    """
+    # Imported here, as multiprocessing and asyncio would slow every command's startup
+    from library.worker_pool import (  # pylint: disable=import-outside-toplevel
+        SamplerPool,
+    )
+
+    jobs = []
+    for line_number, line in enumerate(jobs_file, start=1):
+        if not line.strip():
+            continue
+        try:
+            params = json.loads(line)
+            if not isinstance(params, dict):
+                raise ValueError("a job must be a JSON object")
+        except ValueError as e:
+            click.echo(f"Error: Invalid job on line {line_number}: {e}", err=True)
+            return 1
+        jobs.append((params.pop("sampler", "mh"), params))
+
+    click.echo(f"Running {len(jobs)} jobs...", err=True)
+    start_time = time.time()
+    failed = 0
+    pool = SamplerPool(max_workers=workers, max_queue=0)
+    try:
+        for record in run_batch(pool, jobs, timeout=timeout, ordered=not as_completed):
+            if "error" in record:
+                failed += 1
+                click.echo(f"Job {record['index']} failed: {record['error']}", err=True)
+            output.write(json.dumps(jsonable_record(record)) + "\n")
+            output.flush()
+    except RuntimeError as e:
+        click.echo(f"Error: Sampling workers are unavailable - {e}", err=True)
+        return 1
+    finally:
+        click.get_current_context().meta["worker_metrics"] = pool.worker_metrics()
+        pool.shutdown()
+
+    click.echo(
+        f"Ran {len(jobs)} jobs in {time.time() - start_time:.2f} seconds: "
+        f"{len(jobs) - failed} succeeded, {failed} failed",
+        err=True,
+    )
+    return 0 if failed == 0 else 1
+
+
+def pyplot():
+    """
+    Import matplotlib's pyplot with the non-interactive backend.
+
+    matplotlib takes most of a second to import, so it is only loaded once a run
+    has results to plot, never for ``--help``, ``--no-plot`` or failed runs.
+    """
+    # pylint: disable=import-outside-toplevel
+    import matplotlib
+
+    matplotlib.use("Agg")  # Use non-interactive backend
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
 def process_results(
     samples,
     elapsed_time,
@@ -256,16 +1046,26 @@ def process_results(
     save,
     output,
     acceptance_rates=None,
+    swap_rates=None,
     mean=None,
     median=None,
     credible_interval=None,
     ci_level=0.95,
+    sample_format="txt",
+    truncated=False,
 ):
-    """Process and display MCMC results."""
+    """
+    Process and display MCMC results. Samples are None for summary-only runs.
+
+    Samples may be a memory-mapped file larger than memory, so they are only read
+    in blocks. Plots draw a bounded number of points however long the run. The
+    results of a truncated run, stopped early, are marked as such.
+    """
 
     click.echo(f"Time taken: {elapsed_time:.2f} seconds")
     click.echo(f"Acceptance rate: {acceptance_rate:.2f}")
-    click.echo(f"Number of samples: {len(samples)}")
+    if samples is not None:
+        click.echo(f"Number of samples: {len(samples)}")
 
     if mean is not None:
         click.echo(f"Sample mean: {mean:.4f}")
@@ -278,35 +1078,58 @@ def process_results(
             f"Sample {ci_level_percent}% Credible interval: ({ci_lower:.4f}, {ci_upper:.4f})"
         )
 
-    # Create output directories if they don't exist
-    output_dir = "output"
-    plots_dir = os.path.join(output_dir, "plots")
-    samples_dir = os.path.join(output_dir, "samples")
+    if truncated:
+        click.echo("Results are for a truncated run, stopped before it finished.")
 
-    for directory in [output_dir, plots_dir, samples_dir]:
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+    if samples is None:
+        click.echo("Median and credible interval are streaming estimates.")
+        if save:
+            click.echo("Samples were not kept, so none were saved.")
+        return
+    if not len(samples):
+        click.echo("The run stopped before keeping any samples.")
+        return
+
+    if len(samples) > DIAGNOSTIC_SAMPLES:
+        click.echo(f"Diagnostics use the last {DIAGNOSTIC_SAMPLES} samples.")
+        diagnostics = chain_diagnostics(
+            samples[-DIAGNOSTIC_SAMPLES:],
+            elapsed_time * DIAGNOSTIC_SAMPLES / len(samples),
+        )
+    else:
+        diagnostics = chain_diagnostics(samples, elapsed_time)
+    click.echo(f"Effective sample size: {diagnostics['ess']:.1f}")
+    if diagnostics["ess_per_second"] is not None:
+        click.echo(f"ESS per second: {diagnostics['ess_per_second']:.1f}")
+    click.echo(f"Monte Carlo standard error: {diagnostics['mcse']:.4f}")
+    click.echo(f"Split R-hat: {diagnostics['r_hat']:.4f}")
+
+    # Create output directories if they don't exist
+    plots_dir = os.path.join("output", "plots")
+    os.makedirs(plots_dir, exist_ok=True)
 
     if save:
         # Save samples to the samples directory
-        sample_path = os.path.join(samples_dir, output)
-        np.savetxt(sample_path, samples)
-        click.echo(f"Samples saved to {sample_path}")
+        path = sample_path(output, sample_format)
+        save_samples(path, samples, sample_format)
+        click.echo(f"Samples saved to {path}")
 
     if plot:
-        n_plots = 3 if acceptance_rates is not None else 2
+        has_rates = acceptance_rates is not None or swap_rates is not None
+        n_plots = 3 if has_rates else 2
+        plt = pyplot()
         _, axes = plt.subplots(n_plots, 1, figsize=(10, 4 * n_plots))
 
-        # Trace plot
-        axes[0].plot(samples, color="blue")
-        axes[0].set_title("Trace Plot")
+        # Trace plot, downsampled to the smallest and largest sample per pixel column
+        axes[0].plot(*downsample_trace(samples), color="blue")
+        axes[0].set_title("Trace Plot (truncated run)" if truncated else "Trace Plot")
         axes[0].set_xlabel("Iteration")
         axes[0].set_ylabel("Sample Value")
 
-        # Histogram
-        axes[1].hist(samples, bins=50, density=True, alpha=0.6, color="g")
-        x = np.linspace(min(samples), max(samples), 1000)
-        axes[1].plot(x, [target_dist(xi) for xi in x], "r", lw=2)
+        # Histogram, binned before plotting, with the target density
+        densities, edges = binned_histogram(samples)
+        axes[1].stairs(densities, edges, fill=True, alpha=0.6, color="g")
+        axes[1].plot(*density_curve(target_dist, edges[0], edges[-1]), "r", lw=2)
         axes[1].set_title("Histogram of MCMC samples and target distribution")
         axes[1].set_xlabel("Sample Value")
         axes[1].set_ylabel("Density")
@@ -318,6 +1141,13 @@ def process_results(
             axes[2].set_xlabel("Check Interval")
             axes[2].set_ylabel("Acceptance Rate")
 
+        # Swap rates between adjacent temperatures (parallel tempering only)
+        if swap_rates is not None:
+            axes[2].bar(range(len(swap_rates)), swap_rates, color="purple")
+            axes[2].set_title("Swap Rate Between Adjacent Temperatures")
+            axes[2].set_xlabel("Temperature Pair")
+            axes[2].set_ylabel("Swap Rate")
+
         plt.tight_layout()
 
         # Save plot with timestamp in plots directory
@@ -330,4 +1160,4 @@ def process_results(
 
 
 if __name__ == "__main__":
-    cli()
+    cli()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,266 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Loop overhead of an iteration of each sampler besides its target evaluations, in
+# seconds, measured on a single core. Parallel tempering updates arrays of replicas
+ITERATION_SECONDS = {"mh": 1e-6, "amh": 1e-6, "pt": 1e-5, "mala": 1e-6, "hmc": 1e-6}
+
+# Bytes a kept sample takes in memory
+SAMPLE_BYTES = 8
+
+# Estimated cost of a sampler run. 'iterations' include burn-in, 'evaluations' count
+# the points the target (or, for MALA and HMC, its gradient) is evaluated at, and
+# 'seconds' is the estimated run time on one worker
+RunCost = namedtuple(
+    "RunCost",
+    ["iterations", "stored_samples", "stored_bytes", "evaluations", "seconds"],
+)
+
+
+class BudgetExceededError(ValueError):
+    """Raised when a run's estimated cost is over a budget of the admission policy."""
+
+
+class QuotaExceededError(RuntimeError):
+    """
+    Raised when a client has used up its quota.
+
+    Attributes:
+        retry_after (int): Seconds after which the request would be admitted
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_cost(sampler, params, target):
+    """
+    Estimate the cost of a sampler run before running it.
+
+    The run time is the number of target evaluations times the target's measured
+    cost per evaluation (see ``CompiledTarget.evaluation_seconds``), plus a fixed
+    overhead per iteration. Parallel tempering evaluates every replica each
+    iteration, and HMC's gradient is evaluated once per leapfrog step, whose number
+    is drawn uniformly up to ``n_leapfrog``. The estimate is meant for admission
+    decisions, and is typically within a factor of two of the actual time on an
+    idle core.
+
+    Args:
+        sampler (str): 'mh', 'amh', 'pt', 'mala' or 'hmc'
+        params (dict): Sampler parameters, as for ``run_sampler``
+        target (CompiledTarget): The compiled target distribution
+
+    Returns:
+        RunCost: The estimated cost
+    """
+    iterations = params.get("iterations", 10000) + params.get("burn_in", 1000)
+    stored_samples = 0
+    if params.get("return_samples", True):
+        stored_samples = -(-params.get("iterations", 10000) // params.get("thin", 1))
+
+    # Target evaluations per iteration, by function
+    calls = {"log_density": 1.0}
+    if sampler == "pt":
+        temperatures = params.get("temperatures")
+        calls["log_density"] = len(temperatures or ()) or params.get(
+            "n_temperatures", 8
+        )
+    elif sampler in ("mala", "hmc"):
+        calls = {"log_density_and_gradient": 1.0}
+        if sampler == "hmc":
+            # One step of each trajectory also evaluates the log-density
+            calls["log_density_gradient"] = (1 + params.get("n_leapfrog", 10)) / 2 - 1
+
+    # A target that is not differentiable has no gradient timings; its gradient
+    # based runs fail at once, so they are estimated by the log-density's cost
+    evaluation_seconds = target.evaluation_seconds
+    seconds_per_iteration = ITERATION_SECONDS[sampler] + sum(
+        count * evaluation_seconds.get(name, evaluation_seconds["log_density"])
+        for name, count in calls.items()
+    )
+    evaluations = int(math.ceil(iterations * sum(calls.values())))
+    return RunCost(
+        iterations=iterations,
+        stored_samples=stored_samples,
+        stored_bytes=stored_samples * SAMPLE_BYTES,
+        evaluations=evaluations,
+        seconds=iterations * seconds_per_iteration,
+    )
+
+
+class AdmissionPolicy:
+    """
+    Budgets that a run's estimated cost must fit in to be admitted.
+
+    Args:
+        max_iterations (int, optional): Most iterations, burn-in included. Defaults
+            to None (no limit)
+        max_sample_bytes (int, optional): Most memory the kept samples may take.
+            Defaults to None (no limit)
+        max_seconds (float, optional): Longest estimated run time. Defaults to None
+            (no limit)
+    """
+
+    def __init__(self, max_iterations=None, max_sample_bytes=None, max_seconds=None):
+        self.max_iterations = max_iterations
+        self.max_sample_bytes = max_sample_bytes
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def from_environment(cls, max_seconds=None):
+        """
+        Create a policy configured by environment variables.
+
+        ``MCMC_MAX_ITERATIONS`` sets the iteration budget (default 100000000),
+        ``MCMC_MAX_SAMPLE_MB`` the memory budget of the kept samples (default 512) and
+        ``MCMC_MAX_RUN_SECONDS`` the estimated run time budget. A value of 0 removes
+        a budget.
+
+        Args:
+            max_seconds (float, optional): Run time budget if ``MCMC_MAX_RUN_SECONDS``
+                is not set. Defaults to None (no limit)
+        """
+        max_iterations = int(os.environ.get("MCMC_MAX_ITERATIONS", "100000000"))
+        sample_mb = float(os.environ.get("MCMC_MAX_SAMPLE_MB", "512"))
+        seconds = os.environ.get("MCMC_MAX_RUN_SECONDS")
+        if seconds is not None:
+            max_seconds = float(seconds)
+        return cls(
+            max_iterations=max_iterations or None,
+            max_sample_bytes=int(sample_mb * 2**20) or None,
+            max_seconds=max_seconds or None,
+        )
+
+    def check(self, cost):
+        """
+        Check an estimated cost against the budgets.
+
+        Args:
+            cost (RunCost): Cost from ``estimate_cost``
+
+        Raises:
+            BudgetExceededError: If the cost is over any budget
+        """
+        if self.max_iterations is not None and cost.iterations > self.max_iterations:
+            raise BudgetExceededError(
+                f"Run of {cost.iterations} iterations is over the limit of "
+                f"{self.max_iterations}"
+            )
+        if (
+            self.max_sample_bytes is not None
+            and cost.stored_bytes > self.max_sample_bytes
+        ):
+            raise BudgetExceededError(
+                f"Run would keep {cost.stored_samples} samples, over the limit of "
+                f"{self.max_sample_bytes // SAMPLE_BYTES}; increase thin or set "
+                "return_samples to false"
+            )
+        if self.max_seconds is not None and cost.seconds > self.max_seconds:
+            raise BudgetExceededError(
+                f"Run is estimated to take {cost.seconds:.3g} seconds, over the limit "
+                f"of {self.max_seconds:g}"
+            )
+
+
+class ClientQuotas:
+    """
+    Thread-safe per-client quotas of sampling time and concurrent runs.
+
+    Each client has a token bucket of estimated sampling seconds, refilled at
+    ``rate`` seconds per second up to ``burst``. A run is admitted while the bucket
+    holds its estimated cost, or is full for runs costing more than ``burst``, and
+    its cost is then taken from the bucket. A client may also have at most
+    ``max_concurrent`` runs admitted and not yet released. So one client's burst
+    cannot fill the sampling queue ahead of everyone else's requests.
+
+    Buckets of the least recently seen clients are dropped beyond ``max_clients``.
+
+    Args:
+        rate (float, optional): Sampling seconds per second each client may use.
+            Defaults to None (no limit)
+        burst (float, optional): Bucket size in sampling seconds. Defaults to 60
+            times the rate
+        max_concurrent (int, optional): Most runs per client at once. Defaults to
+            None (no limit)
+        max_clients (int, optional): Most clients tracked. Defaults to 10000
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrent=None, max_clients=10000):
+        self.rate = rate
+        self.burst = burst if burst is not None or rate is None else 60 * rate
+        self.max_concurrent = max_concurrent
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create quotas configured by environment variables.
+
+        ``MCMC_CLIENT_RATE`` sets the sampling seconds per second each client may
+        use, ``MCMC_CLIENT_BURST`` its bucket size and ``MCMC_CLIENT_MAX_CONCURRENT``
+        its concurrent runs. Unset or 0 means no limit.
+        """
+        rate = float(os.environ.get("MCMC_CLIENT_RATE", "0"))
+        burst = float(os.environ.get("MCMC_CLIENT_BURST", "0"))
+        max_concurrent = int(os.environ.get("MCMC_CLIENT_MAX_CONCURRENT", "0"))
+        return cls(
+            rate=rate or None,
+            burst=burst or None,
+            max_concurrent=max_concurrent or None,
+        )
+
+    def acquire(self, client, seconds):
+        """
+        Admit a run of a client, or raise if the client is over its quota.
+
+        Every admitted run must be released with ``release``.
+
+        Args:
+            client (str): Client identity, e.g. its address or API key
+            seconds (float): Estimated sampling seconds of the run
+
+        Raises:
+            QuotaExceededError: If the client has too many runs or too little time left
+        """
+        with self._lock:
+            running = self._running.get(client, 0)
+            if self.max_concurrent is not None and running >= self.max_concurrent:
+                raise QuotaExceededError(
+                    f"Client has {running} sampling runs in progress, the most allowed",
+                    retry_after=1,
+                )
+            if self.rate is not None:
+                tokens = self._refill(client)
+                needed = min(seconds, self.burst)
+                if tokens < needed:
+                    raise QuotaExceededError(
+                        "Client's sampling time quota is used up",
+                        retry_after=max(1, math.ceil((needed - tokens) / self.rate)),
+                    )
+                self._buckets[client] = (tokens - seconds, time.monotonic())
+            self._running[client] = running + 1
+
+    def release(self, client):
+        """Mark a run admitted by ``acquire`` as finished."""
+        with self._lock:
+            running = self._running.get(client, 0) - 1
+            if running > 0:
+                self._running[client] = running
+            else:
+                self._running.pop(client, None)
+
+    def _refill(self, client):
+        """Tokens in a client's bucket now, marking the client recently seen."""
+        tokens, updated = self._buckets.pop(client, (self.burst, time.monotonic()))
+        now = time.monotonic()
+        self._buckets[client] = (tokens, updated)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return min(self.burst, tokens + (now - updated) * self.rate)
@@ -0,0 +1,142 @@
+import queue
+import time
+from concurrent.futures import wait
+from library.tasks import run_sampler, TaskCancelledError
+
+
+def run_batch(pool, jobs, timeout=None, cancel_event=None, ordered=False):
+    """
+    Run a batch of sampler jobs in a worker pool, yielding each job's outcome.
+
+    One ``batch_worker`` task is submitted per worker, and each takes jobs from a
+    shared queue until it is empty, so workers stay busy however uneven the jobs
+    are. Workers keep their compiled-target caches between jobs, so each worker
+    compiles a distinct expression at most once however many jobs share it. A job
+    that fails, e.g. on an invalid expression, reports its error without affecting
+    the others.
+
+    Args:
+        pool (SamplerPool): Pool to run the jobs in
+        jobs (list): (sampler, params) pairs, as taken by ``run_sampler``
+        timeout (float, optional): Seconds each job may run before it fails with
+            ``TaskTimeoutError``. Defaults to None (no limit)
+        cancel_event (threading.Event, optional): Event from ``pool.shared_event``
+            that stops the batch once set. Defaults to None (a new event, set when
+            the generator is closed)
+        ordered (bool, optional): Yield outcomes in job order rather than as they
+            finish. Defaults to False
+
+    Yields:
+        dict: {'index': i, 'result': ...} with the result of ``run_sampler`` for the
+            i-th job, or {'index': i, 'error': ...} with its error message
+
+    Raises:
+        PoolSaturatedError: If the pool cannot accept any task
+    """
+    if not jobs:
+        return
+    job_queue = pool.shared_queue()
+    for index, (sampler, params) in enumerate(jobs):
+        job_queue.put((index, sampler, params))
+    records = pool.shared_queue()
+    if cancel_event is None:
+        cancel_event = pool.shared_event()
+
+    futures = []
+    for _ in range(min(len(jobs), max(1, pool.max_workers))):
+        try:
+            futures.append(
+                pool.submit(batch_worker, job_queue, records, timeout, cancel_event)
+            )
+        except RuntimeError:
+            # A busy pool runs the batch on the workers it could get
+            if not futures:
+                raise
+            break
+
+    waiting = {}
+    next_index = 0
+    try:
+        for record in _collect(futures, records, len(jobs)):
+            if not ordered:
+                yield record
+                continue
+            waiting[record["index"]] = record
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+        # Workers return, publishing their metrics, once they find the queue empty
+        wait(futures)
+    finally:
+        # Workers stop taking jobs once the batch is finished or abandoned
+        cancel_event.set()
+
+
+def batch_worker(jobs, records, timeout=None, cancel_event=None):
+    """
+    Run jobs from a shared queue until it is empty, putting each outcome on records.
+
+    Runs in a worker process. A cancelled batch stops after the current job.
+
+    Args:
+        jobs (queue.Queue): Queue of (index, sampler, params) tuples
+        records (queue.Queue): Queue that outcomes are put on, as yielded by ``run_batch``
+        timeout (float, optional): Seconds each job may run. Defaults to None (no limit)
+        cancel_event (threading.Event, optional): Event that stops the batch once set.
+            Defaults to None
+    """
+    while cancel_event is None or not cancel_event.is_set():
+        try:
+            index, sampler, params = jobs.get_nowait()
+        except queue.Empty:
+            return
+        deadline = None if timeout is None else time.time() + timeout
+        try:
+            result = run_sampler(
+                sampler, params, deadline=deadline, cancel_event=cancel_event
+            )
+            record = {"index": index, "result": result}
+        except TaskCancelledError:
+            return
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            record = {"index": index, "error": str(e) or type(e).__name__}
+        records.put(record)
+
+
+def jsonable_record(record):
+    """Convert an outcome yielded by ``run_batch`` to JSON-serializable data."""
+    if "result" not in record:
+        return record
+    result = dict(record["result"])
+    if result["samples"] is not None:
+        result["samples"] = result["samples"].tolist()
+    return {"index": record["index"], "result": result}
+
+
+def _collect(futures, records, n_jobs):
+    """Yield the outcome of every job, as an error for jobs lost with their worker."""
+    reported = set()
+    while len(reported) < n_jobs:
+        try:
+            record = records.get(timeout=0.1)
+        except queue.Empty:
+            if not all(future.done() for future in futures):
+                continue
+            try:
+                # Workers put every outcome before they return
+                record = records.get_nowait()
+            except queue.Empty:
+                yield from _lost_jobs(futures, reported, n_jobs)
+                return
+        reported.add(record["index"])
+        yield record
+
+
+def _lost_jobs(futures, reported, n_jobs):
+    """Errors for the jobs that finished workers never reported."""
+    errors = [future.exception() for future in futures if not future.cancelled()]
+    error = next((e for e in errors if e is not None), None)
+    message = f"Sampling worker failed: {error}" if error else "Batch was cancelled"
+    for index in range(n_jobs):
+        if index not in reported:
+            yield {"index": index, "error": message}
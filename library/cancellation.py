@@ -0,0 +1,62 @@
+import time
+
+
+class CancellationToken:
+    """
+    Request for a sampler run to stop early, keeping the samples collected so far.
+
+    The samplers check a token they are given once every ``RNG_BLOCK_SIZE``
+    iterations, between blocks of random variates, so checking costs nothing
+    measurable. Once the token is cancelled or its deadline has passed, the chain
+    stops at the end of the block and the sampler returns the samples and
+    statistics of the iterations it ran, recording in ``stopped_at`` how far it
+    got. A checkpointed chain is saved as it stops, so it can be resumed.
+
+    A token is cancelled by calling ``cancel``, which is safe from a signal handler
+    or another thread, or by setting its event. The event may be a manager proxy of
+    an event in another process, so it is polled at most every ``poll_interval``
+    seconds.
+
+    Args:
+        deadline (float, optional): Wall-clock time (as returned by ``time.time``) to
+            stop at. Defaults to None (no limit)
+        event (threading.Event, optional): Event, or a manager proxy of one, that
+            cancels the token once set. Defaults to None
+        poll_interval (float, optional): Minimum seconds between polls of the event.
+            Defaults to 0.1
+
+    Attributes:
+        stopped_at (int): Iterations, burn-in included, after which the last run
+            given the token stopped early, or None if no run has
+    """
+
+    def __init__(self, deadline=None, event=None, poll_interval=0.1):
+        self.deadline = deadline
+        self.event = event
+        self.poll_interval = poll_interval
+        self.stopped_at = None
+        self._cancelled = False
+        self._last_poll = float("-inf")
+
+    def cancel(self):
+        """Ask the runs given the token to stop at their next check."""
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        """Whether the token has been cancelled, polling its event when a poll is due."""
+        if not self._cancelled and self.event is not None:
+            now = time.monotonic()
+            if now - self._last_poll >= self.poll_interval:
+                self._last_poll = now
+                self._cancelled = self.event.is_set()
+        return self._cancelled
+
+    @property
+    def expired(self):
+        """Whether the deadline has passed."""
+        return self.deadline is not None and time.time() > self.deadline
+
+    def stop_requested(self):
+        """Whether runs should stop, as the token is cancelled or past its deadline."""
+        return self.expired or self.cancelled
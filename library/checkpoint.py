@@ -0,0 +1,144 @@
+import json
+import os
+import time
+import numpy as np
+
+# Format version of the state file, bumped on incompatible changes
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    """
+    Periodic, crash-safe checkpoints of a running chain on disk.
+
+    A checkpoint is a small JSON state file plus one append-only file of raw
+    little-endian float64 values per growing series: the samples and, for adaptive
+    runs, the interval acceptance rates. Each save appends only the values produced
+    since the previous save and fsyncs them, so its cost does not grow with the
+    run. It then writes the state to a temporary file and atomically renames it
+    over the previous one. The state records how many values of each series
+    belong to it, so values appended by a save that was interrupted by a crash are
+    dropped on resume.
+
+    Pass a checkpoint to ``metropolis_hastings`` or ``adaptive_metropolis_hastings``
+    to save the chain every ``interval`` seconds, and pass ``resume=True`` as well
+    to continue from the last save. A resumed chain produces exactly the samples the
+    uninterrupted run would have.
+
+    Args:
+        path (str): Path of the state file. Series are stored next to it as
+            ``<path>.<series>``
+        interval (float, optional): Minimum number of seconds between saves. Defaults to 5.0
+        metadata (dict, optional): JSON-serializable data saved with the state, e.g. the
+            target expression, so that a run can be resumed from its checkpoint alone.
+            Defaults to None
+
+    Example:
+        >>> checkpoint = Checkpoint("run.ckpt", interval=5.0)
+        >>> adaptive_metropolis_hastings(target, 0.0, 10**8, seed=42, checkpoint=checkpoint)
+        >>> # After a crash, with the same arguments:
+        >>> adaptive_metropolis_hastings(target, 0.0, 10**8, seed=42, checkpoint=checkpoint, resume=True)
+    """
+
+    def __init__(self, path, interval=5.0, metadata=None):
+        self.path = path
+        self.interval = interval
+        self.metadata = {} if metadata is None else metadata
+        self._lengths = {}
+        self._last_save = time.monotonic()
+
+    def exists(self):
+        """Whether a checkpoint has been saved at ``path``."""
+        return os.path.exists(self.path)
+
+    def due(self):
+        """Whether ``interval`` seconds have passed since the last save (or creation)."""
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, state, series):
+        """
+        Save a chain's state and the values of its series produced since the last save.
+
+        Args:
+            state (dict): JSON-serializable state of the chain
+            series (dict): Maps each series name to an array of its new values
+        """
+        lengths = dict(self._lengths)
+        for name, values in series.items():
+            values = np.asarray(values, dtype="<f8")
+            # The first save of a fresh run replaces any series left by an older run
+            mode = "ab" if name in self._lengths else "wb"
+            with open(self._series_path(name), mode) as file:
+                file.write(values.tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+            lengths[name] = lengths.get(name, 0) + len(values)
+
+        payload = {
+            "version": CHECKPOINT_VERSION,
+            "metadata": self.metadata,
+            "lengths": lengths,
+            "state": state,
+        }
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(payload, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+
+        self._lengths = lengths
+        self._last_save = time.monotonic()
+
+    def load(self):
+        """
+        Load the last saved checkpoint, and continue appending after it.
+
+        Returns:
+            tuple: The state dictionary and a dictionary mapping each series name to
+                a numpy.ndarray of its saved values. ``metadata`` is also restored
+
+        Raises:
+            FileNotFoundError: If no checkpoint has been saved at ``path``
+            ValueError: If the checkpoint was written by an incompatible version
+        """
+        payload = self._read_payload()
+        series = {}
+        for name, length in payload["lengths"].items():
+            path = self._series_path(name)
+            # Drop values written after the state file by an interrupted save
+            os.truncate(path, length * 8)
+            series[name] = np.fromfile(path, dtype="<f8", count=length)
+
+        self.metadata = payload["metadata"]
+        self._lengths = dict(payload["lengths"])
+        self._last_save = time.monotonic()
+        return payload["state"], series
+
+    def read_metadata(self):
+        """Read the metadata of the last save without loading its series."""
+        return self._read_payload()["metadata"]
+
+    def remove(self):
+        """Delete the checkpoint's files, e.g. once the run has finished."""
+        names = set(self._lengths)
+        if self.exists():
+            names.update(self._read_payload()["lengths"])
+        paths = [self.path, f"{self.path}.tmp"]
+        paths += [self._series_path(name) for name in names]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self._lengths = {}
+
+    def _read_payload(self):
+        with open(self.path, encoding="utf-8") as file:
+            payload = json.load(file)
+        if payload.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(
+                f"Unsupported checkpoint version {payload.get('version')} in {self.path}"
+            )
+        return payload
+
+    def _series_path(self, name):
+        return f"{self.path}.{name}"
@@ -0,0 +1,176 @@
+import numpy as np
+
+
+def autocorrelation(samples, max_lag=None):
+    """
+    Autocorrelation function of a chain, or of each of several chains, via FFT.
+
+    The autocovariance at every lag is computed at once from the power spectrum of
+    the zero-padded chain, which takes O(n log n) time rather than the O(n^2) of
+    summing lagged products, so chains of 10^7 samples take a few seconds.
+
+    Args:
+        samples (array_like): A chain of shape (n_samples,), or chains of shape
+            (n_chains, n_samples)
+        max_lag (int, optional): Largest lag to return. Defaults to None (all lags up
+            to n_samples - 1)
+
+    Returns:
+        numpy.ndarray: Autocorrelations at lags 0 to max_lag, with the same leading
+            shape as samples. A constant chain has an autocorrelation of nan
+    """
+    autocovariance = _autocovariance(np.asarray(samples, dtype=float))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acf = autocovariance / autocovariance[..., :1]
+    return acf if max_lag is None else acf[..., : max_lag + 1]
+
+
+def effective_sample_size(samples):
+    """
+    Effective sample size of one or several chains.
+
+    Follows Stan (Vehtari et al., 2021): autocorrelations are combined across
+    chains, and pairs of consecutive autocorrelations are summed while positive and
+    made monotone (Geyer's initial monotone sequence estimator). Chains are expected
+    to have had their burn-in removed.
+
+    Args:
+        samples (array_like): A chain of shape (n_samples,), or chains of shape
+            (n_chains, n_samples)
+
+    Returns:
+        float: Effective number of independent draws, at most
+            ``n_draws * log10(n_draws)``. nan for fewer than 4 draws per chain or a
+            constant chain
+    """
+    chains = np.atleast_2d(np.asarray(samples, dtype=float))
+    n_chains, n_samples = chains.shape
+    if n_samples < 4:
+        return float("nan")
+
+    autocovariance = _autocovariance(chains)
+    mean_variance = np.mean(autocovariance[:, 0]) * n_samples / (n_samples - 1)
+    variance_plus = mean_variance * (n_samples - 1) / n_samples
+    if n_chains > 1:
+        variance_plus += np.var(np.mean(chains, axis=1), ddof=1)
+    if variance_plus <= 0:
+        return float("nan")
+    rho = 1 - (mean_variance - np.mean(autocovariance, axis=0)) / variance_plus
+    rho[0] = 1.0
+
+    # Sums of consecutive pairs, truncated at the first non-positive pair
+    pairs = rho[: n_samples // 2 * 2].reshape(-1, 2).sum(axis=1)
+    non_positive = np.flatnonzero(pairs <= 0)
+    if len(non_positive):
+        pairs = pairs[: non_positive[0]]
+    pairs = np.minimum.accumulate(pairs)
+    tau = max(-1 + 2 * np.sum(pairs), 1 / np.log10(n_chains * n_samples))
+    return float(n_chains * n_samples / tau)
+
+
+def monte_carlo_standard_error(samples):
+    """
+    Monte Carlo standard error of the mean of one or several chains.
+
+    Args:
+        samples (array_like): A chain of shape (n_samples,), or chains of shape
+            (n_chains, n_samples)
+
+    Returns:
+        float: Standard deviation of the draws divided by the square root of the
+            effective sample size
+    """
+    samples = np.asarray(samples, dtype=float)
+    return _standard_error(samples, effective_sample_size(samples))
+
+
+def split_rhat(samples):
+    """
+    Split R-hat convergence diagnostic (Gelman et al., 2013).
+
+    Each chain is split in half and the between- and within-half variances are
+    compared, so a single chain whose two halves disagree is also flagged. Values
+    above about 1.01 suggest the chains have not mixed.
+
+    Args:
+        samples (array_like): A chain of shape (n_samples,), or chains of shape
+            (n_chains, n_samples)
+
+    Returns:
+        float: The potential scale reduction factor, close to 1 for converged chains.
+            nan for fewer than 4 draws per chain or constant chains
+    """
+    chains = np.atleast_2d(np.asarray(samples, dtype=float))
+    half = chains.shape[1] // 2
+    if half < 2:
+        return float("nan")
+    # Drop the middle draw of odd-length chains
+    halves = np.concatenate([chains[:, :half], chains[:, -half:]])
+
+    within = np.mean(np.var(halves, axis=1, ddof=1))
+    between = half * np.var(np.mean(halves, axis=1), ddof=1)
+    if within <= 0:
+        return float("nan")
+    variance_plus = (half - 1) / half * within + between / half
+    return float(np.sqrt(variance_plus / within))
+
+
+def chain_diagnostics(samples, elapsed_time=None):
+    """
+    Effective sample size, Monte Carlo standard error and split R-hat of a run.
+
+    Args:
+        samples (array_like): A chain of shape (n_samples,), or chains of shape
+            (n_chains, n_samples)
+        elapsed_time (float, optional): Sampling time in seconds, to report the
+            effective sample size per second. Defaults to None
+
+    Returns:
+        dict: 'ess', 'ess_per_second' (None without elapsed_time), 'mcse' and 'r_hat'
+    """
+    samples = np.asarray(samples, dtype=float)
+    ess = effective_sample_size(samples)
+    ess_per_second = None
+    if elapsed_time is not None and elapsed_time > 0:
+        ess_per_second = ess / elapsed_time
+    return {
+        "ess": ess,
+        "ess_per_second": ess_per_second,
+        "mcse": _standard_error(samples, ess),
+        "r_hat": split_rhat(samples),
+    }
+
+
+def _standard_error(samples, ess):
+    """Standard deviation of all draws over the square root of the ESS."""
+    if not np.isfinite(ess):
+        return float("nan")
+    return float(np.std(samples, ddof=1) / np.sqrt(ess))
+
+
+def _autocovariance(chains):
+    """Biased autocovariance at every lag along the last axis, via FFT."""
+    n_samples = chains.shape[-1]
+    centered = chains - np.mean(chains, axis=-1, keepdims=True)
+    # Padding to at least 2n avoids wrap-around; 5-smooth lengths keep the FFT fast
+    size = _fft_length(2 * n_samples)
+    spectrum = np.fft.rfft(centered, n=size)
+    power = spectrum.real**2 + spectrum.imag**2
+    return np.fft.irfft(power, n=size)[..., :n_samples] / n_samples
+
+
+def _fft_length(minimum):
+    """Smallest length of the form 2**a * 3**b * 5**c that is at least ``minimum``."""
+    best = 1 << max(0, int(minimum - 1).bit_length())
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            # Smallest power of two times power35 that reaches minimum
+            length = power35 * (
+                1 << max(0, int(-(-minimum // power35) - 1).bit_length())
+            )
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
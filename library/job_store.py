@@ -0,0 +1,316 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import numpy as np
+
+# Job lifecycle: queued -> running [-> cancelling] -> succeeded | failed | cancelled
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobStore(ABC):
+    """
+    Storage for asynchronous sampling jobs.
+
+    A job is a dictionary with the keys 'job_id', 'sampler', 'params', 'status',
+    'progress', 'created_at', 'finished_at' and 'error'. Results are stored
+    separately and returned by ``get_result``. Finished jobs are evicted ``ttl``
+    seconds after they finish; eviction runs lazily whenever the store is accessed.
+
+    Args:
+        ttl (float, optional): Seconds to keep finished jobs and their results. Defaults to 3600
+    """
+
+    def __init__(self, ttl=3600.0):
+        self.ttl = ttl
+
+    def create(self, sampler, params):
+        """Create a queued job and return it."""
+        self.evict_expired()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "sampler": sampler,
+            "params": params,
+            "status": "queued",
+            "progress": 0.0,
+            "created_at": time.time(),
+            "finished_at": None,
+            "error": None,
+        }
+        self._insert(job)
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given id, or None if it does not exist."""
+        self.evict_expired()
+        return self._select(job_id)
+
+    def update(self, job_id, **fields):
+        """Update fields of a job that has not finished yet."""
+        self._update(job_id, fields)
+
+    def finish(self, job_id, status, result=None, error=None):
+        """
+        Record the outcome of a job.
+
+        Returns:
+            bool: False if the job no longer exists or had already finished, e.g.
+                because it was cancelled while running
+        """
+        fields = {
+            "status": status,
+            "error": error,
+            "finished_at": time.time(),
+        }
+        if status == "succeeded":
+            fields["progress"] = 1.0
+        return self._finish(job_id, fields, result)
+
+    def evict_expired(self):
+        """Delete finished jobs older than the TTL."""
+        self._evict_before(time.time() - self.ttl)
+
+    def fail_unfinished(self, error="Server restarted before the job finished"):
+        """Mark jobs left queued or running by a previous server process as failed."""
+
+    @abstractmethod
+    def get_result(self, job_id):
+        """Return the result of a succeeded job, or None."""
+
+    @abstractmethod
+    def delete(self, job_id):
+        """Delete a job and its result."""
+
+    @abstractmethod
+    def _insert(self, job):
+        """Store a new job."""
+
+    @abstractmethod
+    def _select(self, job_id):
+        """Return a copy of a job, or None."""
+
+    @abstractmethod
+    def _update(self, job_id, fields):
+        """Update fields of a job unless it has finished."""
+
+    @abstractmethod
+    def _finish(self, job_id, fields, result):
+        """Store the outcome of an unfinished job and return whether it was stored."""
+
+    @abstractmethod
+    def _evict_before(self, cutoff):
+        """Delete jobs that finished before the cutoff time."""
+
+
+class InMemoryJobStore(JobStore):
+    """Job store kept in a dictionary of the current process."""
+
+    def __init__(self, ttl=3600.0):
+        super().__init__(ttl=ttl)
+        self._jobs = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def get_result(self, job_id):
+        with self._lock:
+            return self._results.get(job_id)
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._results.pop(job_id, None)
+
+    def _insert(self, job):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def _select(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, job_id, fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] not in FINISHED_STATUSES:
+                job.update(fields)
+
+    def _finish(self, job_id, fields, result):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                return False
+            job.update(fields)
+            if result is not None:
+                self._results[job_id] = result
+            return True
+
+    def _evict_before(self, cutoff):
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None and job["finished_at"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._results.pop(job_id, None)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store in a local SQLite database, so jobs survive a server restart.
+
+    Sample arrays are stored as little-endian float64 blobs and the remaining
+    result fields as JSON.
+
+    Args:
+        path (str): Database file path
+        ttl (float, optional): Seconds to keep finished jobs and their results. Defaults to 3600
+    """
+
+    _COLUMNS = (
+        "job_id",
+        "sampler",
+        "params",
+        "status",
+        "progress",
+        "created_at",
+        "finished_at",
+        "error",
+    )
+
+    def __init__(self, path, ttl=3600.0):
+        super().__init__(ttl=ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    sampler TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    finished_at REAL,
+                    error TEXT,
+                    result TEXT,
+                    samples BLOB
+                )
+                """
+            )
+
+    def get_result(self, job_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT result, samples FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        result = json.loads(row[0])
+        if row[1] is not None:
+            result["samples"] = np.frombuffer(row[1], dtype="<f8")
+        if "credible_interval" in result:
+            result["credible_interval"] = tuple(result["credible_interval"])
+        return result
+
+    def delete(self, job_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def fail_unfinished(self, error="Server restarted before the job finished"):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE status NOT IN ('succeeded', 'failed', 'cancelled')",
+                (error, time.time()),
+            )
+
+    @contextmanager
+    def _connection(self):
+        """Open a connection for one transaction, committing it on success."""
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=30)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def _insert(self, job):
+        row = dict(job, params=json.dumps(job["params"]))
+        with self._connection() as conn:
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(self._COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                [row[column] for column in self._COLUMNS],
+            )
+
+    def _select(self, job_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def _update(self, job_id, fields):
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._connection() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ? "
+                "AND status NOT IN ('succeeded', 'failed', 'cancelled')",
+                [*fields.values(), job_id],
+            )
+
+    def _finish(self, job_id, fields, result):
+        fields = dict(fields)
+        if result is not None:
+            result = dict(result)
+            samples = result.pop("samples", None)
+            fields["result"] = json.dumps(result)
+            if samples is not None:
+                fields["samples"] = np.asarray(samples, dtype="<f8").tobytes()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ? "
+                "AND status NOT IN ('succeeded', 'failed', 'cancelled')",
+                [*fields.values(), job_id],
+            )
+            return cursor.rowcount == 1
+
+    def _evict_before(self, cutoff):
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (cutoff,),
+            )
+
+
+def job_store_from_url(url, ttl=3600.0):
+    """
+    Create a job store from a URL-like string.
+
+    Args:
+        url (str): 'memory' for an in-process store or 'sqlite:PATH' for a SQLite
+            database at PATH
+        ttl (float, optional): Seconds to keep finished jobs. Defaults to 3600
+
+    Returns:
+        JobStore: The configured store
+    """
+    if url == "memory":
+        return InMemoryJobStore(ttl=ttl)
+    if url.startswith("sqlite:"):
+        return SQLiteJobStore(url[len("sqlite:") :], ttl=ttl)
+    raise ValueError(f"Unknown job store '{url}', expected 'memory' or 'sqlite:PATH'")
@@ -1,6 +1,41 @@
+import functools
+import inspect
+import itertools
 import numpy as np
-from tqdm import tqdm
 import time
+from library.mcmc_utils import proposal_distribution
+from library.metrics import Counter, Histogram, RATE_BUCKETS
+from library.progress import NullProgress
+from library.sample_store import sample_count
+from library.summary import RunningMoments, QuantileSketch, chunked_percentile
+
+# Number of proposal and uniform variates drawn per call to the run's Generator
+RNG_BLOCK_SIZE = 4096
+
+# Samples per chunk when a run's chunks are collected into one array
+COLLECT_CHUNK_SIZE = 65536
+
+# Metrics of completed runs, labelled by sampler ('mh', 'amh', 'pt', 'mala' or 'hmc').
+# Iterations include burn-in and are summed over the chains of multi-chain runs.
+SAMPLER_RUNS = Counter(
+    "mcmc_sampler_runs_total", "Completed sampler runs.", ["sampler"]
+)
+SAMPLER_ITERATIONS = Counter(
+    "mcmc_sampler_iterations_total",
+    "Iterations run by completed sampler runs.",
+    ["sampler"],
+)
+SAMPLER_SECONDS = Counter(
+    "mcmc_sampler_seconds_total",
+    "Time spent in completed sampler runs.",
+    ["sampler"],
+)
+SAMPLER_THROUGHPUT = Histogram(
+    "mcmc_sampler_iterations_per_second",
+    "Iterations per second of each completed sampler run.",
+    ["sampler"],
+    buckets=RATE_BUCKETS,
+)
 
 
 def adaptive_metropolis_hastings(
@@ -15,12 +50,20 @@ def adaptive_metropolis_hastings(
     thin=1,
     seed=None,
     credible_interval=0.95,
+    n_chains=None,
+    progress=None,
+    cancel=None,
+    return_samples=True,
+    checkpoint=None,
+    resume=False,
+    out=None,
 ):
     """
     Adaptive Metropolis-Hastings algorithm with burn-in and thinning.
 
     Args:
-        target (Callable[[float], float]): Target distribution function that takes a float and returns a float
+        target (Callable[[float], float]): Target distribution function that takes a float and returns a float.
+            Sampling runs in log space on its ``log_density`` when it has one (see ``target_distribution``)
         initial (float): Initial value to start the chain
         iterations (int): Number of iterations to run
         initial_variance (float, optional): Initial proposal variance. Defaults to 1.0
@@ -29,12 +72,37 @@ def adaptive_metropolis_hastings(
         decrease_factor (float, optional): Factor to decrease variance. Defaults to 0.9
         burn_in (int, optional): Number of initial samples to discard. Defaults to 1000
         thin (int, optional): Keep every nth sample. Defaults to 1
-        seed (int, optional): Random seed for reproducibility. Defaults to None
+        seed (int, optional): Random seed for the run's own ``numpy.random.Generator``. The global
+            NumPy random state is neither used nor modified. Defaults to None
         credible_interval (float, optional): Credible interval level (0 to 1). Defaults to 0.95
-
+        n_chains (int, optional): Number of independent chains to run in lockstep as one
+            vectorized update. Each chain adapts its own proposal variance. Defaults to None
+            (a single scalar chain)
+        progress (ProgressReporter, optional): Receives rate-limited progress updates, e.g.
+            ``TqdmProgress`` or ``CallbackProgress`` from ``library.progress``. Defaults to
+            None (silent)
+        cancel (CancellationToken, optional): Token that stops the chain early, keeping
+            the samples so far (see ``library.cancellation``). Defaults to None
+        return_samples (bool, optional): Keep and return the samples. If False, the samples
+            are discarded chunk by chunk and None is returned in their place, so memory use
+            stays constant however long the chain. The mean is then still exact, while the
+            median and credible interval are streaming estimates within 0.5% relative error
+            (see ``QuantileSketch``). Not supported with ``n_chains``. Defaults to True
+        checkpoint (Checkpoint, optional): Saves the chain's full state and samples so far
+            every ``checkpoint.interval`` seconds (see ``library.checkpoint``). Not supported
+            with ``n_chains``. Defaults to None
+        resume (bool, optional): Continue from the last save of ``checkpoint``, which must
+            have been made by a call with the same arguments. The result equals that of an
+            uninterrupted run. Defaults to False
+        out (numpy.ndarray, optional): Array of shape (``sample_count(iterations, thin)``,)
+            to write the samples into as the chain runs, and to return in place of a new
+            array. A memory-mapped file from ``library.sample_store.open_sample_file``
+            lets a run keep more samples than fit in memory; its median and credible
+            interval are then computed exactly in blocks. Not supported with
+            ``n_chains``. Defaults to None
 
     Returns:
-        tuple: A tuple containing:
+        SamplerResult: A tuple containing:
             - numpy.ndarray: Array of samples from the target distribution
             - float: Elapsed time in seconds
             - float: Overall acceptance rate between 0 and 1
@@ -43,73 +111,70 @@ def adaptive_metropolis_hastings(
             - float: Median of the samples
             - tuple: Credible interval (lower, upper) bounds
 
+        With ``n_chains`` set, samples have shape (n_chains, n_samples), the overall
+        acceptance rate is an array with one rate per chain, the interval acceptance
+        rates are an array of shape (n_checks, n_chains), and the mean, median and
+        credible interval are pooled over all chains.
+
     Example:
         >>> target_dist = target_distribution('exp(-0.5 * x**2) / sqrt(2 * pi)')
         >>> samples, time, acc_rate, acc_rates = adaptive_metropolis_hastings(target_dist, 0.0, 10000, seed=42)
     """
-    # Set random seed if provided
-    if seed is not None:
-        np.random.seed(seed)
-
-    total_iterations = iterations + burn_in
-    samples = []
-    current = initial
-    variance = initial_variance
-    acceptance_rates = []
-    interval_accepted = 0
-    interval_count = 0
-    start_time = time.time()
-
-    with tqdm(total=total_iterations, desc="Sampling", unit="iteration") as pbar:
-        for i in range(total_iterations):
-            # Propose new value
-            proposed = np.random.normal(current, np.sqrt(variance))
-            acceptance_ratio = target(proposed) / target(current)
-
-            if np.random.rand() < acceptance_ratio:
-                current = proposed
-                interval_accepted += 1
-
-            # Store sample if past burn-in and meets thinning criteria
-            if i >= burn_in and (i - burn_in) % thin == 0:
-                samples.append(current)
-
-            # Check acceptance rate at each interval
-            interval_count += 1
-            if interval_count == check_interval:
-                acceptance_rate = interval_accepted / check_interval
-                variance = adaptive_proposal_distribution(
-                    variance, acceptance_rate, increase_factor, decrease_factor
-                )
-                acceptance_rates.append(acceptance_rate)
-                interval_accepted = 0
-                interval_count = 0
+    if n_chains is not None:
+        if not return_samples or checkpoint is not None or out is not None:
+            raise ValueError(
+                "return_samples=False, checkpoints and out are not supported with n_chains"
+            )
+        return _adaptive_metropolis_hastings_chains(
+            target,
+            initial,
+            iterations,
+            n_chains,
+            initial_variance=initial_variance,
+            check_interval=check_interval,
+            increase_factor=increase_factor,
+            decrease_factor=decrease_factor,
+            burn_in=burn_in,
+            thin=thin,
+            seed=seed,
+            credible_interval=credible_interval,
+            progress=progress,
+            cancel=cancel,
+        )
 
-            pbar.update(1)
-            current_acceptance = interval_accepted / max(1, interval_count)
-            pbar.set_postfix(acceptance_rate=current_acceptance)
-
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    overall_acceptance_rate = np.mean(acceptance_rates) if acceptance_rates else 0
-
-    samples_array = np.array(samples)
-    sample_mean = np.mean(samples_array)
-    sample_median = np.median(samples_array)
-
-    # Calculate credible interval
-    alpha = (1 - credible_interval) / 2
-    ci_lower = np.percentile(samples_array, 100 * alpha)
-    ci_upper = np.percentile(samples_array, 100 * (1 - alpha))
+    _check_out(out, iterations, thin, return_samples)
+    steps = _adaptive_metropolis_hastings_steps(
+        target,
+        initial,
+        iterations,
+        initial_variance=initial_variance,
+        check_interval=check_interval,
+        increase_factor=increase_factor,
+        decrease_factor=decrease_factor,
+        burn_in=burn_in,
+        thin=thin,
+        seed=seed,
+        progress=progress,
+        cancel=cancel,
+        checkpoint=checkpoint,
+        resume=resume,
+    )
+    samples_array, run, sample_mean, sample_median, ci = _summarize(
+        steps, credible_interval, return_samples, out
+    )
 
-    return (
-        samples_array,
-        elapsed_time,
-        overall_acceptance_rate,
-        acceptance_rates,
-        sample_mean,
-        sample_median,
-        (ci_lower, ci_upper),
+    return SamplerResult(
+        (
+            samples_array,
+            run["elapsed_time"],
+            run["acceptance_rate"],
+            run["acceptance_rates"],
+            sample_mean,
+            sample_median,
+            ci,
+        ),
+        run["truncated"],
+        run["iterations"],
     )
 
 
@@ -132,77 +197,1942 @@ def metropolis_hastings(
     thin=1,
     seed=None,
     credible_interval=0.95,
+    n_chains=None,
+    progress=None,
+    cancel=None,
+    return_samples=True,
+    checkpoint=None,
+    resume=False,
+    out=None,
 ):
     """
     Metropolis-Hastings algorithm with burn-in and thinning.
 
     Args:
-        target (Callable[[float], float]): Target distribution function that takes a float and returns a float
-        proposal (Callable[[float], float]): Proposal distribution function that takes a float and returns a float
+        target (Callable[[float], float]): Target distribution function that takes a float and returns a float.
+            Sampling runs in log space on its ``log_density`` when it has one (see ``target_distribution``)
+        proposal (Callable[[float], float]): Proposal distribution function that takes a float and returns a float.
+            ``proposal_distribution`` draws its noise in blocks from the run's Generator. Any other
+            proposal is called once per iteration and is passed the run's Generator if it accepts an
+            ``rng`` keyword argument; otherwise ``seed`` also seeds the global NumPy random state,
+            so that proposals drawing from ``np.random`` stay reproducible
         initial (float): Initial value to start the chain
         iterations (int): Number of iterations to run
         burn_in (int, optional): Number of initial samples to discard. Defaults to 1000
         thin (int, optional): Keep every nth sample. Defaults to 1
-        seed (int, optional): Random seed for reproducibility. Defaults to None
+        seed (int, optional): Random seed for the run's own ``numpy.random.Generator``. The global
+            NumPy random state is neither used nor modified, except for custom proposals without
+            an ``rng`` argument. Defaults to None
         credible_interval (float, optional): Credible interval level (0 to 1). Defaults to 0.95
+        n_chains (int, optional): Number of independent chains to run in lockstep as one
+            vectorized update. The target and proposal must accept arrays. Defaults to None
+            (a single scalar chain)
+        progress (ProgressReporter, optional): Receives rate-limited progress updates, e.g.
+            ``TqdmProgress`` or ``CallbackProgress`` from ``library.progress``. Defaults to
+            None (silent)
+        cancel (CancellationToken, optional): Token that stops the chain early, keeping
+            the samples so far (see ``library.cancellation``). Defaults to None
+        return_samples (bool, optional): Keep and return the samples. If False, the samples
+            are discarded chunk by chunk and None is returned in their place, so memory use
+            stays constant however long the chain. The mean is then still exact, while the
+            median and credible interval are streaming estimates within 0.5% relative error
+            (see ``QuantileSketch``). Not supported with ``n_chains``. Defaults to True
+        checkpoint (Checkpoint, optional): Saves the chain's full state and samples so far
+            every ``checkpoint.interval`` seconds (see ``library.checkpoint``). Not supported
+            with ``n_chains``. Defaults to None
+        resume (bool, optional): Continue from the last save of ``checkpoint``, which must
+            have been made by a call with the same arguments. The result equals that of an
+            uninterrupted run. Defaults to False
+        out (numpy.ndarray, optional): Array of shape (``sample_count(iterations, thin)``,)
+            to write the samples into as the chain runs, and to return in place of a new
+            array. A memory-mapped file from ``library.sample_store.open_sample_file``
+            lets a run keep more samples than fit in memory; its median and credible
+            interval are then computed exactly in blocks. Not supported with
+            ``n_chains``. Defaults to None
 
     Returns:
-        tuple: A tuple containing:
+        SamplerResult: A tuple containing:
             - numpy.ndarray: Array of samples from the target distribution
             - float: Elapsed time in seconds
             - float: Acceptance rate between 0 and 1
             - float: Mean of the samples
-            - float: Median of the
+            - float: Median of the samples
             - tuple: Credible interval (lower, upper) bounds
 
+        With ``n_chains`` set, samples have shape (n_chains, n_samples), the acceptance
+        rate is an array with one rate per chain, and the mean, median and credible
+        interval are pooled over all chains.
+
+        A chain stopped early by ``cancel`` returns the samples and statistics of the
+        iterations it ran, with ``truncated`` set on the result (and the token's
+        ``stopped_at``) and ``iterations`` recording how many ran.
+
     Example:
         >>> target_dist = target_distribution('exp(-0.5 * x**2) / sqrt(2 * pi)')
         >>> samples, time, acc_rate = metropolis_hastings(target_dist, proposal_distribution, 0.0, 10000, seed=42)
     """
-    # Set random seed if provided
-    if seed is not None:
-        np.random.seed(seed)
+    if n_chains is not None:
+        if not return_samples or checkpoint is not None or out is not None:
+            raise ValueError(
+                "return_samples=False, checkpoints and out are not supported with n_chains"
+            )
+        return _metropolis_hastings_chains(
+            target,
+            proposal,
+            initial,
+            iterations,
+            n_chains,
+            burn_in=burn_in,
+            thin=thin,
+            seed=seed,
+            credible_interval=credible_interval,
+            progress=progress,
+            cancel=cancel,
+        )
 
-    total_iterations = iterations + burn_in
-    samples = []
-    current = initial
-    accepted = 0
-    start_time = time.time()
+    _check_out(out, iterations, thin, return_samples)
+    steps = _metropolis_hastings_steps(
+        target,
+        proposal,
+        initial,
+        iterations,
+        burn_in=burn_in,
+        thin=thin,
+        seed=seed,
+        progress=progress,
+        cancel=cancel,
+        checkpoint=checkpoint,
+        resume=resume,
+    )
+    samples_array, run, sample_mean, sample_median, ci = _summarize(
+        steps, credible_interval, return_samples, out
+    )
 
-    with tqdm(total=total_iterations, desc="Sampling", unit="iteration") as pbar:
-        for i in range(total_iterations):
-            proposed = proposal(current)
-            acceptance_ratio = target(proposed) / target(current)
+    return SamplerResult(
+        (
+            samples_array,
+            run["elapsed_time"],
+            run["acceptance_rate"],
+            sample_mean,
+            sample_median,
+            ci,
+        ),
+        run["truncated"],
+        run["iterations"],
+    )
 
-            if np.random.rand() < acceptance_ratio:
-                current = proposed
-                if i >= burn_in:  # Only count acceptance after burn-in
-                    accepted += 1
 
-            if i >= burn_in and (i - burn_in) % thin == 0:
-                samples.append(current)
+def parallel_tempering(
+    target,
+    initial,
+    iterations,
+    temperatures=None,
+    n_temperatures=8,
+    max_temperature=100.0,
+    proposal_scale=1.0,
+    swap_interval=1,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    progress=None,
+    cancel=None,
+    return_samples=True,
+    out=None,
+):
+    """
+    Parallel tempering (replica exchange) for multimodal targets.
+
+    One random-walk replica runs at each temperature T of the ladder, sampling the
+    target density raised to the power 1 / T, and all replicas are advanced together
+    as one vectorized update per iteration. Hot replicas see a flattened target and
+    cross freely between its modes. Every ``swap_interval`` iterations, adjacent
+    replicas propose to exchange their states, alternating between the pairs
+    (0, 1), (2, 3), ... and (1, 2), (3, 4), ..., so that states found by hot replicas
+    travel down to the cold replica at T = 1, whose samples are returned.
+
+    Args:
+        target (Callable[[float], float]): Target distribution function. It must accept a
+            numpy array of replica states. Sampling runs in log space on its ``log_density``
+            when it has one (see ``target_distribution``)
+        initial (float): Initial value of every replica, or an array with one per temperature
+        iterations (int): Number of iterations to run
+        temperatures (list[float], optional): Increasing temperatures starting at 1.
+            Defaults to None (``temperature_ladder(n_temperatures, max_temperature)``)
+        n_temperatures (int, optional): Number of temperatures of the default ladder. Defaults to 8
+        max_temperature (float, optional): Hottest temperature of the default ladder. Defaults to 100.0
+        proposal_scale (float, optional): Standard deviation of the cold replica's Gaussian
+            proposal. The replica at temperature T proposes with ``proposal_scale * sqrt(T)``,
+            matching the width of its flattened target. Defaults to 1.0
+        swap_interval (int, optional): Iterations between swap proposals. Defaults to 1
+        burn_in (int, optional): Number of initial samples to discard. Defaults to 1000
+        thin (int, optional): Keep every nth sample. Defaults to 1
+        seed (int, optional): Random seed of the run's own ``numpy.random.Generator`` streams.
+            Defaults to None
+        credible_interval (float, optional): Credible interval level (0 to 1). Defaults to 0.95
+        progress (ProgressReporter, optional): Receives rate-limited progress updates. Defaults to
+            None (silent)
+        cancel (CancellationToken, optional): Token that stops the chain early, keeping
+            the samples so far (see ``library.cancellation``). Defaults to None
+        return_samples (bool, optional): Keep and return the samples, as for
+            ``metropolis_hastings``. Defaults to True
+        out (numpy.ndarray, optional): Array to write the samples into, as for
+            ``metropolis_hastings``. Defaults to None
+
+    Returns:
+        SamplerResult: A tuple containing:
+            - numpy.ndarray: Samples of the cold replica
+            - float: Elapsed time in seconds
+            - float: Acceptance rate of the cold replica between 0 and 1
+            - numpy.ndarray: Swap acceptance rate of each pair of adjacent temperatures,
+              from (T_0, T_1) to (T_{n-2}, T_{n-1})
+            - float: Mean of the samples
+            - float: Median of the samples
+            - tuple: Credible interval (lower, upper) bounds
 
-            pbar.update(1)
-            pbar.set_postfix(acceptance_rate=accepted / (max(1, len(samples) - 1)))
+    Raises:
+        ValueError: If the temperatures or swap_interval are invalid
 
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    acceptance_rate = accepted / iterations
+    Example:
+        >>> target_dist = target_distribution('exp(-(x - 5)**2 / 2) + exp(-(x + 5)**2 / 2)')
+        >>> samples, time, acc_rate, swap_rates, mean, median, ci = parallel_tempering(target_dist, 0.0, 10000, seed=42)
+    """
+    _check_out(out, iterations, thin, return_samples)
+    steps = _parallel_tempering_steps(
+        target,
+        initial,
+        iterations,
+        temperatures=temperatures,
+        n_temperatures=n_temperatures,
+        max_temperature=max_temperature,
+        proposal_scale=proposal_scale,
+        swap_interval=swap_interval,
+        burn_in=burn_in,
+        thin=thin,
+        seed=seed,
+        progress=progress,
+        cancel=cancel,
+    )
+    samples_array, run, sample_mean, sample_median, ci = _summarize(
+        steps, credible_interval, return_samples, out
+    )
 
-    samples_array = np.array(samples)
-    sample_mean = np.mean(samples_array)
-    sample_median = np.median(samples_array)
+    return SamplerResult(
+        (
+            samples_array,
+            run["elapsed_time"],
+            run["acceptance_rate"],
+            np.array(run["swap_rates"]),
+            sample_mean,
+            sample_median,
+            ci,
+        ),
+        run["truncated"],
+        run["iterations"],
+    )
 
-    # Calculate credible interval
-    alpha = (1 - credible_interval) / 2
-    ci_lower = np.percentile(samples_array, 100 * alpha)
-    ci_upper = np.percentile(samples_array, 100 * (1 - alpha))
 
-    return (
-        samples_array,
-        elapsed_time,
-        acceptance_rate,
-        sample_mean,
-        sample_median,
-        (ci_lower, ci_upper),
+def metropolis_adjusted_langevin(
+    target,
+    initial,
+    iterations,
+    step_size=1.0,
+    target_acceptance=0.574,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    progress=None,
+    cancel=None,
+    return_samples=True,
+    out=None,
+):
+    """
+    Metropolis-adjusted Langevin algorithm (MALA) with step-size adaptation during burn-in.
+
+    Proposals drift up the gradient of the log-density before adding Gaussian noise,
+    ``y = x + step_size**2 / 2 * grad log p(x) + step_size * N(0, 1)``, and are
+    accepted with the Metropolis-Hastings ratio corrected for the asymmetric proposal.
+    During burn-in the step size is tuned by dual averaging (Hoffman and Gelman, 2014)
+    towards ``target_acceptance``, and then kept fixed.
+
+    Args:
+        target (CompiledTarget): Target distribution from ``target_distribution``, whose
+            ``log_density_and_gradient`` gives the exact derivative of the log-density
+        initial (float): Initial value to start the chain
+        iterations (int): Number of iterations to run
+        step_size (float, optional): Initial step size. Defaults to 1.0
+        target_acceptance (float, optional): Acceptance rate the step size is tuned
+            towards; 0.574 is optimal for MALA. Defaults to 0.574
+        burn_in (int, optional): Number of initial samples to discard, during which the
+            step size adapts. Defaults to 1000
+        thin (int, optional): Keep every nth sample. Defaults to 1
+        seed (int, optional): Random seed for the run's own ``numpy.random.Generator``. Defaults to None
+        credible_interval (float, optional): Credible interval level (0 to 1). Defaults to 0.95
+        progress (ProgressReporter, optional): Receives rate-limited progress updates. Defaults to
+            None (silent)
+        cancel (CancellationToken, optional): Token that stops the chain early, keeping
+            the samples so far (see ``library.cancellation``). Defaults to None
+        return_samples (bool, optional): Keep and return the samples, as for
+            ``metropolis_hastings``. Defaults to True
+        out (numpy.ndarray, optional): Array to write the samples into, as for
+            ``metropolis_hastings``. Defaults to None
+
+    Returns:
+        SamplerResult: A tuple containing:
+            - numpy.ndarray: Array of samples from the target distribution
+            - float: Elapsed time in seconds
+            - float: Acceptance rate after burn-in between 0 and 1
+            - float: Step size after adaptation
+            - float: Mean of the samples
+            - float: Median of the samples
+            - tuple: Credible interval (lower, upper) bounds
+
+    Raises:
+        ValueError: If the target has no gradient or the step size is not positive
+
+    Example:
+        >>> target_dist = target_distribution('exp(-0.5 * x**2) / sqrt(2 * pi)')
+        >>> samples, time, acc_rate, step_size, mean, median, ci = metropolis_adjusted_langevin(target_dist, 0.0, 10000, seed=42)
+    """
+    _check_out(out, iterations, thin, return_samples)
+    steps = _metropolis_adjusted_langevin_steps(
+        target,
+        initial,
+        iterations,
+        step_size=step_size,
+        target_acceptance=target_acceptance,
+        burn_in=burn_in,
+        thin=thin,
+        seed=seed,
+        progress=progress,
+        cancel=cancel,
+    )
+    samples_array, run, sample_mean, sample_median, ci = _summarize(
+        steps, credible_interval, return_samples, out
+    )
+
+    return SamplerResult(
+        (
+            samples_array,
+            run["elapsed_time"],
+            run["acceptance_rate"],
+            run["step_size"],
+            sample_mean,
+            sample_median,
+            ci,
+        ),
+        run["truncated"],
+        run["iterations"],
+    )
+
+
+def hamiltonian_monte_carlo(
+    target,
+    initial,
+    iterations,
+    step_size=0.5,
+    n_leapfrog=10,
+    target_acceptance=0.8,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    progress=None,
+    cancel=None,
+    return_samples=True,
+    out=None,
+):
+    """
+    Hamiltonian Monte Carlo (HMC) with step-size adaptation during burn-in.
+
+    Each iteration draws a standard normal momentum and follows the Hamiltonian
+    dynamics of the log-density with leapfrog steps of its exact gradient, then
+    accepts the end point with the Metropolis ratio of the total energy. Long
+    trajectories make distant, nearly independent proposals that are still accepted
+    with high probability. The number of leapfrog steps is drawn uniformly from 1 to
+    ``n_leapfrog`` for every iteration, so that trajectories do not keep returning
+    close to their start on near-Gaussian targets, whose dynamics are periodic. The
+    step size is tuned during burn-in as for ``metropolis_adjusted_langevin``.
+
+    Args:
+        target (CompiledTarget): Target distribution from ``target_distribution``, whose
+            ``log_density_and_gradient`` gives the exact derivative of the log-density
+        initial (float): Initial value to start the chain
+        iterations (int): Number of iterations to run
+        step_size (float, optional): Initial leapfrog step size. Defaults to 0.5
+        n_leapfrog (int, optional): Most leapfrog steps per iteration, each costing one
+            gradient evaluation. Defaults to 10
+        target_acceptance (float, optional): Acceptance rate the step size is tuned
+            towards. Defaults to 0.8
+        burn_in (int, optional): Number of initial samples to discard, during which the
+            step size adapts. Defaults to 1000
+        thin (int, optional): Keep every nth sample. Defaults to 1
+        seed (int, optional): Random seed for the run's own ``numpy.random.Generator``. Defaults to None
+        credible_interval (float, optional): Credible interval level (0 to 1). Defaults to 0.95
+        progress (ProgressReporter, optional): Receives rate-limited progress updates. Defaults to
+            None (silent)
+        cancel (CancellationToken, optional): Token that stops the chain early, keeping
+            the samples so far (see ``library.cancellation``). Defaults to None
+        return_samples (bool, optional): Keep and return the samples, as for
+            ``metropolis_hastings``. Defaults to True
+        out (numpy.ndarray, optional): Array to write the samples into, as for
+            ``metropolis_hastings``. Defaults to None
+
+    Returns:
+        SamplerResult: A tuple containing:
+            - numpy.ndarray: Array of samples from the target distribution
+            - float: Elapsed time in seconds
+            - float: Acceptance rate after burn-in between 0 and 1
+            - float: Step size after adaptation
+            - float: Mean of the samples
+            - float: Median of the samples
+            - tuple: Credible interval (lower, upper) bounds
+
+    Raises:
+        ValueError: If the target has no gradient, the step size is not positive or
+            n_leapfrog is below 1
+
+    Example:
+        >>> target_dist = target_distribution('exp(-0.5 * x**2) / sqrt(2 * pi)')
+        >>> samples, time, acc_rate, step_size, mean, median, ci = hamiltonian_monte_carlo(target_dist, 0.0, 10000, seed=42)
+    """
+    _check_out(out, iterations, thin, return_samples)
+    steps = _hamiltonian_monte_carlo_steps(
+        target,
+        initial,
+        iterations,
+        step_size=step_size,
+        n_leapfrog=n_leapfrog,
+        target_acceptance=target_acceptance,
+        burn_in=burn_in,
+        thin=thin,
+        seed=seed,
+        progress=progress,
+        cancel=cancel,
+    )
+    samples_array, run, sample_mean, sample_median, ci = _summarize(
+        steps, credible_interval, return_samples, out
+    )
+
+    return SamplerResult(
+        (
+            samples_array,
+            run["elapsed_time"],
+            run["acceptance_rate"],
+            run["step_size"],
+            sample_mean,
+            sample_median,
+            ci,
+        ),
+        run["truncated"],
+        run["iterations"],
+    )
+
+
+def temperature_ladder(n_temperatures=8, max_temperature=100.0, temperatures=None):
+    """
+    Temperatures of a parallel tempering run.
+
+    The default ladder is geometric from 1 to ``max_temperature``, which gives
+    adjacent replicas similar swap rates when the target's log-density is roughly
+    quadratic around its modes.
+
+    Args:
+        n_temperatures (int, optional): Number of temperatures. Defaults to 8
+        max_temperature (float, optional): Hottest temperature. Defaults to 100.0
+        temperatures (list[float], optional): Explicit temperatures, which are only
+            checked. Defaults to None
+
+    Returns:
+        numpy.ndarray: Increasing temperatures, starting at 1
+
+    Raises:
+        ValueError: If the temperatures do not increase strictly from 1
+    """
+    if temperatures is None:
+        if n_temperatures < 1:
+            raise ValueError("n_temperatures must be at least 1")
+        if max_temperature < 1:
+            raise ValueError("max_temperature must be at least 1")
+        if n_temperatures == 1:
+            return np.ones(1)
+        return np.geomspace(1.0, max_temperature, n_temperatures)
+
+    temperatures = np.asarray(temperatures, dtype=float)
+    if temperatures.ndim != 1 or len(temperatures) == 0 or temperatures[0] != 1:
+        raise ValueError("temperatures must be a list starting at 1")
+    if np.any(np.diff(temperatures) <= 0):
+        raise ValueError("temperatures must be strictly increasing")
+    return temperatures
+
+
+def metropolis_hastings_stream(
+    target,
+    proposal,
+    initial,
+    iterations,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    chunk_size=10000,
+    progress=None,
+    cancel=None,
+):
+    """
+    Metropolis-Hastings algorithm that yields its samples in chunks as the chain runs.
+
+    Only the chunk being filled is held in memory, so memory use does not grow with
+    the number of iterations. For the same arguments the concatenated chunks equal
+    the samples returned by ``metropolis_hastings``.
+
+    Args:
+        target (Callable[[float], float]): Target distribution function, as for ``metropolis_hastings``
+        proposal (Callable[[float], float]): Proposal distribution function, as for ``metropolis_hastings``
+        initial (float): Initial value to start the chain
+        iterations (int): Number of iterations to run
+        burn_in (int, optional): Number of initial samples to discard. Defaults to 1000
+        thin (int, optional): Keep every nth sample. Defaults to 1
+        seed (int, optional): Random seed for the run's own ``numpy.random.Generator``. Defaults to None
+        credible_interval (float, optional): Credible interval level (0 to 1) of the summary. Defaults to 0.95
+        chunk_size (int, optional): Maximum number of samples per chunk. Defaults to 10000
+        progress (ProgressReporter, optional): Receives rate-limited progress updates. Defaults to
+            None (silent)
+        cancel (CancellationToken, optional): Token that stops the chain early, keeping
+            the samples so far (see ``library.cancellation``). Defaults to None
+
+    Returns:
+        SampleStream: Iterator over 1-D arrays of samples. Once exhausted its ``summary``
+            holds the elapsed time, acceptance rate, sample moments and estimated quantiles,
+            and whether a cancellation token stopped the chain early ('truncated')
+
+    Example:
+        >>> stream = metropolis_hastings_stream(target_dist, proposal_distribution, 0.0, 10**7, seed=42)
+        >>> for chunk in stream:
+        ...     handle(chunk)
+        >>> stream.summary["acceptance_rate"]
+    """
+    return SampleStream(
+        _metropolis_hastings_steps(
+            target,
+            proposal,
+            initial,
+            iterations,
+            burn_in=burn_in,
+            thin=thin,
+            seed=seed,
+            chunk_size=chunk_size,
+            progress=progress,
+            cancel=cancel,
+        ),
+        credible_interval=credible_interval,
+    )
+
+
+def adaptive_metropolis_hastings_stream(
+    target,
+    initial,
+    iterations,
+    initial_variance=1.0,
+    check_interval=200,
+    increase_factor=1.1,
+    decrease_factor=0.9,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    chunk_size=10000,
+    progress=None,
+    cancel=None,
+):
+    """
+    Adaptive Metropolis-Hastings algorithm that yields its samples in chunks as the chain runs.
+
+    The streaming counterpart of ``adaptive_metropolis_hastings``; see
+    ``metropolis_hastings_stream``. The summary additionally holds the acceptance
+    rates at each check interval.
+
+    Returns:
+        SampleStream: Iterator over 1-D arrays of samples with a ``summary`` once exhausted
+    """
+    return SampleStream(
+        _adaptive_metropolis_hastings_steps(
+            target,
+            initial,
+            iterations,
+            initial_variance=initial_variance,
+            check_interval=check_interval,
+            increase_factor=increase_factor,
+            decrease_factor=decrease_factor,
+            burn_in=burn_in,
+            thin=thin,
+            seed=seed,
+            chunk_size=chunk_size,
+            progress=progress,
+            cancel=cancel,
+        ),
+        credible_interval=credible_interval,
+    )
+
+
+def parallel_tempering_stream(
+    target,
+    initial,
+    iterations,
+    temperatures=None,
+    n_temperatures=8,
+    max_temperature=100.0,
+    proposal_scale=1.0,
+    swap_interval=1,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    chunk_size=10000,
+    progress=None,
+    cancel=None,
+):
+    """
+    Parallel tempering that yields the cold replica's samples in chunks as it runs.
+
+    The streaming counterpart of ``parallel_tempering``; see
+    ``metropolis_hastings_stream``. The summary additionally holds the temperatures
+    and the swap rate of each pair of adjacent temperatures.
+
+    Returns:
+        SampleStream: Iterator over 1-D arrays of samples with a ``summary`` once exhausted
+    """
+    return SampleStream(
+        _parallel_tempering_steps(
+            target,
+            initial,
+            iterations,
+            temperatures=temperatures,
+            n_temperatures=n_temperatures,
+            max_temperature=max_temperature,
+            proposal_scale=proposal_scale,
+            swap_interval=swap_interval,
+            burn_in=burn_in,
+            thin=thin,
+            seed=seed,
+            chunk_size=chunk_size,
+            progress=progress,
+            cancel=cancel,
+        ),
+        credible_interval=credible_interval,
+    )
+
+
+def metropolis_adjusted_langevin_stream(
+    target,
+    initial,
+    iterations,
+    step_size=1.0,
+    target_acceptance=0.574,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    chunk_size=10000,
+    progress=None,
+    cancel=None,
+):
+    """
+    MALA that yields its samples in chunks as the chain runs.
+
+    The streaming counterpart of ``metropolis_adjusted_langevin``; see
+    ``metropolis_hastings_stream``. The summary additionally holds the adapted
+    step size.
+
+    Returns:
+        SampleStream: Iterator over 1-D arrays of samples with a ``summary`` once exhausted
+    """
+    return SampleStream(
+        _metropolis_adjusted_langevin_steps(
+            target,
+            initial,
+            iterations,
+            step_size=step_size,
+            target_acceptance=target_acceptance,
+            burn_in=burn_in,
+            thin=thin,
+            seed=seed,
+            chunk_size=chunk_size,
+            progress=progress,
+            cancel=cancel,
+        ),
+        credible_interval=credible_interval,
+    )
+
+
+def hamiltonian_monte_carlo_stream(
+    target,
+    initial,
+    iterations,
+    step_size=0.5,
+    n_leapfrog=10,
+    target_acceptance=0.8,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    chunk_size=10000,
+    progress=None,
+    cancel=None,
+):
+    """
+    HMC that yields its samples in chunks as the chain runs.
+
+    The streaming counterpart of ``hamiltonian_monte_carlo``; see
+    ``metropolis_hastings_stream``. The summary additionally holds the adapted
+    step size.
+
+    Returns:
+        SampleStream: Iterator over 1-D arrays of samples with a ``summary`` once exhausted
+    """
+    return SampleStream(
+        _hamiltonian_monte_carlo_steps(
+            target,
+            initial,
+            iterations,
+            step_size=step_size,
+            n_leapfrog=n_leapfrog,
+            target_acceptance=target_acceptance,
+            burn_in=burn_in,
+            thin=thin,
+            seed=seed,
+            chunk_size=chunk_size,
+            progress=progress,
+            cancel=cancel,
+        ),
+        credible_interval=credible_interval,
+    )
+
+
+class SamplerResult(tuple):
+    """
+    Tuple of a sampler's results, which also says whether the chain ran to the end.
+
+    It unpacks exactly like a plain tuple, so only callers that stop runs early need
+    to look at its attributes.
+
+    Attributes:
+        truncated (bool): Whether the chain was stopped early by its ``cancel`` token,
+            so that the samples and statistics are those of the iterations it ran
+        iterations (int): Iterations the chain ran, burn-in included
+    """
+
+    def __new__(cls, values, truncated=False, iterations=None):
+        result = super().__new__(cls, values)
+        result.truncated = truncated
+        result.iterations = iterations
+        return result
+
+
+class SampleStream:
+    """
+    Iterator over the chunks of samples produced by a running chain.
+
+    The mean and standard deviation are accumulated exactly, chunk by chunk, and
+    the median and credible interval are estimated with a ``QuantileSketch``
+    (within 0.5% relative error, see ``library.summary``), so the summary needs no
+    more memory than a single chunk. Closing the stream early stops the chain.
+
+    Args:
+        steps (Generator): A chain's step generator
+        credible_interval (float, optional): Credible interval level (0 to 1). Defaults to 0.95
+
+    Attributes:
+        summary (dict): None until the stream is exhausted, then a dictionary with
+            'n_samples', 'elapsed_time', 'acceptance_rate', 'truncated', 'iterations'
+            (run, burn-in included), 'mean', 'std', 'median' and 'credible_interval'
+            (and 'acceptance_rates' for adaptive runs)
+    """
+
+    def __init__(self, steps, credible_interval=0.95):
+        self._steps = steps
+        self.credible_interval = credible_interval
+        self.moments = RunningMoments()
+        self.sketch = QuantileSketch()
+        self.summary = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._steps)
+        except StopIteration as stop:
+            alpha = (1 - self.credible_interval) / 2
+            median, ci_lower, ci_upper = self.sketch.quantile([0.5, alpha, 1 - alpha])
+            self.summary = {
+                "n_samples": self.moments.count,
+                **stop.value,
+                "mean": self.moments.mean if self.moments.count else float("nan"),
+                "std": self.moments.std,
+                "median": float(median),
+                "credible_interval": (float(ci_lower), float(ci_upper)),
+            }
+            raise
+        self.moments.add(chunk)
+        self.sketch.add(chunk)
+        return chunk
+
+    def close(self):
+        """Stop the chain without running it to completion."""
+        self._steps.close()
+
+    def run(self):
+        """Run the chain to completion, discarding the samples, and return the summary."""
+        for _ in self:
+            pass
+        return self.summary
+
+
+def _record_run(sampler, iterations, elapsed_time):
+    """Report a completed run to the sampler metrics."""
+    SAMPLER_RUNS.inc(sampler=sampler)
+    SAMPLER_ITERATIONS.inc(iterations, sampler=sampler)
+    SAMPLER_SECONDS.inc(max(0.0, elapsed_time), sampler=sampler)
+    if elapsed_time > 0:
+        SAMPLER_THROUGHPUT.observe(iterations / elapsed_time, sampler=sampler)
+
+
+def _completed(cancel, last_iteration, total_iterations):
+    """
+    Iterations a chain ran, given the last one, noting on ``cancel`` if it stopped early.
+
+    Returns:
+        tuple: The completed iterations and whether the chain stopped early
+    """
+    completed = last_iteration + 1
+    truncated = completed < total_iterations
+    if truncated:
+        cancel.stopped_at = completed
+    return completed, truncated
+
+
+def log_density_function(target):
+    """
+    Return the log-density of a target distribution.
+
+    Targets compiled by ``target_distribution`` carry a symbolically simplified
+    ``log_density``; for any other density function the log is taken numerically.
+
+    Args:
+        target (Callable[[float], float]): Target distribution function
+
+    Returns:
+        Callable[[float], float]: Log-density function
+    """
+    log_density = getattr(target, "log_density", None)
+    if log_density is not None:
+        return log_density
+    return lambda x: np.log(target(x))
+
+
+def _random_stream(
+    rng, total_iterations, n_chains=None, normal=True, start=0, cancel=None
+):
+    """
+    Yield (iteration, standard normal, log-uniform) variates for every iteration.
+
+    Variates are drawn from ``rng`` in blocks of ``RNG_BLOCK_SIZE`` iterations into
+    two preallocated buffers that are refilled as each block runs out, so the
+    sampler loop makes no per-iteration NumPy random calls. The sequence depends
+    only on the Generator's seed and the block size.
+
+    With ``n_chains`` set, each variate is an array with one value per chain;
+    otherwise it is a Python float. With ``normal=False`` no normal variates are
+    drawn and None is yielded in their place. A chain resumed from a checkpoint
+    starts at iteration ``start``, which is a multiple of ``RNG_BLOCK_SIZE``. The
+    stream ends early, between blocks, once the ``cancel`` token asks runs to stop.
+    """
+    shape = (RNG_BLOCK_SIZE,) if n_chains is None else (RNG_BLOCK_SIZE, n_chains)
+    noise = np.empty(shape)
+    log_uniforms = np.empty(shape)
+
+    for block_start in range(start, total_iterations, RNG_BLOCK_SIZE):
+        if cancel is not None and cancel.stop_requested():
+            return
+        size = min(RNG_BLOCK_SIZE, total_iterations - block_start)
+        if normal:
+            rng.standard_normal(out=noise[:size])
+        rng.random(out=log_uniforms[:size])
+        np.log(log_uniforms[:size], out=log_uniforms[:size])
+
+        block_noise = noise[:size] if normal else itertools.repeat(None)
+        block_log_uniforms = log_uniforms[:size]
+        if n_chains is None:
+            # Python floats are much cheaper than NumPy scalars in the scalar loop
+            block_log_uniforms = block_log_uniforms.tolist()
+            if normal:
+                block_noise = block_noise.tolist()
+        yield from zip(
+            range(block_start, block_start + size), block_noise, block_log_uniforms
+        )
+
+
+def _bind_proposal(proposal, rng, seed):
+    """
+    Make a custom proposal draw reproducibly for a seeded run.
+
+    Proposals that accept an ``rng`` keyword argument are bound to the run's Generator.
+    Others can only draw from the legacy global random state, which is seeded instead.
+    """
+    try:
+        parameters = inspect.signature(proposal).parameters
+    except (TypeError, ValueError):  # Builtins and other callables without a signature
+        parameters = {}
+    if "rng" in parameters:
+        return functools.partial(proposal, rng=rng)
+    if seed is not None:
+        np.random.seed(seed)
+    return proposal
+
+
+def _chain_log_density(log_target, states):
+    """Evaluate a log-density on an array of chain states, broadcasting constants."""
+    return np.broadcast_to(log_target(states), states.shape)
+
+
+def _initial_states(initial, n_chains):
+    """Broadcast a scalar or per-chain initial value to an array of chain states."""
+    if n_chains < 1:
+        raise ValueError("n_chains must be at least 1")
+    return np.broadcast_to(np.asarray(initial, dtype=float), (n_chains,)).copy()
+
+
+def _pooled_statistics(samples_array, credible_interval):
+    """Mean, median and credible interval of all samples pooled across chains."""
+    pooled = samples_array.ravel()
+    if not pooled.size:
+        # A chain stopped early, before it kept any samples
+        return np.nan, np.nan, (np.nan, np.nan)
+    alpha = (1 - credible_interval) / 2
+    ci_lower = np.percentile(pooled, 100 * alpha)
+    ci_upper = np.percentile(pooled, 100 * (1 - alpha))
+    return np.mean(pooled), np.median(pooled), (ci_lower, ci_upper)
+
+
+def _metropolis_hastings_steps(
+    target,
+    proposal,
+    initial,
+    iterations,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    chunk_size=COLLECT_CHUNK_SIZE,
+    progress=None,
+    cancel=None,
+    checkpoint=None,
+    resume=False,
+):
+    """
+    Run one Metropolis-Hastings chain, yielding arrays of at most ``chunk_size`` samples.
+
+    The generator returns a dictionary with the elapsed time and acceptance rate.
+    With a ``checkpoint`` the chain is saved periodically, and with ``resume`` it
+    first yields the checkpoint's samples and then continues from its state.
+    """
+    rng = np.random.default_rng(seed)
+    # The default Gaussian random walk draws its noise from the run's Generator
+    random_walk = proposal is proposal_distribution
+    if not random_walk:
+        proposal = _bind_proposal(proposal, rng, seed)
+    log_target = log_density_function(target)
+    total_iterations = iterations + burn_in
+    samples = []
+    current = initial
+    accepted = 0
+    start_iteration = 0
+    elapsed_time = 0.0
+
+    checkpointer = _chain_checkpointer(
+        checkpoint,
+        resume,
+        {
+            "sampler": "mh",
+            "initial": initial,
+            "iterations": iterations,
+            "burn_in": burn_in,
+            "thin": thin,
+            "seed": seed,
+        },
+        rng_bound=random_walk or isinstance(proposal, functools.partial),
+    )
+    if resume:
+        state, series = checkpointer.restore()
+        rng.bit_generator.state = state["rng"]
+        current = state["current"]
+        accepted = state["accepted"]
+        start_iteration = state["iteration"]
+        elapsed_time = state["elapsed_time"]
+        yield from _split_chunks(series["samples"], chunk_size)
+
+    current_log_density = log_target(current)
+    start_time = time.time() - elapsed_time
+    next_checkpoint = _next_checkpoint(checkpointer, start_iteration)
+
+    progress = NullProgress() if progress is None else progress
+    next_report = (start_iteration // progress.every + 1) * progress.every
+    progress.start(total_iterations)
+
+    with progress, np.errstate(divide="ignore", invalid="ignore"):
+        i = start_iteration - 1
+        for i, noise, log_uniform in _random_stream(
+            rng,
+            total_iterations,
+            normal=random_walk,
+            start=start_iteration,
+            cancel=cancel,
+        ):
+            proposed = current + noise if random_walk else proposal(current)
+            proposed_log_density = log_target(proposed)
+            log_acceptance_ratio = proposed_log_density - current_log_density
+
+            if log_uniform < log_acceptance_ratio:
+                current = proposed
+                current_log_density = proposed_log_density
+                if i >= burn_in:  # Only count acceptance after burn-in
+                    accepted += 1
+
+            if i >= burn_in and (i - burn_in) % thin == 0:
+                samples.append(current)
+                if len(samples) == chunk_size:
+                    yield _chunk(samples, checkpointer)
+                    samples = []
+
+            if i + 1 == next_checkpoint:
+                next_checkpoint += RNG_BLOCK_SIZE
+                # A chain stopped early is saved as it stops, so it can be resumed
+                if checkpointer.checkpoint.due() or (
+                    cancel is not None and cancel.stop_requested()
+                ):
+                    checkpointer.save(
+                        {
+                            "iteration": i + 1,
+                            "current": current,
+                            "accepted": accepted,
+                            "elapsed_time": time.time() - start_time,
+                            "rng": rng.bit_generator.state,
+                        },
+                        samples,
+                    )
+
+            if i + 1 == next_report:
+                next_report += progress.every
+                progress.update(
+                    i + 1, acceptance_rate=accepted / max(1, i + 1 - burn_in)
+                )
+
+        completed, truncated = _completed(cancel, i, total_iterations)
+        acceptance_rate = accepted / max(1, completed - burn_in)
+        progress.finish(completed, acceptance_rate=acceptance_rate)
+
+    if samples:
+        yield np.array(samples)
+    # Only the iterations run by this process, not those restored from a checkpoint
+    _record_run(
+        "mh",
+        completed - start_iteration,
+        time.time() - start_time - elapsed_time,
+    )
+    return {
+        "elapsed_time": time.time() - start_time,
+        "acceptance_rate": acceptance_rate,
+        "truncated": truncated,
+        "iterations": completed,
+    }
+
+
+def _adaptive_metropolis_hastings_steps(
+    target,
+    initial,
+    iterations,
+    initial_variance=1.0,
+    check_interval=200,
+    increase_factor=1.1,
+    decrease_factor=0.9,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    chunk_size=COLLECT_CHUNK_SIZE,
+    progress=None,
+    cancel=None,
+    checkpoint=None,
+    resume=False,
+):
+    """
+    Run one adaptive Metropolis-Hastings chain, yielding arrays of at most ``chunk_size`` samples.
+
+    The generator returns a dictionary with the elapsed time, the overall acceptance
+    rate and the acceptance rates at each check interval. Checkpoints work as in
+    ``_metropolis_hastings_steps``, and also save the proposal variance, the
+    interval counters and the acceptance rates so far.
+    """
+    rng = np.random.default_rng(seed)
+    log_target = log_density_function(target)
+    total_iterations = iterations + burn_in
+    samples = []
+    current = initial
+    variance = initial_variance
+    acceptance_rates = []
+    interval_accepted = 0
+    interval_count = 0
+    start_iteration = 0
+    elapsed_time = 0.0
+
+    checkpointer = _chain_checkpointer(
+        checkpoint,
+        resume,
+        {
+            "sampler": "amh",
+            "initial": initial,
+            "iterations": iterations,
+            "initial_variance": initial_variance,
+            "check_interval": check_interval,
+            "increase_factor": increase_factor,
+            "decrease_factor": decrease_factor,
+            "burn_in": burn_in,
+            "thin": thin,
+            "seed": seed,
+        },
+    )
+    if resume:
+        state, series = checkpointer.restore()
+        rng.bit_generator.state = state["rng"]
+        current = state["current"]
+        variance = state["variance"]
+        interval_accepted = state["interval_accepted"]
+        interval_count = state["interval_count"]
+        acceptance_rates = series["acceptance_rates"].tolist()
+        start_iteration = state["iteration"]
+        elapsed_time = state["elapsed_time"]
+        yield from _split_chunks(series["samples"], chunk_size)
+
+    current_log_density = log_target(current)
+    scale = np.sqrt(variance)
+    start_time = time.time() - elapsed_time
+    next_checkpoint = _next_checkpoint(checkpointer, start_iteration)
+
+    progress = NullProgress() if progress is None else progress
+    next_report = (start_iteration // progress.every + 1) * progress.every
+    progress.start(total_iterations)
+
+    with progress, np.errstate(divide="ignore", invalid="ignore"):
+        i = start_iteration - 1
+        for i, noise, log_uniform in _random_stream(
+            rng, total_iterations, start=start_iteration, cancel=cancel
+        ):
+            # Propose new value
+            proposed = current + scale * noise
+            proposed_log_density = log_target(proposed)
+            log_acceptance_ratio = proposed_log_density - current_log_density
+
+            if log_uniform < log_acceptance_ratio:
+                current = proposed
+                current_log_density = proposed_log_density
+                interval_accepted += 1
+
+            # Store sample if past burn-in and meets thinning criteria
+            if i >= burn_in and (i - burn_in) % thin == 0:
+                samples.append(current)
+                if len(samples) == chunk_size:
+                    yield _chunk(samples, checkpointer)
+                    samples = []
+
+            # Check acceptance rate at each interval
+            interval_count += 1
+            if interval_count == check_interval:
+                acceptance_rate = interval_accepted / check_interval
+                variance = adaptive_proposal_distribution(
+                    variance, acceptance_rate, increase_factor, decrease_factor
+                )
+                scale = np.sqrt(variance)
+                acceptance_rates.append(acceptance_rate)
+                interval_accepted = 0
+                interval_count = 0
+
+            if i + 1 == next_checkpoint:
+                next_checkpoint += RNG_BLOCK_SIZE
+                # A chain stopped early is saved as it stops, so it can be resumed
+                if checkpointer.checkpoint.due() or (
+                    cancel is not None and cancel.stop_requested()
+                ):
+                    checkpointer.save(
+                        {
+                            "iteration": i + 1,
+                            "current": current,
+                            "variance": variance,
+                            "interval_accepted": interval_accepted,
+                            "interval_count": interval_count,
+                            "elapsed_time": time.time() - start_time,
+                            "rng": rng.bit_generator.state,
+                        },
+                        samples,
+                        acceptance_rates,
+                    )
+
+            if i + 1 == next_report:
+                next_report += progress.every
+                progress.update(
+                    i + 1, acceptance_rate=interval_accepted / max(1, interval_count)
+                )
+
+        completed, truncated = _completed(cancel, i, total_iterations)
+        progress.finish(
+            completed,
+            acceptance_rate=np.mean(acceptance_rates) if acceptance_rates else 0,
+        )
+
+    if samples:
+        yield np.array(samples)
+    # Only the iterations run by this process, not those restored from a checkpoint
+    _record_run(
+        "amh",
+        completed - start_iteration,
+        time.time() - start_time - elapsed_time,
+    )
+    return {
+        "elapsed_time": time.time() - start_time,
+        "acceptance_rate": np.mean(acceptance_rates) if acceptance_rates else 0,
+        "acceptance_rates": acceptance_rates,
+        "truncated": truncated,
+        "iterations": completed,
+    }
+
+
+def _parallel_tempering_steps(
+    target,
+    initial,
+    iterations,
+    temperatures=None,
+    n_temperatures=8,
+    max_temperature=100.0,
+    proposal_scale=1.0,
+    swap_interval=1,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    chunk_size=COLLECT_CHUNK_SIZE,
+    progress=None,
+    cancel=None,
+):
+    """
+    Run parallel tempering, yielding arrays of at most ``chunk_size`` cold-replica samples.
+
+    The generator returns a dictionary with the elapsed time, the cold replica's
+    acceptance rate, the temperatures and the swap rate of each adjacent pair.
+    """
+    temperatures = temperature_ladder(n_temperatures, max_temperature, temperatures)
+    if swap_interval < 1:
+        raise ValueError("swap_interval must be at least 1")
+    n_replicas = len(temperatures)
+    betas = 1 / temperatures
+    scales = proposal_scale * np.sqrt(temperatures)
+
+    # Swaps draw from a stream of their own, so the moves do not depend on swap_interval
+    move_seed, swap_seed = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(move_seed)
+    log_target = log_density_function(target)
+    total_iterations = iterations + burn_in
+    swap_stream = _random_stream(
+        np.random.default_rng(swap_seed),
+        total_iterations // swap_interval,
+        n_replicas - 1,
+        normal=False,
+    )
+    pairs = np.arange(n_replicas - 1)
+    swaps_proposed = np.zeros(n_replicas - 1, dtype=np.int64)
+    swaps_accepted = np.zeros(n_replicas - 1, dtype=np.int64)
+    current = _initial_states(initial, n_replicas)
+    samples = []
+    accepted = 0
+    start_time = time.time()
+
+    progress = NullProgress() if progress is None else progress
+    next_report = progress.every
+    progress.start(total_iterations)
+
+    with progress, np.errstate(divide="ignore", invalid="ignore"):
+        current_log_density = _chain_log_density(log_target, current)
+        i = -1
+        for i, noise, log_uniform in _random_stream(
+            rng, total_iterations, n_replicas, cancel=cancel
+        ):
+            proposed = current + scales * noise
+            proposed_log_density = _chain_log_density(log_target, proposed)
+            # Each replica targets the density raised to the power of its beta = 1 / T
+            log_acceptance_ratio = betas * (proposed_log_density - current_log_density)
+
+            accept = log_uniform < log_acceptance_ratio
+            current = np.where(accept, proposed, current)
+            current_log_density = np.where(
+                accept, proposed_log_density, current_log_density
+            )
+            if i >= burn_in and accept[0]:  # Only count acceptance after burn-in
+                accepted += 1
+
+            if (i + 1) % swap_interval == 0 and n_replicas > 1:
+                swap_round, _, swap_log_uniform = next(swap_stream)
+                # Alternate between even and odd pairs, so no replica is in two pairs
+                lower = pairs[swap_round % 2 :: 2]
+                upper = lower + 1
+                log_swap_ratio = (betas[lower] - betas[upper]) * (
+                    current_log_density[upper] - current_log_density[lower]
+                )
+                swap = swap_log_uniform[lower] < log_swap_ratio
+                if i >= burn_in:
+                    swaps_proposed[lower] += 1
+                    swaps_accepted[lower[swap]] += 1
+                lower, upper = lower[swap], upper[swap]
+                current[lower], current[upper] = current[upper], current[lower]
+                current_log_density[lower], current_log_density[upper] = (
+                    current_log_density[upper],
+                    current_log_density[lower],
+                )
+
+            if i >= burn_in and (i - burn_in) % thin == 0:
+                samples.append(float(current[0]))
+                if len(samples) == chunk_size:
+                    yield np.array(samples)
+                    samples = []
+
+            if i + 1 == next_report:
+                next_report += progress.every
+                progress.update(
+                    i + 1, acceptance_rate=accepted / max(1, i + 1 - burn_in)
+                )
+
+        completed, truncated = _completed(cancel, i, total_iterations)
+        acceptance_rate = accepted / max(1, completed - burn_in)
+        progress.finish(completed, acceptance_rate=acceptance_rate)
+
+    if samples:
+        yield np.array(samples)
+    _record_run("pt", completed, time.time() - start_time)
+    return {
+        "elapsed_time": time.time() - start_time,
+        "acceptance_rate": acceptance_rate,
+        "truncated": truncated,
+        "iterations": completed,
+        "temperatures": temperatures.tolist(),
+        "swap_rates": (swaps_accepted / np.maximum(swaps_proposed, 1)).tolist(),
+    }
+
+
+def _gradient_functions(target, step_size):
+    """
+    The log-density-and-gradient and gradient functions of a target, checked.
+
+    A compiled target's gradient is compiled here, on first use, so a target that
+    is not differentiable raises ValueError before the chain starts.
+    """
+    log_density_and_gradient = getattr(target, "log_density_and_gradient", None)
+    if log_density_and_gradient is None:
+        raise ValueError(
+            "Gradient-based samplers need a target with a symbolic gradient, "
+            "as compiled by target_distribution"
+        )
+    if step_size <= 0:
+        raise ValueError("step_size must be positive")
+    return log_density_and_gradient, target.log_density_gradient
+
+
+class _StepSizeAdapter:
+    """
+    Dual averaging of a step size towards a target acceptance rate.
+
+    Follows Hoffman and Gelman (2014), Algorithm 5, with their default constants.
+    ``update`` returns the step size for the next burn-in iteration; once burn-in
+    is over, ``step_size`` is the average that the chain keeps.
+    """
+
+    def __init__(self, step_size, target_acceptance, gamma=0.05, t0=10, kappa=0.75):
+        if not 0 < target_acceptance < 1:
+            raise ValueError("target_acceptance must be between 0 and 1")
+        self.target_acceptance = target_acceptance
+        self.gamma = gamma
+        self.t0 = t0
+        self.kappa = kappa
+        self._mu = np.log(10 * step_size)
+        self._count = 0
+        self._error = 0.0
+        self._log_average = np.log(step_size)
+
+    @property
+    def step_size(self):
+        """The averaged step size to sample with after burn-in."""
+        return float(np.exp(self._log_average))
+
+    def update(self, log_acceptance_ratio):
+        """Record one iteration's acceptance probability and return the next step size."""
+        if np.isnan(log_acceptance_ratio):
+            acceptance = 0.0
+        else:
+            acceptance = float(np.exp(min(0.0, log_acceptance_ratio)))
+        self._count += 1
+        weight = 1 / (self._count + self.t0)
+        self._error += weight * (self.target_acceptance - acceptance - self._error)
+        log_step = self._mu - np.sqrt(self._count) / self.gamma * self._error
+        eta = self._count**-self.kappa
+        self._log_average = eta * log_step + (1 - eta) * self._log_average
+        return float(np.exp(log_step))
+
+
+def _metropolis_adjusted_langevin_steps(
+    target,
+    initial,
+    iterations,
+    step_size=1.0,
+    target_acceptance=0.574,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    chunk_size=COLLECT_CHUNK_SIZE,
+    progress=None,
+    cancel=None,
+):
+    """
+    Run one MALA chain, yielding arrays of at most ``chunk_size`` samples.
+
+    The generator returns a dictionary with the elapsed time, the acceptance rate
+    and the step size after adaptation.
+    """
+    log_density_and_gradient, _ = _gradient_functions(target, step_size)
+    adapter = _StepSizeAdapter(step_size, target_acceptance)
+    rng = np.random.default_rng(seed)
+    total_iterations = iterations + burn_in
+    samples = []
+    current = float(initial)
+    accepted = 0
+    start_time = time.time()
+
+    progress = NullProgress() if progress is None else progress
+    next_report = progress.every
+    progress.start(total_iterations)
+
+    with progress, np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        current_log_density, current_gradient = log_density_and_gradient(current)
+        i = -1
+        for i, noise, log_uniform in _random_stream(
+            rng, total_iterations, cancel=cancel
+        ):
+            drift = 0.5 * step_size * step_size
+            proposed = current + drift * current_gradient + step_size * noise
+            proposed_log_density, proposed_gradient = log_density_and_gradient(proposed)
+            # The forward move's standardized noise is `noise`; this is the reverse move's
+            reverse_noise = (current - proposed - drift * proposed_gradient) / step_size
+            log_acceptance_ratio = (
+                proposed_log_density
+                - current_log_density
+                + 0.5 * (noise * noise - reverse_noise * reverse_noise)
+            )
+
+            if log_uniform < log_acceptance_ratio:
+                current = proposed
+                current_log_density = proposed_log_density
+                current_gradient = proposed_gradient
+                if i >= burn_in:  # Only count acceptance after burn-in
+                    accepted += 1
+
+            if i < burn_in:
+                step_size = adapter.update(log_acceptance_ratio)
+                if i + 1 == burn_in:
+                    step_size = adapter.step_size
+            elif (i - burn_in) % thin == 0:
+                samples.append(current)
+                if len(samples) == chunk_size:
+                    yield np.array(samples, dtype=float)
+                    samples = []
+
+            if i + 1 == next_report:
+                next_report += progress.every
+                progress.update(
+                    i + 1, acceptance_rate=accepted / max(1, i + 1 - burn_in)
+                )
+
+        completed, truncated = _completed(cancel, i, total_iterations)
+        acceptance_rate = accepted / max(1, completed - burn_in)
+        progress.finish(completed, acceptance_rate=acceptance_rate)
+
+    if samples:
+        yield np.array(samples, dtype=float)
+    _record_run("mala", completed, time.time() - start_time)
+    return {
+        "elapsed_time": time.time() - start_time,
+        "acceptance_rate": acceptance_rate,
+        "truncated": truncated,
+        "iterations": completed,
+        "step_size": float(step_size),
+    }
+
+
+def _hamiltonian_monte_carlo_steps(
+    target,
+    initial,
+    iterations,
+    step_size=0.5,
+    n_leapfrog=10,
+    target_acceptance=0.8,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    chunk_size=COLLECT_CHUNK_SIZE,
+    progress=None,
+    cancel=None,
+):
+    """
+    Run one HMC chain, yielding arrays of at most ``chunk_size`` samples.
+
+    The generator returns a dictionary with the elapsed time, the acceptance rate
+    and the step size after adaptation.
+    """
+    log_density_and_gradient, log_density_gradient = _gradient_functions(
+        target, step_size
+    )
+    if n_leapfrog < 1:
+        raise ValueError("n_leapfrog must be at least 1")
+    adapter = _StepSizeAdapter(step_size, target_acceptance)
+    # Trajectory lengths draw from a stream of their own, beside the momenta's
+    momentum_seed, length_seed = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(momentum_seed)
+    length_rng = np.random.default_rng(length_seed)
+    total_iterations = iterations + burn_in
+    samples = []
+    current = float(initial)
+    accepted = 0
+    start_time = time.time()
+
+    progress = NullProgress() if progress is None else progress
+    next_report = progress.every
+    progress.start(total_iterations)
+
+    with progress, np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        current_log_density, current_gradient = log_density_and_gradient(current)
+        i = -1
+        for i, momentum, log_uniform in _random_stream(
+            rng, total_iterations, cancel=cancel
+        ):
+            if i % RNG_BLOCK_SIZE == 0:
+                lengths = length_rng.integers(
+                    1, n_leapfrog, RNG_BLOCK_SIZE, endpoint=True
+                )
+                lengths = lengths.tolist()
+
+            # Leapfrog integration, with the half steps of the momentum merged
+            initial_momentum = momentum
+            position = current
+            momentum += 0.5 * step_size * current_gradient
+            for _ in range(lengths[i % RNG_BLOCK_SIZE] - 1):
+                position += step_size * momentum
+                momentum += step_size * log_density_gradient(position)
+            position += step_size * momentum
+            proposed_log_density, proposed_gradient = log_density_and_gradient(position)
+            momentum += 0.5 * step_size * proposed_gradient
+
+            log_acceptance_ratio = (
+                proposed_log_density
+                - current_log_density
+                - 0.5 * (momentum * momentum - initial_momentum * initial_momentum)
+            )
+
+            if log_uniform < log_acceptance_ratio:
+                current = position
+                current_log_density = proposed_log_density
+                current_gradient = proposed_gradient
+                if i >= burn_in:  # Only count acceptance after burn-in
+                    accepted += 1
+
+            if i < burn_in:
+                step_size = adapter.update(log_acceptance_ratio)
+                if i + 1 == burn_in:
+                    step_size = adapter.step_size
+            elif (i - burn_in) % thin == 0:
+                samples.append(current)
+                if len(samples) == chunk_size:
+                    yield np.array(samples, dtype=float)
+                    samples = []
+
+            if i + 1 == next_report:
+                next_report += progress.every
+                progress.update(
+                    i + 1, acceptance_rate=accepted / max(1, i + 1 - burn_in)
+                )
+
+        completed, truncated = _completed(cancel, i, total_iterations)
+        acceptance_rate = accepted / max(1, completed - burn_in)
+        progress.finish(completed, acceptance_rate=acceptance_rate)
+
+    if samples:
+        yield np.array(samples, dtype=float)
+    _record_run("hmc", completed, time.time() - start_time)
+    return {
+        "elapsed_time": time.time() - start_time,
+        "acceptance_rate": acceptance_rate,
+        "truncated": truncated,
+        "iterations": completed,
+        "step_size": float(step_size),
+    }
+
+
+def _check_out(out, iterations, thin, return_samples):
+    """Check that an ``out`` array has room for exactly the samples of a run."""
+    if out is None:
+        return
+    if not return_samples:
+        raise ValueError("out cannot be used with return_samples=False")
+    n_samples = sample_count(iterations, thin)
+    if np.shape(out) != (n_samples,):
+        raise ValueError(
+            f"out must have shape ({n_samples},) for {iterations} iterations "
+            f"thinned by {thin}, not {np.shape(out)}"
+        )
+
+
+def _collect(steps, out=None):
+    """
+    Run a chain's step generator to completion and concatenate its chunks.
+
+    With ``out``, the chunks are written into it instead, so the samples are never
+    held in memory twice.
+    """
+    chunks = []
+    n_samples = 0
+    while True:
+        try:
+            chunk = next(steps)
+        except StopIteration as stop:
+            if out is not None:
+                if n_samples < len(out):
+                    # A chain stopped early fills only the start of out
+                    return out[:n_samples], stop.value
+                return out, stop.value
+            samples_array = np.concatenate(chunks) if chunks else np.array([])
+            return samples_array, stop.value
+        if out is None:
+            chunks.append(chunk)
+        else:
+            out[n_samples : n_samples + len(chunk)] = chunk
+        n_samples += len(chunk)
+
+
+class _ChainCheckpointer:
+    """
+    Saves a single chain to a ``Checkpoint`` and restores it.
+
+    Saves happen at RNG block boundaries, where the Generator's state determines
+    every later variate, so a restored chain continues exactly. Samples that were
+    already yielded in chunks are kept until the next save writes them.
+    """
+
+    def __init__(self, checkpoint, config):
+        self.checkpoint = checkpoint
+        self.config = config
+        self._pending = []  # Yielded chunks, or the parts of them not yet saved
+        self._offset = 0  # Samples of the chunk being filled that are already saved
+        self._n_rates = 0
+
+    def restore(self):
+        """Load the checkpoint's state and series, checking it belongs to this run."""
+        state, series = self.checkpoint.load()
+        if state.pop("config") != self.config:
+            raise ValueError(
+                f"Checkpoint {self.checkpoint.path} was saved by a run with different arguments"
+            )
+        self._n_rates = len(series.get("acceptance_rates", []))
+        return state, series
+
+    def chunk_yielded(self, chunk):
+        """Keep the unsaved part of a chunk that is about to be yielded."""
+        self._pending.append(chunk[self._offset :])
+        self._offset = 0
+
+    def save(self, state, samples, acceptance_rates=None):
+        """Save the state with the samples (and acceptance rates) since the last save."""
+        series = {
+            "samples": np.concatenate(
+                self._pending + [np.array(samples[self._offset :], dtype=float)]
+            )
+        }
+        if acceptance_rates is not None:
+            series["acceptance_rates"] = acceptance_rates[self._n_rates :]
+            self._n_rates = len(acceptance_rates)
+        self.checkpoint.save({"config": self.config, **state}, series)
+        self._pending = []
+        self._offset = len(samples)
+
+
+def _chain_checkpointer(checkpoint, resume, config, rng_bound=True):
+    """Validate the checkpoint arguments of a chain and wrap its checkpoint."""
+    if checkpoint is None:
+        if resume:
+            raise ValueError("resume=True requires a checkpoint")
+        return None
+    if not rng_bound:
+        raise ValueError(
+            "Checkpoints need a proposal that draws from the run's Generator "
+            "(one that accepts an rng keyword argument)"
+        )
+    return _ChainCheckpointer(checkpoint, config)
+
+
+def _next_checkpoint(checkpointer, start_iteration):
+    """First iteration count at which a chain may save a checkpoint (-1 for never)."""
+    return -1 if checkpointer is None else start_iteration + RNG_BLOCK_SIZE
+
+
+def _chunk(samples, checkpointer):
+    """Turn a full list of samples into a chunk, noting it for the next checkpoint."""
+    chunk = np.array(samples)
+    if checkpointer is not None:
+        checkpointer.chunk_yielded(chunk)
+    return chunk
+
+
+def _split_chunks(samples_array, chunk_size):
+    """Yield an array in chunks of at most ``chunk_size`` samples."""
+    for start in range(0, len(samples_array), chunk_size):
+        yield samples_array[start : start + chunk_size]
+
+
+def _summarize(steps, credible_interval, return_samples, out=None):
+    """
+    Run a chain's step generator and summarize it.
+
+    Returns the samples (None unless ``return_samples``, ``out`` if given), the
+    generator's return value, and the mean, median and credible interval of the
+    samples.
+    """
+    if out is not None:
+        samples_array, run = _collect(steps, out)
+        if not len(samples_array):
+            return (
+                samples_array,
+                run,
+                *_pooled_statistics(samples_array, credible_interval),
+            )
+        # np.percentile would copy the whole array, which may not fit in memory
+        alpha = (1 - credible_interval) / 2
+        ci_lower, sample_median, ci_upper = chunked_percentile(
+            samples_array, [100 * alpha, 50, 100 * (1 - alpha)]
+        )
+        return (
+            samples_array,
+            run,
+            float(np.mean(samples_array)),
+            sample_median,
+            (ci_lower, ci_upper),
+        )
+
+    if return_samples:
+        samples_array, run = _collect(steps)
+        return (
+            samples_array,
+            run,
+            *_pooled_statistics(samples_array, credible_interval),
+        )
+
+    stream = SampleStream(steps, credible_interval=credible_interval)
+    summary = stream.run()
+    return (
+        None,
+        summary,
+        summary["mean"],
+        summary["median"],
+        summary["credible_interval"],
+    )
+
+
+def _metropolis_hastings_chains(
+    target,
+    proposal,
+    initial,
+    iterations,
+    n_chains,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    progress=None,
+    cancel=None,
+):
+    """Run ``n_chains`` Metropolis-Hastings chains as one vectorized update per iteration."""
+    rng = np.random.default_rng(seed)
+    random_walk = proposal is proposal_distribution
+    if not random_walk:
+        proposal = _bind_proposal(proposal, rng, seed)
+    log_target = log_density_function(target)
+    total_iterations = iterations + burn_in
+    current = _initial_states(initial, n_chains)
+    samples_array = np.empty((n_chains, len(range(0, iterations, thin))))
+    accepted = np.zeros(n_chains, dtype=np.int64)
+    start_time = time.time()
+
+    progress = NullProgress() if progress is None else progress
+    next_report = progress.every
+    progress.start(total_iterations)
+
+    with progress, np.errstate(divide="ignore", invalid="ignore"):
+        current_log_density = _chain_log_density(log_target, current)
+        i = -1
+        for i, noise, log_uniform in _random_stream(
+            rng, total_iterations, n_chains, normal=random_walk, cancel=cancel
+        ):
+            proposed = current + noise if random_walk else proposal(current)
+            proposed_log_density = _chain_log_density(log_target, proposed)
+            log_acceptance_ratio = proposed_log_density - current_log_density
+
+            accept = log_uniform < log_acceptance_ratio
+            current = np.where(accept, proposed, current)
+            current_log_density = np.where(
+                accept, proposed_log_density, current_log_density
+            )
+
+            if i >= burn_in:  # Only count acceptance after burn-in
+                accepted += accept
+                if (i - burn_in) % thin == 0:
+                    samples_array[:, (i - burn_in) // thin] = current
+
+            if i + 1 == next_report:
+                next_report += progress.every
+                progress.update(
+                    i + 1,
+                    acceptance_rate=accepted.mean() / max(1, i + 1 - burn_in),
+                )
+
+        completed, truncated = _completed(cancel, i, total_iterations)
+        acceptance_rate = accepted / max(1, completed - burn_in)
+        progress.finish(completed, acceptance_rate=acceptance_rate.mean())
+
+    elapsed_time = time.time() - start_time
+    _record_run("mh", n_chains * completed, elapsed_time)
+    if truncated:
+        samples_array = samples_array[:, : sample_count(completed - burn_in, thin)]
+    sample_mean, sample_median, ci = _pooled_statistics(
+        samples_array, credible_interval
+    )
+
+    return SamplerResult(
+        (
+            samples_array,
+            elapsed_time,
+            acceptance_rate,
+            sample_mean,
+            sample_median,
+            ci,
+        ),
+        truncated,
+        completed,
+    )
+
+
+def _adaptive_metropolis_hastings_chains(
+    target,
+    initial,
+    iterations,
+    n_chains,
+    initial_variance=1.0,
+    check_interval=200,
+    increase_factor=1.1,
+    decrease_factor=0.9,
+    burn_in=1000,
+    thin=1,
+    seed=None,
+    credible_interval=0.95,
+    progress=None,
+    cancel=None,
+):
+    """Run ``n_chains`` adaptive chains as one vectorized update per iteration."""
+    rng = np.random.default_rng(seed)
+
+    log_target = log_density_function(target)
+    total_iterations = iterations + burn_in
+    current = _initial_states(initial, n_chains)
+    variance = np.full(n_chains, initial_variance, dtype=float)
+    samples_array = np.empty((n_chains, len(range(0, iterations, thin))))
+    acceptance_rates = []
+    interval_accepted = np.zeros(n_chains, dtype=np.int64)
+    interval_count = 0
+    start_time = time.time()
+
+    progress = NullProgress() if progress is None else progress
+    next_report = progress.every
+    progress.start(total_iterations)
+
+    with progress, np.errstate(divide="ignore", invalid="ignore"):
+        current_log_density = _chain_log_density(log_target, current)
+        i = -1
+        for i, noise, log_uniform in _random_stream(
+            rng, total_iterations, n_chains, cancel=cancel
+        ):
+            proposed = current + np.sqrt(variance) * noise
+            proposed_log_density = _chain_log_density(log_target, proposed)
+            log_acceptance_ratio = proposed_log_density - current_log_density
+
+            accept = log_uniform < log_acceptance_ratio
+            current = np.where(accept, proposed, current)
+            current_log_density = np.where(
+                accept, proposed_log_density, current_log_density
+            )
+            interval_accepted += accept
+
+            if i >= burn_in and (i - burn_in) % thin == 0:
+                samples_array[:, (i - burn_in) // thin] = current
+
+            # Each chain adapts its own variance from its own acceptance rate
+            interval_count += 1
+            if interval_count == check_interval:
+                acceptance_rate = interval_accepted / check_interval
+                variance = np.where(
+                    acceptance_rate > 0.5,
+                    variance * increase_factor,
+                    np.where(
+                        acceptance_rate < 0.3, variance * decrease_factor, variance
+                    ),
+                )
+                acceptance_rates.append(acceptance_rate)
+                interval_accepted[:] = 0
+                interval_count = 0
+
+            if i + 1 == next_report:
+                next_report += progress.every
+                progress.update(
+                    i + 1,
+                    acceptance_rate=interval_accepted.mean() / max(1, interval_count),
+                )
+
+        completed, truncated = _completed(cancel, i, total_iterations)
+        progress.finish(
+            completed,
+            acceptance_rate=np.mean(acceptance_rates) if acceptance_rates else 0,
+        )
+
+    elapsed_time = time.time() - start_time
+    _record_run("amh", n_chains * completed, elapsed_time)
+    if truncated:
+        samples_array = samples_array[:, : sample_count(completed - burn_in, thin)]
+    acceptance_rates = np.array(acceptance_rates).reshape(-1, n_chains)
+    overall_acceptance_rate = (
+        acceptance_rates.mean(axis=0) if len(acceptance_rates) else np.zeros(n_chains)
+    )
+    sample_mean, sample_median, ci = _pooled_statistics(
+        samples_array, credible_interval
+    )
+
+    return SamplerResult(
+        (
+            samples_array,
+            elapsed_time,
+            overall_acceptance_rate,
+            acceptance_rates,
+            sample_mean,
+            sample_median,
+            ci,
+        ),
+        truncated,
+        completed,
     )
@@ -1,8 +1,267 @@
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
-import sympy as sp
+from library.metrics import Counter, Histogram
 
+# Compiled-target cache lookups by 'result' ('hit' or 'miss'), and the time taken to
+# compile the misses
+TARGET_CACHE_REQUESTS = Counter(
+    "mcmc_target_cache_requests_total",
+    "Compiled-target cache lookups by target_distribution.",
+    ["result"],
+)
+TARGET_COMPILE_SECONDS = Histogram(
+    "mcmc_target_compile_seconds",
+    "Time to compile a target expression that was not cached.",
+)
 
-def target_distribution(expression=None):
+# sympy takes most of a second to import, so it is imported by the functions that
+# parse and compile expressions rather than here. Programs that never compile a
+# target, such as ``cli.py --help``, never load it.
+
+
+class CompiledTarget:
+    """
+    A target distribution compiled from a mathematical expression.
+
+    Calling the object evaluates the density, so it can be passed anywhere a plain
+    density function is expected. The samplers use ``log_density`` instead, which
+    stays finite for peaked or far-tail targets whose density underflows to zero.
+    The gradient-based samplers also use the exact derivative of the log-density,
+    differentiated symbolically and compiled on first use, so targets without a
+    derivative NumPy can evaluate still work with the other samplers.
+
+    Attributes:
+        expression (sympy.Expr): Density expression in 'x'
+        log_expression (sympy.Expr): Simplified log-density expression in 'x'
+        density (Callable[[float], float]): Vectorized density function
+        log_density (Callable[[float], float]): Vectorized log-density function
+    """
+
+    def __init__(self, expression, log_expression):
+        import sympy as sp  # pylint: disable=import-outside-toplevel
+
+        x = _variable()
+        self.expression = expression
+        self.log_expression = log_expression
+        self.density = sp.lambdify(x, expression, modules=["numpy"])
+        self.log_density = sp.lambdify(x, log_expression, modules=["numpy"])
+
+    def __call__(self, x):
+        return self.density(x)
+
+    @functools.cached_property
+    def gradient_expression(self):
+        """Derivative of the log-density in 'x' (sympy.Expr)."""
+        import sympy as sp  # pylint: disable=import-outside-toplevel
+
+        return sp.diff(self.log_expression, _variable())
+
+    @functools.cached_property
+    def log_density_gradient(self):
+        """
+        Vectorized derivative of the log-density.
+
+        Raises:
+            ValueError: If the target is not differentiable
+        """
+        return self._compile_gradient(self.gradient_expression)
+
+    @functools.cached_property
+    def log_density_and_gradient(self):
+        """
+        The log-density and its derivative in one vectorized call, sharing their
+        common subexpressions.
+
+        Raises:
+            ValueError: If the target is not differentiable
+        """
+        return self._compile_gradient(
+            (self.log_expression, self.gradient_expression), cse=True
+        )
+
+    def _compile_gradient(self, expression, cse=False):
+        """Compile an expression involving the gradient, which may not be printable."""
+        import sympy as sp  # pylint: disable=import-outside-toplevel
+
+        try:
+            return sp.lambdify(_variable(), expression, modules=["numpy"], cse=cse)
+        except NotImplementedError as e:
+            raise ValueError(
+                f"Target is not differentiable: its log-density's derivative "
+                f"{self.gradient_expression} cannot be evaluated, so it cannot be "
+                "sampled with MALA or HMC"
+            ) from e
+
+    @functools.cached_property
+    def evaluation_seconds(self):
+        """
+        Measured seconds per scalar call of each function the samplers use.
+
+        Keys are 'log_density', 'log_density_gradient' and 'log_density_and_gradient',
+        without the gradient functions of a target that is not differentiable.
+        Measured on first access, in well under a millisecond, for cost estimates.
+        """
+        seconds = {"log_density": _seconds_per_call(self.log_density)}
+        for name in ("log_density_gradient", "log_density_and_gradient"):
+            try:
+                seconds[name] = _seconds_per_call(getattr(self, name))
+            except ValueError:
+                pass
+        return seconds
+
+    @functools.cached_property
+    def canonical_form(self):
+        """Canonical text of the log-density the samplers use, shared by identical forms."""
+        import sympy as sp  # pylint: disable=import-outside-toplevel
+
+        return sp.srepr(self.log_expression)
+
+
+class CompiledTargetCache:
+    """
+    Thread-safe LRU cache of compiled targets.
+
+    Compile errors are stored as negative entries so that a bad expression submitted
+    repeatedly fails without being parsed and compiled again.
+
+    Args:
+        maxsize (int): Maximum number of entries. 0 disables caching.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._aliases = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """Return the entry for key, marking it most recently used, or None."""
+        with self._lock:
+            if key in self._aliases:
+                alias, key = key, self._aliases[key]
+                if key in self._entries:
+                    self._aliases.move_to_end(alias)
+                else:
+                    del self._aliases[alias]
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def store(self, key, entry):
+        """Store a freshly compiled entry, evicting the least recently used ones."""
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def alias(self, alias, key):
+        """
+        Make ``lookup(alias)`` return the entry stored under key.
+
+        Aliases are kept in their own LRU index of the same maximum size and do not
+        count towards the number of entries. An alias whose entry has been evicted
+        is dropped on its next lookup.
+        """
+        with self._lock:
+            self._aliases[alias] = key
+            self._aliases.move_to_end(alias)
+            self._evict()
+
+    def resize(self, maxsize):
+        """Change the maximum size, evicting entries if the cache shrinks."""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        """Return the cache counters as a dictionary."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "currsize": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        while len(self._aliases) > self.maxsize:
+            self._aliases.popitem(last=False)
+
+
+_TARGET_CACHE = CompiledTargetCache(
+    maxsize=int(os.environ.get("MCMC_TARGET_CACHE_SIZE", "128"))
+)
+
+
+def target_cache_info():
+    """
+    Return hit, miss and eviction counters of the compiled-target cache.
+
+    Returns:
+        dict: Keys 'hits', 'misses', 'evictions', 'currsize' and 'maxsize'
+    """
+    return _TARGET_CACHE.info()
+
+
+def set_target_cache_size(maxsize):
+    """
+    Set the maximum number of compiled targets kept by ``target_distribution``.
+
+    The default is 128, or the ``MCMC_TARGET_CACHE_SIZE`` environment variable.
+
+    Args:
+        maxsize (int): Maximum number of entries. 0 disables caching.
+    """
+    if maxsize < 0:
+        raise ValueError("Cache size must be non-negative")
+    _TARGET_CACHE.resize(maxsize)
+
+
+def clear_target_cache():
+    """Remove all compiled targets from the cache and reset its counters."""
+    _TARGET_CACHE.clear()
+
+
+def log_density_expression(sympy_expr):
+    """
+    Simplify the logarithm of a density expression.
+
+    Products, quotients, powers and exponentials are expanded so that, for example,
+    ``log(exp(-1000*x**2))`` becomes ``-1000*x**2`` and never underflows.
+
+    Args:
+        sympy_expr (sympy.Expr): Density expression in the real symbol 'x'
+
+    Returns:
+        sympy.Expr: Log-density expression
+    """
+    import sympy as sp  # pylint: disable=import-outside-toplevel
+
+    return sp.expand_log(sp.log(sympy_expr))
+
+
+def target_distribution(expression=None, log_density=False):
     """
     Create a target distribution function from a mathematical expression.
 
@@ -10,50 +269,175 @@ def target_distribution(expression=None):
         expression (str, optional): Mathematical expression as a string representing
             the target distribution. Should be a valid mathematical expression using
             'x' as the variable. Defaults to standard normal distribution if None.
+        log_density (bool, optional): Interpret the expression as an (unnormalized)
+            log-density rather than a density. Defaults to False.
 
     Returns:
-        Callable[[float], float]: A function that takes a float value and returns
-            the probability density at that point.
+        CompiledTarget: A callable that takes a float value and returns the
+            probability density at that point, with a ``log_density`` attribute
+            returning the log-density.
 
     Example:
         >>> # Create standard normal distribution
         >>> target_dist = target_distribution()
         >>> # Create custom distribution
         >>> target_dist = target_distribution('exp(-0.5 * (x - 2)**2) / sqrt(2 * pi)')
+        >>> # Create a distribution from its log-density
+        >>> target_dist = target_distribution('-1000 * x**2', log_density=True)
+
+    Compiled targets and compile errors are kept in a process-wide LRU cache keyed on
+    the canonical sympy expression, so repeated calls skip ``lambdify`` entirely, and
+    repeated identical strings also skip parsing. See
+    ``target_cache_info`` and ``set_target_cache_size``.
     """
-    if expression is None:
-        # Default to standard normal distribution
-        expression = "exp(-0.5 * x**2) / sqrt(2 * pi)"
+    expression = _default_expression(expression, log_density)
+
+    # Repeated identical strings are found by their text without parsing. Parse
+    # failures have no canonical form, so they are only cached under this key.
+    text_key = ("text", expression, log_density)
+    cached = _TARGET_CACHE.lookup(text_key)
+    if cached is not None:
+        TARGET_CACHE_REQUESTS.inc(result="hit")
+        return _from_cache(cached)
 
     try:
-        # Attempt to parse the expression
-        sympy_expr = sp.sympify(expression)
+        sympy_expr = _parse_expression(expression)
+    except ValueError as e:
+        TARGET_CACHE_REQUESTS.inc(result="miss")
+        _TARGET_CACHE.store(text_key, e)
+        raise
+
+    # Equivalent expressions such as 'x**2' and 'x*x' share one compiled target
+    import sympy as sp  # pylint: disable=import-outside-toplevel
+
+    key = ("expr", sp.srepr(sympy_expr), log_density)
+    cached = _TARGET_CACHE.lookup(key)
+    if cached is None:
+        TARGET_CACHE_REQUESTS.inc(result="miss")
+        try:
+            with TARGET_COMPILE_SECONDS.time():
+                cached = _compile_target(sympy_expr, log_density)
+        except ValueError as e:
+            cached = e
+        _TARGET_CACHE.store(key, cached)
+    else:
+        TARGET_CACHE_REQUESTS.inc(result="hit")
+    _TARGET_CACHE.alias(text_key, key)
+    return _from_cache(cached)
+
+
+def lookup_target_distribution(expression=None, log_density=False):
+    """
+    Return the cached target for an expression string, without parsing or compiling it.
+
+    Takes the same arguments as ``target_distribution``. Lets callers that must not
+    block, such as the API's event loop, compile only on a miss.
+
+    Returns:
+        CompiledTarget: The target, or None if this string is not in the cache
+
+    Raises:
+        ValueError: If the string is cached as an invalid expression
+    """
+    expression = _default_expression(expression, log_density)
+    cached = _TARGET_CACHE.lookup(("text", expression, log_density))
+    return None if cached is None else _from_cache(cached)
 
+
+def _default_expression(expression, log_density):
+    """The expression string, or the standard normal's if it is None."""
+    if expression is not None:
+        return expression
+    if log_density:
+        return "-0.5 * x**2 - log(2 * pi) / 2"
+    return "exp(-0.5 * x**2) / sqrt(2 * pi)"
+
+
+def _variable():
+    """
+    The real symbol 'x' that expressions are parsed in.
+
+    The sampling variable is declared real so that log-density simplification
+    only applies identities that hold on the real line (no force=True expansion).
+    """
+    import sympy as sp  # pylint: disable=import-outside-toplevel
+
+    return sp.Symbol("x", real=True)
+
+
+def _parse_expression(expression):
+    """Parse an expression string into a sympy expression in the real symbol 'x'."""
+    import sympy as sp  # pylint: disable=import-outside-toplevel
+
+    try:
+        return sp.sympify(expression, locals={"x": _variable()})
+    except sp.SympifyError as e:
+        raise ValueError(f"Cannot parse mathematical expression: {str(e)}") from e
+    except Exception as e:
+        raise ValueError(f"Invalid expression: {str(e)}") from e
+
+
+def _compile_target(sympy_expr, log_density):
+    """Validate a parsed expression and compile it to a CompiledTarget."""
+    import sympy as sp  # pylint: disable=import-outside-toplevel
+
+    try:
         # Check if 'x' is in the expression
         if "x" not in str(sympy_expr.free_symbols):
             raise ValueError("Expression must contain the variable 'x'")
 
-        # Convert to numpy function
-        np_func = sp.lambdify("x", sympy_expr, modules=["numpy"])
+        # Convert to numpy functions
+        if log_density:
+            compiled = CompiledTarget(sp.exp(sympy_expr), sympy_expr)
+        else:
+            compiled = CompiledTarget(sympy_expr, log_density_expression(sympy_expr))
 
-        # Test evaluation
+        # Test evaluation of the log-density the samplers use. A density of zero
+        # (log-density -inf) is allowed, but nan and +inf are not. Evaluating the
+        # density itself would overflow for log-densities such as '800 - x**2'.
         try:
-            test_value = float(np_func(0.0))
-            if not np.isfinite(test_value):
+            with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+                test_value = float(compiled.log_density(0.0))
+            if np.isnan(test_value) or test_value == np.inf:
                 raise ValueError("Expression evaluates to non-finite value")
         except Exception as e:
             raise ValueError(f"Cannot evaluate expression: {str(e)}") from e
 
-        return np_func
+        return compiled
 
-    except sp.SympifyError as e:
-        raise ValueError(f"Cannot parse mathematical expression: {str(e)}") from e
     except ValueError as e:
         raise e  # Re-raise ValueErrors
     except Exception as e:
         raise ValueError(f"Invalid expression: {str(e)}") from e
 
 
-def proposal_distribution(x, variance=1.0):
+def _from_cache(entry):
+    """Return a cached compiled target, or re-raise a cached compile error."""
+    if isinstance(entry, ValueError):
+        raise ValueError(*entry.args)
+    return entry
+
+
+def _seconds_per_call(function, calls=100, repeats=3):
+    """Fastest of ``repeats`` timings of a function's scalar calls, per call."""
+    # NumPy scalars divide by zero without raising, unlike Python floats
+    x = np.float64(0.0)
+    timings = []
+    with np.errstate(all="ignore"):
+        try:
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                for _ in range(calls):
+                    function(x)
+                timings.append((time.perf_counter() - start_time) / calls)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Targets are checked to evaluate at 0 when compiled; cost them as free
+            return 0.0
+    return min(timings)
+
+
+def proposal_distribution(x, variance=1.0, rng=None):
     # Example proposal distribution: normal distribution centered at x
-    return np.random.normal(x, np.sqrt(variance))
+    # Without a Generator this falls back to the legacy global random state
+    random = np.random if rng is None else rng
+    return random.normal(x, np.sqrt(variance))
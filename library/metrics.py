@@ -0,0 +1,283 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram buckets for durations in seconds
+DURATION_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+# Histogram buckets for sizes in bytes, 100 B to 1 GB
+SIZE_BUCKETS = tuple(10.0**exponent for exponent in range(2, 10))
+
+# Histogram buckets for sampler throughput in iterations per second
+RATE_BUCKETS = tuple(10.0**exponent for exponent in range(2, 9))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe set of metrics, rendered in the Prometheus text format.
+
+    Metrics are plain counters, gauges and histograms kept in process memory, so
+    no metrics server or client library is needed: ``render`` returns the text a
+    ``/metrics`` endpoint serves, or a file for node_exporter's textfile collector.
+
+    Processes that work for another, such as the API's sampling workers, send a
+    ``snapshot`` of their registry to it, and the snapshots' counters and histograms
+    are added to its own when rendered. Gauges describe a single process and are
+    not merged.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric, replacing any metric of the same name."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """Picklable copy of the counters and histograms, for ``render(snapshots=...)``."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: metric.values()
+            for metric in metrics
+            if metric.kind in ("counter", "histogram")
+        }
+
+    def render(self, snapshots=()):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Args:
+            snapshots (iterable, optional): Snapshots of other processes' registries
+                with the same metrics, added to this registry's counters and histograms
+
+        Returns:
+            str: The exposition text, with one line per sample
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            values = metric.values()
+            for snapshot in snapshots:
+                for labels, value in snapshot.get(metric.name, {}).items():
+                    if metric.kind == "counter":
+                        values[labels] = values.get(labels, 0.0) + value
+                    elif metric.kind == "histogram":
+                        values[labels] = _add_lists(values.get(labels), value)
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.sample_lines(values))
+        return "\n".join(lines) + "\n"
+
+
+# Registry that the library's and the API's metrics are registered in
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    """Base class of metrics, keyed by the values of their labels."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def values(self):
+        """Copy of the value of each label combination."""
+        with self._lock:
+            return {
+                labels: list(value) if isinstance(value, list) else value
+                for labels, value in self._values.items()
+            }
+
+    def clear(self):
+        """Remove all values, e.g. between tests."""
+        with self._lock:
+            self._values.clear()
+
+    def sample_lines(self, values):
+        """Exposition lines of the given values."""
+        return [
+            f"{self.name}{self._format_labels(labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} takes labels {self.labelnames}, not {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        text = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return "{" + text + "}"
+
+
+class Counter(_Metric):
+    """Monotonically increasing total, e.g. of requests or iterations."""
+
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        """Add a non-negative amount to the total for the given labels."""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels):
+        """Current total for the given labels."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in progress."""
+
+    kind = "gauge"
+
+    def inc(self, amount=1.0, **labels):
+        """Add an amount to the value for the given labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        """Subtract an amount from the value for the given labels."""
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        """Set the value for the given labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def get(self, **labels):
+        """Current value for the given labels."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, counted in cumulative buckets.
+
+    Args:
+        name (str): Metric name
+        documentation (str): Help text
+        labelnames (tuple, optional): Label names. Defaults to ()
+        buckets (tuple, optional): Increasing upper bounds of the buckets, to which
+            +Inf is added. Defaults to DURATION_BUCKETS
+        registry (MetricsRegistry, optional): Registry to add the metric to.
+            Defaults to REGISTRY
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        buckets=DURATION_BUCKETS,
+        registry=REGISTRY,
+    ):
+        self.buckets = tuple(float(bound) for bound in buckets) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        """Record one observed value for the given labels."""
+        key = self._key(labels)
+        # Per-bucket counts, then the sum and count of the observations
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block in seconds."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def count(self, **labels):
+        """Number of observations for the given labels."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+        return 0 if state is None else int(state[-1])
+
+    def sample_lines(self, values):
+        lines = []
+        for key, state in sorted(values.items()):
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else _format_value(bound)
+                labels = self._format_labels(key, [("le", le)])
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = self._format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+def _add_lists(first, second):
+    """Element-wise sum of two histogram states, either of which may be None."""
+    if first is None:
+        return list(second)
+    return [a + b for a, b in zip(first, second)]
+
+
+def _format_value(value):
+    """Prometheus text for a number: integers without a decimal point."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer() and abs(value) < 2**53:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,142 @@
+import numpy as np
+
+# Points a downsampled trace keeps by default, enough for a plot a few thousand pixels wide
+TRACE_POINTS = 4000
+
+# Samples read at a time when downsampling
+BLOCK_SIZE = 2**20
+
+
+def downsample_trace(samples, max_points=TRACE_POINTS, method="minmax"):
+    """
+    Downsample a trace to at most ``max_points`` points that keep its visible shape.
+
+    Plotting every sample of a long chain costs more than running it, and a plot
+    cannot show more points than it has pixels anyway. Both methods keep original
+    samples at their original iterations, and read the samples in blocks, so memory-
+    mapped chains larger than memory can be downsampled.
+
+    - 'minmax' splits the trace into ``max_points / 2`` buckets of consecutive
+      iterations and keeps the smallest and largest sample of each, so the plotted
+      envelope matches that of the full trace exactly.
+    - 'lttb' is Largest-Triangle-Three-Buckets (Steinarsson, 2013). It keeps the
+      sample of each bucket that forms the largest triangle with the sample kept in
+      the previous bucket and the mean of the next bucket, which follows the trace's
+      shape with fewer points but may drop extremes.
+
+    Args:
+        samples (array_like): One-dimensional trace
+        max_points (int, optional): Most points to keep. Defaults to TRACE_POINTS
+        method (str, optional): 'minmax' or 'lttb'. Defaults to 'minmax'
+
+    Returns:
+        tuple: Iterations (numpy.ndarray of int) and values (numpy.ndarray) of the kept
+            samples, in order. Traces of at most ``max_points`` samples are returned whole
+
+    Raises:
+        ValueError: If method is unknown or max_points is below 3
+    """
+    if method not in ("minmax", "lttb"):
+        raise ValueError(f"Unknown downsampling method {method}")
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+    n_samples = len(samples)
+    if n_samples <= max_points:
+        return np.arange(n_samples), np.asarray(samples, dtype=float)
+
+    if method == "minmax":
+        iterations = _minmax_indices(samples, max_points // 2)
+    else:
+        iterations = _lttb_indices(samples, max_points)
+    return iterations, np.asarray(samples[iterations], dtype=float)
+
+
+def density_curve(target, lower, upper, n_points=1000):
+    """
+    Evaluate a target density on an even grid in one vectorized call.
+
+    Args:
+        target (Callable): Density that accepts a numpy array, e.g. from
+            ``target_distribution``
+        lower (float): Start of the grid
+        upper (float): End of the grid
+        n_points (int, optional): Number of grid points. Defaults to 1000
+
+    Returns:
+        tuple: The grid and the density at each point, as numpy.ndarray
+    """
+    x = np.linspace(lower, upper, n_points)
+    with np.errstate(all="ignore"):
+        # Expressions that simplify to a constant return a scalar
+        density = np.broadcast_to(np.asarray(target(x), dtype=float), x.shape)
+    return x, density
+
+
+def binned_histogram(samples, bins=50):
+    """
+    Bin samples into a density histogram, so plots draw ``bins`` bars however many samples.
+
+    ``np.histogram`` reads the samples in blocks, so memory-mapped chains larger than
+    memory can be binned.
+
+    Args:
+        samples (array_like): One-dimensional samples
+        bins (int, optional): Number of equal-width bins. Defaults to 50
+
+    Returns:
+        tuple: Densities (numpy.ndarray of length bins) and bin edges (length bins + 1)
+    """
+    return np.histogram(samples, bins=bins, density=True)
+
+
+def _minmax_indices(samples, n_buckets):
+    """Indices of the smallest and largest sample in each of n_buckets equal buckets."""
+    n_samples = len(samples)
+    bucket_size = -(-n_samples // n_buckets)
+    block_size = max(1, BLOCK_SIZE // bucket_size) * bucket_size
+    indices = []
+    for start in range(0, n_samples, block_size):
+        block = np.asarray(samples[start : start + block_size], dtype=float)
+        # Pad the last bucket by repeating its final sample
+        padding = -len(block) % bucket_size
+        buckets = np.pad(block, (0, padding), mode="edge").reshape(-1, bucket_size)
+        pairs = np.stack([np.argmin(buckets, axis=1), np.argmax(buckets, axis=1)], 1)
+        pairs = np.sort(pairs, axis=1)
+        offsets = start + bucket_size * np.arange(len(buckets))
+        indices.append((pairs + offsets[:, None]).ravel())
+    # Flat buckets keep one sample; padding can point past the end
+    return np.unique(np.minimum(np.concatenate(indices), n_samples - 1))
+
+
+def _lttb_indices(samples, max_points):
+    """Indices chosen by Largest-Triangle-Three-Buckets, including both ends."""
+    n_samples = len(samples)
+    # The first and last samples are kept; the rest are split into buckets
+    edges = 1 + (np.arange(max_points - 1) * (n_samples - 2)) // (max_points - 2)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n_samples - 1
+    previous = 0
+    previous_value = float(samples[0])
+    next_block = np.asarray(samples[edges[0] : edges[1]], dtype=float)
+    for bucket in range(max_points - 2):
+        start = edges[bucket]
+        block = next_block
+        if bucket + 2 < len(edges):
+            next_block = np.asarray(
+                samples[edges[bucket + 1] : edges[bucket + 2]], dtype=float
+            )
+            next_x = (edges[bucket + 1] + edges[bucket + 2] - 1) / 2
+            next_value = float(np.mean(next_block))
+        else:
+            next_x, next_value = n_samples - 1, float(samples[n_samples - 1])
+
+        # Twice the triangle areas, up to sign
+        x = np.arange(start, start + len(block))
+        areas = np.abs(
+            (previous - next_x) * (block - previous_value)
+            - (previous - x) * (next_value - previous_value)
+        )
+        chosen = int(np.argmax(areas))
+        previous, previous_value = start + chosen, float(block[chosen])
+        indices[bucket + 1] = previous
+    return indices
@@ -0,0 +1,256 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Detailed reports a profiled run can attach
+PROFILE_REPORTS = ("cprofile", "memory")
+
+# Functions listed by a cProfile report, and allocation sites by a memory report
+REPORT_ENTRIES = 25
+
+
+class RunProfiler:
+    """
+    Per-phase timing breakdown of one sampler run, with optional detailed reports.
+
+    Callers wrap each phase of a run, e.g. compiling the target, the sampler loop,
+    and computing statistics, in ``phase``, and pass the target through
+    ``count_evaluations`` so the points it is evaluated at are counted. Used as a
+    context manager, the profiler also captures a cProfile report of the hottest
+    functions or a tracemalloc report of peak memory and the largest allocation
+    sites for the run, if requested. Both slow the run down considerably, so they
+    are only for diagnosis.
+
+    A disabled profiler does nothing and costs nothing, so callers can use one
+    unconditionally.
+
+    Args:
+        enabled (bool, optional): Record the run. Defaults to True
+        report (str, optional): Detailed report to capture, 'cprofile' or 'memory'.
+            Requesting one enables the profiler. Defaults to None (timings only)
+
+    Raises:
+        ValueError: If report is unknown
+    """
+
+    def __init__(self, enabled=True, report=None):
+        if report is not None and report not in PROFILE_REPORTS:
+            raise ValueError(f"Unknown profile report '{report}'")
+        self.enabled = enabled or report is not None
+        self.report = report
+        self.phases = {}
+        self._targets = []
+        self._profile = None
+        self._memory = None
+        self._start_time = None
+        self._total_time = 0.0
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        self._start_time = time.perf_counter()
+        if self.report == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.report == "memory":
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.enabled:
+            return
+        if self.report == "cprofile":
+            self._profile.disable()
+        elif self.report == "memory":
+            _, peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            tracemalloc.stop()
+            self._memory = {
+                "peak_bytes": peak,
+                "top_allocations": [
+                    {
+                        "location": f"{stat.traceback[0].filename}:"
+                        f"{stat.traceback[0].lineno}",
+                        "bytes": stat.size,
+                        "count": stat.count,
+                    }
+                    for stat in statistics[:REPORT_ENTRIES]
+                ],
+            }
+        self._total_time = time.perf_counter() - self._start_time
+
+    @contextmanager
+    def phase(self, name):
+        """Add the duration of the ``with`` block to the named phase."""
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start_time)
+
+    def record(self, name, seconds):
+        """Add seconds measured elsewhere to the named phase."""
+        if self.enabled:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def split(self, name, remainder, seconds):
+        """
+        Keep ``seconds`` of a phase and move the rest of its time to another phase.
+
+        Samplers report the time of their loop, so a phase timing a whole sampler
+        call is split into the loop and the setup and statistics around it.
+        """
+        if self.enabled and name in self.phases:
+            seconds = min(max(0.0, seconds), self.phases[name])
+            self.record(remainder, self.phases[name] - seconds)
+            self.phases[name] = seconds
+
+    def count_evaluations(self, target):
+        """
+        Return the target, wrapped to count its evaluations if the profiler is enabled.
+
+        Args:
+            target (CompiledTarget): Target from ``target_distribution``
+
+        Returns:
+            CountingTarget: The wrapped target, or the target itself when disabled
+        """
+        if not self.enabled:
+            return target
+        counting = CountingTarget(target)
+        self._targets.append(counting)
+        return counting
+
+    def result(self, iterations):
+        """
+        Return the breakdown of the run as plain data.
+
+        Args:
+            iterations (int): Iterations the sampler ran, burn-in included
+
+        Returns:
+            dict: phases (seconds per phase, in the order they ran), total_time,
+                iterations, seconds_per_iteration (of the 'sampling' phase),
+                target_evaluations and gradient_evaluations (points evaluated), and
+                the requested 'cprofile' text or 'memory' report (peak_bytes and
+                top_allocations). None if the profiler is disabled
+        """
+        if not self.enabled:
+            return None
+        profile = {
+            "phases": dict(self.phases),
+            "total_time": self._total_time or sum(self.phases.values()),
+            "iterations": int(iterations),
+            "seconds_per_iteration": self.phases.get("sampling", 0.0)
+            / max(1, iterations),
+            "target_evaluations": sum(t.evaluations for t in self._targets),
+            "gradient_evaluations": sum(t.gradient_evaluations for t in self._targets),
+        }
+        if self._profile is not None:
+            profile["cprofile"] = _cprofile_text(self._profile)
+        if self._memory is not None:
+            profile["memory"] = self._memory
+        return profile
+
+
+class CountingTarget:
+    """
+    A compiled target that counts the points its log-density and gradient are evaluated at.
+
+    Exposes the functions the samplers use (``log_density``, ``log_density_gradient``
+    and ``log_density_and_gradient``), each counting the points of its argument, so
+    a vectorized call over many chains counts every chain. ``log_density_and_gradient``
+    counts as one evaluation of each.
+
+    Args:
+        target (CompiledTarget): Target from ``target_distribution``
+
+    Attributes:
+        evaluations (int): Points the log-density or density was evaluated at
+        gradient_evaluations (int): Points the gradient was evaluated at
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.evaluations = 0
+        self.gradient_evaluations = 0
+
+    def __call__(self, x):
+        self.evaluations += _points(x)
+        return self.target(x)
+
+    def __getattr__(self, name):
+        # Other attributes, e.g. the expressions, are the target's own
+        return getattr(self.target, name)
+
+    def log_density(self, x):
+        """Log-density of the target, counted."""
+        self.evaluations += _points(x)
+        return self.target.log_density(x)
+
+    def log_density_gradient(self, x):
+        """Derivative of the log-density, counted."""
+        self.gradient_evaluations += _points(x)
+        return self.target.log_density_gradient(x)
+
+    def log_density_and_gradient(self, x):
+        """Log-density and its derivative in one call, counted as both."""
+        points = _points(x)
+        self.evaluations += points
+        self.gradient_evaluations += points
+        return self.target.log_density_and_gradient(x)
+
+
+def format_profile(profile):
+    """
+    Format a profile from ``RunProfiler.result`` as lines of text for a terminal.
+
+    Args:
+        profile (dict): The profile
+
+    Returns:
+        list: Lines of text, without newlines
+    """
+    total_time = profile["total_time"]
+    lines = ["Profile:"]
+    for name, seconds in profile["phases"].items():
+        share = 100 * seconds / total_time if total_time > 0 else 0.0
+        lines.append(f"  {name:<14}{seconds:>10.4f} s {share:>6.1f}%")
+    lines.append(f"  {'total':<14}{total_time:>10.4f} s")
+    lines.append(
+        f"  {profile['seconds_per_iteration'] * 1e9:.1f} ns per iteration over "
+        f"{profile['iterations']} iterations"
+    )
+    lines.append(
+        f"  {profile['target_evaluations']} target evaluations, "
+        f"{profile['gradient_evaluations']} gradient evaluations"
+    )
+    if "memory" in profile:
+        lines.append(f"  Peak traced memory: {profile['memory']['peak_bytes']} bytes")
+        for allocation in profile["memory"]["top_allocations"]:
+            lines.append(
+                f"    {allocation['bytes']:>12} bytes in {allocation['count']:>6} "
+                f"blocks at {allocation['location']}"
+            )
+    if "cprofile" in profile:
+        lines.extend(profile["cprofile"].rstrip("\n").splitlines())
+    return lines
+
+
+def _points(x):
+    """Number of points in a scalar or array argument."""
+    return 1 if isinstance(x, float) else int(getattr(x, "size", 1))
+
+
+def _cprofile_text(profile):
+    """The functions with the largest cumulative time, as pstats text."""
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats("cumulative").print_stats(REPORT_ENTRIES)
+    return stream.getvalue()
@@ -0,0 +1,145 @@
+import time
+
+
+class ProgressReporter:
+    """
+    Rate-limited progress reporting for the sampler loops.
+
+    The samplers call ``update`` at most once every ``every`` iterations, and the
+    reporter forwards an update to ``report`` at most once every ``min_interval``
+    seconds, so reporting costs a single integer comparison per iteration. The base
+    class is silent; subclasses override ``report`` (and optionally ``begin`` and
+    ``end``) to display or record progress. Used as a context manager, ``end`` runs
+    even if the sampler raises.
+
+    Args:
+        min_interval (float, optional): Minimum seconds between reports. Defaults to 0.1
+        every (int, optional): Iterations between update calls from the sampler. Defaults to 1000
+    """
+
+    def __init__(self, min_interval=0.1, every=1000):
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.min_interval = min_interval
+        self.every = every
+        self.total = 0
+        self._last_report = 0.0
+
+    def start(self, total):
+        """Begin a run of ``total`` iterations."""
+        self.total = total
+        self._last_report = time.monotonic()
+        self.begin(total)
+
+    def update(self, completed, **stats):
+        """Report ``completed`` iterations if ``min_interval`` has passed since the last report."""
+        now = time.monotonic()
+        if now - self._last_report >= self.min_interval:
+            self._last_report = now
+            self.report(completed, stats)
+
+    def finish(self, completed, **stats):
+        """Report the final state regardless of the rate limit."""
+        self.report(completed, stats)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end()
+
+    def begin(self, total):
+        """Hook called when a run starts."""
+
+    def report(self, completed, stats):
+        """Hook called with the number of completed iterations and current statistics."""
+
+    def end(self):
+        """Hook called when a run finishes."""
+
+
+class NullProgress(ProgressReporter):
+    """Silent reporter. The samplers never call it during the loop."""
+
+    def __init__(self):
+        super().__init__(min_interval=float("inf"), every=2**62)
+
+    def finish(self, completed, **stats):
+        pass
+
+
+class TqdmProgress(ProgressReporter):
+    """
+    Progress bar on the terminal using tqdm.
+
+    Args:
+        desc (str, optional): Bar description. Defaults to "Sampling"
+        min_interval (float, optional): Minimum seconds between redraws. Defaults to 0.1
+        every (int, optional): Iterations between update calls. Defaults to 1000
+    """
+
+    def __init__(self, desc="Sampling", min_interval=0.1, every=1000):
+        super().__init__(min_interval=min_interval, every=every)
+        self.desc = desc
+        self._bar = None
+
+    def begin(self, total):
+        from tqdm import tqdm  # pylint: disable=import-outside-toplevel
+
+        self._bar = tqdm(total=total, desc=self.desc, unit="iteration")
+
+    def report(self, completed, stats):
+        self._bar.update(completed - self._bar.n)
+        if stats:
+            self._bar.set_postfix(stats, refresh=False)
+
+    def end(self):
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+
+
+class CallbackProgress(ProgressReporter):
+    """
+    Progress forwarded to a callback, e.g. to drive a web progress bar.
+
+    Args:
+        callback (Callable[[int, int, dict], None]): Called with completed iterations,
+            total iterations and a dictionary of current statistics
+        min_interval (float, optional): Minimum seconds between calls. Defaults to 0.1
+        every (int, optional): Iterations between update calls. Defaults to 1000
+    """
+
+    def __init__(self, callback, min_interval=0.1, every=1000):
+        super().__init__(min_interval=min_interval, every=every)
+        self.callback = callback
+
+    def report(self, completed, stats):
+        self.callback(completed, self.total, stats)
+
+
+class SharedProgress(ProgressReporter):
+    """
+    Progress published as a completed fraction into a shared mapping.
+
+    Passing a ``multiprocessing.Manager().dict()`` lets a sampler running in a worker
+    process report progress that the parent process can read. The reporter is
+    picklable whenever the mapping is.
+
+    Args:
+        mapping (MutableMapping): Mapping to write the fraction into
+        key (Hashable): Key to write under
+        min_interval (float, optional): Minimum seconds between writes. Defaults to 0.5
+        every (int, optional): Iterations between update calls. Defaults to 1000
+    """
+
+    def __init__(self, mapping, key, min_interval=0.5, every=1000):
+        super().__init__(min_interval=min_interval, every=every)
+        self.mapping = mapping
+        self.key = key
+
+    def begin(self, total):
+        self.mapping[self.key] = 0.0
+
+    def report(self, completed, stats):
+        self.mapping[self.key] = completed / max(1, self.total)
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def result_cache_key(sampler, target, params):
+    """
+    Canonical key of a seeded sampler run.
+
+    Two runs have the same key exactly when they produce the same result: the key
+    hashes the sampler, the canonical form of the target's compiled log-density
+    (so 'x**2' and 'x*x', or a density and its log-density, share a key) and every
+    sampler parameter. Profiling options do not change the samples, so they are
+    left out.
+
+    Args:
+        sampler (str): 'mh', 'amh', 'pt', 'mala' or 'hmc'
+        target (CompiledTarget): The compiled target distribution
+        params (dict): Sampler parameters with the field names of the API request
+            models. 'expression' and 'log_density' are replaced by the target
+
+    Returns:
+        str: A SHA-256 hex digest
+    """
+    canonical = {
+        "sampler": sampler,
+        "target": target.canonical_form,
+        **{
+            key: value
+            for key, value in params.items()
+            if key not in ("expression", "log_density", "profile", "profile_report")
+        },
+    }
+    text = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe two-tier LRU cache of sampler results.
+
+    Results are dictionaries as returned by ``run_sampler``. Each tier is bounded by
+    the bytes it holds and evicts its least recently used results. The optional disk
+    tier is written through, so results outlive their eviction from memory and the
+    process. It stores a JSON file and a raw float64 samples file per result, and
+    orders evictions by file modification time, which every hit refreshes. A disk
+    hit is copied back into memory. Disk reads and writes happen outside the lock on
+    the memory tier, but ``get`` and ``put`` still block on them, so asynchronous
+    code calls them in a thread.
+
+    Args:
+        max_bytes (int, optional): Size limit of the memory tier. 0 disables caching.
+            Defaults to 256 MB
+        directory (str, optional): Directory of the disk tier. Defaults to None (no
+            disk tier)
+        max_disk_bytes (int, optional): Size limit of the disk tier. Defaults to 1 GB
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, directory=None, max_disk_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        # The lock guards the memory tier, and the disk lock the disk tier's size
+        # and evictions; neither is held while results are read or written
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a cache configured by environment variables.
+
+        ``MCMC_RESULT_CACHE_MB`` sets the memory tier's size (default 256, 0 disables
+        caching), ``MCMC_RESULT_CACHE_DIR`` enables the disk tier in that directory
+        and ``MCMC_RESULT_CACHE_DISK_MB`` sets its size (default 1024).
+        """
+        return cls(
+            max_bytes=int(float(os.environ.get("MCMC_RESULT_CACHE_MB", "256")) * 2**20),
+            directory=os.environ.get("MCMC_RESULT_CACHE_DIR") or None,
+            max_disk_bytes=int(
+                float(os.environ.get("MCMC_RESULT_CACHE_DISK_MB", "1024")) * 2**20
+            ),
+        )
+
+    @property
+    def enabled(self):
+        """Whether results are cached at all."""
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Return the cached result for key, or None."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if result is not None:
+            self._touch_disk(key)
+            return result
+
+        # Disk reads hold no lock, so lookups of other results are never held up
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store_memory(key, result)
+        return result
+
+    def put(self, key, result):
+        """Cache a result. Results larger than a tier are not kept in it."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._store_memory(key, result)
+        self._write_disk(key, result)
+
+    def clear(self):
+        """Remove all results from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        with self._disk_lock:
+            for path, _, _ in self._disk_files():
+                os.remove(path)
+            self._disk_bytes = 0
+
+    def info(self):
+        """Hit and miss counts and the size of each tier."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _store_memory(self, key, result):
+        size = _result_bytes(result)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= _result_bytes(self._entries.pop(key))
+        self._entries[key] = result
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= _result_bytes(evicted)
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        metadata_path, samples_path = self._disk_paths(key)
+        try:
+            with open(metadata_path, encoding="utf-8") as file:
+                result = json.load(file)
+            if result.pop("has_samples"):
+                result["samples"] = np.fromfile(samples_path, dtype="<f8")
+            else:
+                result["samples"] = None
+        except (OSError, ValueError, KeyError):
+            return None
+        result["credible_interval"] = tuple(result["credible_interval"])
+        self._touch_disk(key)
+        return result
+
+    def _touch_disk(self, key):
+        """Mark a result as recently used in the disk tier."""
+        if self.directory is None:
+            return
+        now = time.time_ns()
+        try:
+            # Modification times order the disk tier's evictions. An explicit time
+            # keeps full precision, where the file system's own clock may be coarse
+            os.utime(self._disk_paths(key)[0], ns=(now, now))
+        except OSError:  # Not on disk, e.g. evicted by another process
+            pass
+
+    def _write_disk(self, key, result):
+        if self.directory is None:
+            return
+        metadata_path, samples_path = self._disk_paths(key)
+        if os.path.exists(metadata_path):
+            return
+        samples = result.get("samples")
+        data = b"" if samples is None else np.asarray(samples, dtype="<f8").tobytes()
+        metadata = json.dumps(
+            {
+                **{name: value for name, value in result.items() if name != "samples"},
+                "has_samples": samples is not None,
+            }
+        ).encode("utf-8")
+        if len(data) + len(metadata) > self.max_disk_bytes:
+            return
+
+        # Files are written under names unique to the writer, then renamed into place
+        # with the metadata file last, so a result is only found once complete
+        suffix = f".{os.getpid()}-{threading.get_ident()}.tmp"
+        for path, content in ((samples_path, data), (metadata_path, metadata)):
+            with open(path + suffix, "wb") as file:
+                file.write(content)
+        with self._disk_lock:
+            if os.path.exists(metadata_path):
+                # Written meanwhile by another request for the same result
+                for path in (samples_path, metadata_path):
+                    os.remove(path + suffix)
+                return
+            for path in (samples_path, metadata_path):
+                os.replace(path + suffix, path)
+            self._touch_disk(key)
+            self._disk_bytes += len(data) + len(metadata)
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Evict least recently used results beyond the size limit, holding the disk lock."""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        # Least recently used first
+        entries = {}
+        for path, size, modified in self._disk_files():
+            key = os.path.basename(path).split(".")[0]
+            total, last_used = entries.get(key, (0, 0.0))
+            entries[key] = (total + size, max(last_used, modified))
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            for path in self._disk_paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._disk_bytes -= size
+
+    def _disk_files(self):
+        """(path, size, modification time) of every file in the disk tier."""
+        if self.directory is None:
+            return []
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith((".json", ".f8")):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _disk_paths(self, key):
+        base = os.path.join(self.directory, key)
+        return f"{base}.json", f"{base}.f8"
+
+
+def _result_bytes(result):
+    """Approximate memory held by a cached result, dominated by its samples."""
+    samples = result.get("samples")
+    return 1024 + (0 if samples is None else np.asarray(samples).nbytes)
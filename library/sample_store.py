@@ -0,0 +1,125 @@
+import os
+import numpy as np
+
+# File formats samples can be saved in
+SAMPLE_FORMATS = ("npy", "bin", "txt")
+
+# Samples written to or read from a file at a time
+BLOCK_SIZE = 2**20
+
+
+def sample_count(iterations, thin=1):
+    """Number of samples a chain of ``iterations`` post-burn-in iterations keeps."""
+    return len(range(0, iterations, thin))
+
+
+def open_sample_file(path, n_samples, sample_format="npy"):
+    """
+    Preallocate a memory-mapped file of float64 samples, to be filled as a chain runs.
+
+    Pass the returned array as the ``out`` argument of ``metropolis_hastings`` or
+    ``adaptive_metropolis_hastings``. The operating system pages the samples out to
+    the file as they are written, so a run can keep more samples than fit in memory.
+
+    Args:
+        path (str): File to create, overwriting any existing one
+        n_samples (int): Number of samples, e.g. from ``sample_count``
+        sample_format (str, optional): 'npy' for a NumPy ``.npy`` file, readable with
+            ``np.load``, or 'bin' for raw little-endian float64 values. Defaults to 'npy'
+
+    Returns:
+        numpy.memmap: The writable, zero-filled samples array
+
+    Raises:
+        ValueError: If sample_format is not 'npy' or 'bin'
+    """
+    if sample_format == "npy":
+        return np.lib.format.open_memmap(
+            path, mode="w+", dtype="<f8", shape=(n_samples,)
+        )
+    if sample_format == "bin":
+        if n_samples == 0:
+            # np.memmap cannot map an empty file
+            open(path, "wb").close()
+            return np.zeros(0, dtype="<f8")
+        return np.memmap(path, mode="w+", dtype="<f8", shape=(n_samples,))
+    raise ValueError(
+        f"Samples can only be memory-mapped as npy or bin, not {sample_format}"
+    )
+
+
+def save_samples(path, samples, sample_format="npy"):
+    """
+    Save samples to a file in blocks, without copying the whole array.
+
+    A memory-mapped array that was opened on ``path`` by ``open_sample_file`` is
+    only flushed. If it is the start of the file's samples, as for a run stopped
+    early, the file is cut down to it.
+
+    Args:
+        path (str): File to write
+        samples (array_like): One-dimensional array of samples
+        sample_format (str, optional): 'npy', 'bin' (raw little-endian float64) or
+            'txt' (one value per line). Defaults to 'npy'
+
+    Raises:
+        ValueError: If sample_format is not one of SAMPLE_FORMATS
+    """
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f"Unknown sample format {sample_format}")
+    if isinstance(samples, np.memmap) and samples.filename == os.path.abspath(path):
+        samples.flush()
+        if os.path.getsize(path) > samples.offset + samples.nbytes:
+            _truncate_sample_file(path, samples.offset, len(samples), sample_format)
+        return
+
+    if sample_format == "npy":
+        output = open_sample_file(path, len(samples))
+        for start in range(0, len(samples), BLOCK_SIZE):
+            output[start : start + BLOCK_SIZE] = samples[start : start + BLOCK_SIZE]
+        output.flush()
+        return
+
+    with open(path, "wb") as file:
+        for start in range(0, len(samples), BLOCK_SIZE):
+            block = np.asarray(samples[start : start + BLOCK_SIZE], dtype="<f8")
+            if sample_format == "bin":
+                file.write(block.tobytes())
+            else:
+                np.savetxt(file, block)
+
+
+def load_samples(path, sample_format=None):
+    """
+    Open a samples file, memory-mapping the binary formats.
+
+    Args:
+        path (str): File written by ``save_samples`` or ``open_sample_file``
+        sample_format (str, optional): The file's format. Defaults to None (taken
+            from the file extension, with 'txt' for unknown ones)
+
+    Returns:
+        numpy.ndarray: The samples, a read-only numpy.memmap for 'npy' and 'bin'
+    """
+    if sample_format is None:
+        extension = os.path.splitext(path)[1].lstrip(".")
+        sample_format = extension if extension in SAMPLE_FORMATS else "txt"
+    if sample_format == "npy":
+        return np.load(path, mmap_mode="r")
+    if sample_format == "bin":
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype="<f8")
+        return np.memmap(path, mode="r", dtype="<f8")
+    return np.atleast_1d(np.loadtxt(path))
+
+
+def _truncate_sample_file(path, offset, n_samples, sample_format):
+    """Cut a file from ``open_sample_file`` down to its first ``n_samples`` samples."""
+    with open(path, "r+b") as file:
+        if sample_format == "npy":
+            # NumPy pads the header so the shape can be rewritten in place
+            np.lib.format.write_array_header_1_0(
+                file,
+                {"descr": "<f8", "fortran_order": False, "shape": (n_samples,)},
+            )
+        file.truncate(offset + 8 * n_samples)
@@ -0,0 +1,271 @@
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Count, mean and variance of values added in chunks, in constant memory.
+
+    Each chunk's mean and sum of squared deviations are merged with the running
+    totals using the pairwise update of Chan, Golub and LeVeque, which stays
+    accurate for long runs where a naive sum of squares would lose precision.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, values):
+        """Add an array of values."""
+        values = np.asarray(values, dtype=float).ravel()
+        count = len(values)
+        if count == 0:
+            return
+        chunk_mean = float(np.mean(values))
+        chunk_m2 = float(np.sum((values - chunk_mean) ** 2))
+        total = self.count + count
+        delta = chunk_mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += chunk_m2 + delta**2 * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """Population variance of the values added so far (nan if there are none)."""
+        return self._m2 / self.count if self.count else float("nan")
+
+    @property
+    def std(self):
+        """Population standard deviation of the values added so far."""
+        return float(np.sqrt(self.variance))
+
+
+class QuantileSketch:
+    """
+    Streaming quantile estimator with fixed memory and a relative error bound.
+
+    Values are counted in logarithmically spaced buckets, as in DDSketch (Masson,
+    Rim and Lee, 2019). With ``gamma = (1 + alpha) / (1 - alpha)``, bucket ``i``
+    holds magnitudes in ``(gamma**(i - 1), gamma**i]`` and is represented by
+    ``2 * gamma**i / (gamma + 1)``. Every estimate of the ``q`` quantile is then
+    within a relative error ``alpha`` of the exact order statistic
+    ``x = sorted(values)[floor(q * (n - 1))]``::
+
+        |estimate - x| <= alpha * |x|
+
+    The bound holds for magnitudes between ``min_value`` and ``max_value``.
+    Smaller magnitudes are counted as zero, so their absolute error is below
+    ``min_value``. Larger ones are clamped to the top bucket. Memory is fixed at
+    about ``2 * log(max_value / min_value) / log(gamma)`` counters, which is 4,837
+    per sign (78 KB in total) with the defaults, however many values are added.
+
+    Args:
+        relative_accuracy (float, optional): The relative error bound alpha. Defaults to 0.005
+        min_value (float, optional): Smallest magnitude distinguished from zero. Defaults to 1e-9
+        max_value (float, optional): Largest magnitude with the error bound. Defaults to 1e12
+    """
+
+    def __init__(self, relative_accuracy=0.005, min_value=1e-9, max_value=1e12):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        if not 0 < min_value < max_value:
+            raise ValueError("min_value must be positive and below max_value")
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.count = 0
+        self._log_gamma = np.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self._offset = int(np.ceil(np.log(min_value) / self._log_gamma))
+        n_buckets = int(np.ceil(np.log(max_value) / self._log_gamma)) - self._offset + 1
+        self._positive = np.zeros(n_buckets, dtype=np.int64)
+        self._negative = np.zeros(n_buckets, dtype=np.int64)
+        self._zero = 0
+
+    def add(self, values):
+        """Add an array of values."""
+        values = np.asarray(values, dtype=float).ravel()
+        magnitudes = np.abs(values)
+        counted = magnitudes >= self.min_value
+        self._zero += len(values) - int(np.count_nonzero(counted))
+
+        magnitudes = np.minimum(magnitudes[counted], self.max_value)
+        buckets = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        buckets = np.clip(buckets - self._offset, 0, len(self._positive) - 1)
+        positive = values[counted] > 0
+        n_buckets = len(self._positive)
+        self._positive += np.bincount(buckets[positive], minlength=n_buckets)
+        self._negative += np.bincount(buckets[~positive], minlength=n_buckets)
+        self.count += len(values)
+
+    def quantile(self, q):
+        """
+        Estimate the ``q`` quantile, or an array of quantiles.
+
+        Args:
+            q (float or array_like): Quantile level(s) between 0 and 1
+
+        Returns:
+            float or numpy.ndarray: The estimates (nan if no values were added)
+        """
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+
+        # Buckets in increasing order of value: negatives, zero, positives
+        counts = np.concatenate([self._negative[::-1], [self._zero], self._positive])
+        positions = np.searchsorted(
+            np.cumsum(counts), q * (self.count - 1), side="right"
+        )
+        n_buckets = len(self._positive)
+        signs = np.sign(positions - n_buckets)
+        buckets = np.where(
+            signs < 0, n_buckets - 1 - positions, positions - n_buckets - 1
+        )
+        magnitudes = (
+            2
+            * np.exp((buckets + self._offset) * self._log_gamma)
+            / (1 + np.exp(self._log_gamma))
+        )
+        return (signs * magnitudes)[()]
+
+
+def chunked_percentile(samples, q, block_size=2**20, max_selected=2**20):
+    """
+    Exact percentiles of a large array, e.g. a memory-mapped file, in bounded memory.
+
+    Equals ``np.percentile(samples, q)`` (linear interpolation between order
+    statistics) without the copy of the whole array that np.percentile partitions.
+    Each order statistic is found by narrowing down a range of values: a first pass
+    finds the minimum and maximum, then each pass counts the values in 65,536
+    equal-width bins of the range and keeps the bin holding the statistic. Once at
+    most ``max_selected`` values are left in the range, they are read and
+    partitioned. Smooth distributions of up to 10^9 values need three passes.
+
+    Args:
+        samples (array_like): One-dimensional array of finite values
+        q (float or array_like): Percentile(s) between 0 and 100
+        block_size (int, optional): Values read at a time. Defaults to 2**20
+        max_selected (int, optional): Most values read into memory to select an order
+            statistic. Defaults to 2**20
+
+    Returns:
+        float or numpy.ndarray: The percentile(s), nan for an empty array
+    """
+    q = np.asarray(q, dtype=float)
+    n_values = len(samples)
+    if n_values == 0:
+        return np.full(q.shape, np.nan)[()]
+
+    positions = q / 100 * (n_values - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, n_values - 1)
+    ranks = sorted(set(lower.ravel().tolist()) | set(upper.ravel().tolist()))
+    values = _order_statistics(samples, ranks, block_size, max_selected)
+    low = np.vectorize(values.get, otypes=[float])(lower)
+    high = np.vectorize(values.get, otypes=[float])(upper)
+
+    # The same interpolation as np.percentile, which is exact at both ends
+    fraction = positions - lower
+    difference = high - low
+    return np.where(
+        fraction >= 0.5,
+        high - difference * (1 - fraction),
+        low + difference * fraction,
+    )[()]
+
+
+# Bins per pass of _order_statistics
+_SELECTION_BINS = 65536
+
+
+def _order_statistics(samples, ranks, block_size, max_selected):
+    """Map each rank (0-based position in sorted order) to its value, reading in blocks."""
+    blocks = [
+        (start, start + block_size) for start in range(0, len(samples), block_size)
+    ]
+    minimum = min(float(np.min(samples[start:stop])) for start, stop in blocks)
+    maximum = max(float(np.max(samples[start:stop])) for start, stop in blocks)
+
+    # Each unresolved rank lies in a range of values (lowest, highest) that holds
+    # `inside` values, with `below` values under it
+    ranges = {rank: (minimum, maximum, 0, len(samples)) for rank in ranks}
+    values = {}
+    while ranges:
+        groups = {}
+        for rank, value_range in ranges.items():
+            groups.setdefault(value_range, []).append(rank)
+        counts, selected = {}, {}
+        for value_range in groups:
+            lowest, highest, _, inside = value_range
+            if lowest == highest:
+                values.update(dict.fromkeys(groups[value_range], lowest))
+            elif inside <= max_selected:
+                selected[value_range] = []
+            else:
+                counts[value_range] = np.zeros(_SELECTION_BINS, dtype=np.int64)
+        if not counts and not selected:
+            break
+
+        edges = {
+            value_range: np.linspace(
+                value_range[0], value_range[1], _SELECTION_BINS + 1
+            )
+            for value_range in counts
+        }
+        for start, stop in blocks:
+            block = np.asarray(samples[start:stop], dtype=float)
+            for value_range in [*counts, *selected]:
+                lowest, highest = value_range[:2]
+                in_range = block[(block >= lowest) & (block <= highest)]
+                if value_range in selected:
+                    selected[value_range].append(in_range)
+                else:
+                    counts[value_range] += np.bincount(
+                        _bin_indices(in_range, edges[value_range]),
+                        minlength=_SELECTION_BINS,
+                    )
+
+        ranges = {}
+        for value_range, chunks in selected.items():
+            below = value_range[2]
+            in_range = np.concatenate(chunks)
+            kth = [rank - below for rank in groups[value_range]]
+            in_range.partition(kth)
+            values.update(
+                {rank: float(in_range[rank - below]) for rank in groups[value_range]}
+            )
+        for value_range, bin_counts in counts.items():
+            highest, below = value_range[1], value_range[2]
+            cumulative = np.cumsum(bin_counts)
+            bin_edges = edges[value_range]
+            for rank in groups[value_range]:
+                index = int(np.searchsorted(cumulative, rank - below, side="right"))
+                # Bins are half-open, except the last, which ends at the range's end
+                bin_end = (
+                    highest
+                    if index == _SELECTION_BINS - 1
+                    else float(np.nextafter(bin_edges[index + 1], -np.inf))
+                )
+                ranges[rank] = (
+                    float(bin_edges[index]),
+                    bin_end,
+                    below + (int(cumulative[index - 1]) if index else 0),
+                    int(bin_counts[index]),
+                )
+    return values
+
+
+def _bin_indices(values, edges):
+    """Indices of the half-open bins between edges (the last bin is closed) holding values."""
+    n_bins = len(edges) - 1
+    with np.errstate(invalid="ignore", over="ignore"):
+        scale = n_bins / (edges[-1] - edges[0])
+        indices = np.clip(((values - edges[0]) * scale).astype(np.int64), 0, n_bins - 1)
+    # Rounding can put values next to a bin edge in the neighbouring bin
+    upper_edges = np.append(edges[1:-1], np.inf)
+    wrong = (values < edges[indices]) | (values >= upper_edges[indices])
+    if np.any(wrong):
+        indices[wrong] = np.clip(
+            np.searchsorted(edges, values[wrong], side="right") - 1, 0, n_bins - 1
+        )
+    return indices
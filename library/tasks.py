@@ -0,0 +1,536 @@
+import threading
+import time
+from queue import Full
+import numpy as np
+from library.cancellation import CancellationToken
+from library.diagnostics import chain_diagnostics
+from library.mcmc_utils import target_distribution, proposal_distribution
+from library.mcmc_algorithms import (
+    metropolis_hastings,
+    adaptive_metropolis_hastings,
+    metropolis_hastings_stream,
+    adaptive_metropolis_hastings_stream,
+    parallel_tempering,
+    parallel_tempering_stream,
+    metropolis_adjusted_langevin,
+    metropolis_adjusted_langevin_stream,
+    hamiltonian_monte_carlo,
+    hamiltonian_monte_carlo_stream,
+    temperature_ladder,
+    RNG_BLOCK_SIZE,
+)
+from library.profiling import RunProfiler
+from library.progress import CallbackProgress, NullProgress, ProgressReporter
+
+SAMPLERS = ("mh", "amh", "pt", "mala", "hmc")
+
+# Streaming counterpart of each sampler
+SAMPLER_STREAMS = {
+    "mh": metropolis_hastings_stream,
+    "amh": adaptive_metropolis_hastings_stream,
+    "pt": parallel_tempering_stream,
+    "mala": metropolis_adjusted_langevin_stream,
+    "hmc": hamiltonian_monte_carlo_stream,
+}
+
+
+class TaskTimeoutError(RuntimeError):
+    """Raised when a task does not finish within its timeout."""
+
+
+class TaskCancelledError(RuntimeError):
+    """Raised when a running task is stopped because it was cancelled."""
+
+
+class TaskSupervisor(ProgressReporter):
+    """
+    Progress reporter that stops a sampler run past its deadline or on cancellation.
+
+    Updates are forwarded to the wrapped reporter. The deadline is checked at least
+    every ``RNG_BLOCK_SIZE`` iterations, and ``TaskTimeoutError`` is raised from
+    inside the sampler loop, so a task that timed out frees its worker within
+    milliseconds instead of running to completion. The cancellation event may live
+    in another process, so it is polled at most every ``cancel_interval`` seconds
+    and raises ``TaskCancelledError`` once set. Unlike a ``CancellationToken``
+    passed to a sampler, which keeps the samples so far, the supervisor fails the
+    run, as a task whose caller has gone away has no use for partial results.
+
+    Args:
+        progress (ProgressReporter): Reporter to forward progress to
+        deadline (float, optional): Wall-clock time (as returned by ``time.time``) to
+            stop at. Defaults to None (no limit)
+        cancel_event (threading.Event, optional): Event, or a manager proxy of one,
+            that requests the run to stop. Defaults to None
+        cancel_interval (float, optional): Minimum seconds between polls of the
+            cancellation event. Defaults to 0.1
+    """
+
+    def __init__(self, progress, deadline=None, cancel_event=None, cancel_interval=0.1):
+        super().__init__(min_interval=0, every=min(progress.every, RNG_BLOCK_SIZE))
+        self.progress = progress
+        self.token = CancellationToken(
+            deadline=deadline, event=cancel_event, poll_interval=cancel_interval
+        )
+
+    def check(self):
+        """Raise if the deadline has passed or the run has been cancelled."""
+        if self.token.expired:
+            raise TaskTimeoutError("Sampling did not finish before its deadline")
+        if self.token.cancelled:
+            raise TaskCancelledError("Sampling was cancelled")
+
+    def begin(self, total):
+        self.check()
+        self.progress.start(total)
+
+    def update(self, completed, **stats):
+        self.check()
+        self.progress.update(completed, **stats)
+
+    def finish(self, completed, **stats):
+        self.progress.finish(completed, **stats)
+
+    def end(self):
+        self.progress.end()
+
+
+def initialize_worker():
+    """
+    Prepare a worker process for sampling.
+
+    Compiling the default target imports sympy, which is otherwise loaded on first
+    use, and warms the worker's own compiled-target cache, so the first request a
+    worker serves does not pay the import and compile cost.
+    """
+    target_distribution()
+
+
+def run_sampler(sampler, params, progress=None, deadline=None, cancel_event=None):
+    """
+    Compile the target and run one sampler in the current process.
+
+    Only plain data goes in and out, so this can be submitted to a process pool.
+
+    Args:
+        sampler (str): 'mh', 'amh', 'pt', 'mala' or 'hmc'
+        params (dict): Sampler parameters with the field names of the API request
+            models (expression, log_density, initial, iterations, burn_in, thin, seed,
+            credible_interval, return_samples and, for 'amh', the adaptation parameters,
+            for 'pt', the temperature ladder and swap parameters or, for 'mala' and
+            'hmc', the step size parameters). With 'profile' true, the run is timed
+            phase by phase, and 'profile_report' may add a 'cprofile' or 'memory'
+            report (see ``RunProfiler``)
+        progress (ProgressReporter, optional): Progress reporter passed to the sampler,
+            e.g. a ``SharedProgress`` to report back to the parent process
+        deadline (float, optional): Wall-clock time (as returned by ``time.time``) after
+            which the run stops with ``TaskTimeoutError``. Defaults to None (no limit)
+        cancel_event (threading.Event, optional): Event, or a manager proxy of one, that
+            stops the run with ``TaskCancelledError`` once set. Defaults to None
+
+    Returns:
+        dict: samples (numpy.ndarray, or None if return_samples is false), elapsed_time,
+            acceptance_rate, mean, median, credible_interval, diagnostics (see
+            ``chain_diagnostics``; None without samples, with None for undefined values)
+            and, for 'amh', acceptance_rates, for 'pt', temperatures and swap_rates or,
+            for 'mala' and 'hmc', the adapted step_size. Profiled runs add the
+            profile from ``RunProfiler.result``
+    """
+    if deadline is not None or cancel_event is not None:
+        progress = TaskSupervisor(
+            NullProgress() if progress is None else progress,
+            deadline=deadline,
+            cancel_event=cancel_event,
+        )
+
+    profiler = RunProfiler(params.get("profile", False), params.get("profile_report"))
+    with profiler:
+        with profiler.phase("compile"):
+            args, kwargs = _sampler_arguments(sampler, params)
+        args[0] = profiler.count_evaluations(args[0])
+        kwargs.update(
+            credible_interval=params.get("credible_interval", 0.95),
+            progress=progress,
+            return_samples=params.get("return_samples", True),
+        )
+
+        with profiler.phase("sampling"):
+            samples, elapsed_time, acceptance_rate, mean, median, ci, extra = _sample(
+                sampler, args, kwargs
+            )
+        # The sampler reports its loop's time; the rest went on setup and statistics
+        profiler.split("sampling", "statistics", elapsed_time)
+        with profiler.phase("diagnostics"):
+            result = _sampler_result(
+                samples, elapsed_time, acceptance_rate, mean, median, ci, **extra
+            )
+    if profiler.enabled:
+        iterations = params.get("iterations", 10000) + kwargs["burn_in"]
+        result["profile"] = profiler.result(iterations)
+    return result
+
+
+def stream_sampler(
+    sampler, params, queue, chunk_size=10000, deadline=None, cancel_event=None
+):
+    """
+    Compile the target and run one sampler, putting its samples on a queue in chunks.
+
+    The queue receives ``('samples', numpy.ndarray)`` records as the chain produces
+    them, followed by one ``('summary', dict)`` record with the n_samples,
+    elapsed_time, acceptance_rate, mean, std, median and credible_interval (and, for
+    'amh', acceptance_rates, for 'pt', temperatures and swap_rates or, for 'mala'
+    and 'hmc', step_size). The median and credible interval are streaming
+    estimates (see ``SampleStream``).
+    With a bounded queue, such as one from ``SamplerPool.shared_queue``, the chain
+    waits for the consumer, so memory use stays flat however long it runs. The
+    deadline and cancel event are honoured while waiting.
+
+    Args:
+        sampler (str): 'mh', 'amh', 'pt', 'mala' or 'hmc'
+        params (dict): Sampler parameters, as for ``run_sampler``
+        queue (queue.Queue): Queue, or a manager proxy of one, to put records on
+        chunk_size (int, optional): Maximum number of samples per chunk. Defaults to 10000
+        deadline (float, optional): Wall-clock time after which the run stops with
+            ``TaskTimeoutError``. Defaults to None (no limit)
+        cancel_event (threading.Event, optional): Event that stops the run with
+            ``TaskCancelledError`` once set. Defaults to None
+    """
+    supervisor = TaskSupervisor(
+        NullProgress(), deadline=deadline, cancel_event=cancel_event
+    )
+    args, kwargs = _sampler_arguments(sampler, params)
+    kwargs.update(
+        credible_interval=params.get("credible_interval", 0.95),
+        chunk_size=chunk_size,
+        progress=supervisor,
+    )
+    stream = SAMPLER_STREAMS[sampler](*args, **kwargs)
+
+    for chunk in stream:
+        _put(queue, ("samples", chunk), supervisor)
+
+    summary = {
+        "n_samples": int(stream.summary["n_samples"]),
+        "elapsed_time": float(stream.summary["elapsed_time"]),
+        "acceptance_rate": float(stream.summary["acceptance_rate"]),
+        "mean": float(stream.summary["mean"]),
+        "std": float(stream.summary["std"]),
+        "median": float(stream.summary["median"]),
+        "credible_interval": tuple(
+            float(bound) for bound in stream.summary["credible_interval"]
+        ),
+    }
+    for key in ("acceptance_rates", "temperatures", "swap_rates"):
+        if key in stream.summary:
+            summary[key] = [float(value) for value in stream.summary[key]]
+    if "step_size" in stream.summary:
+        summary["step_size"] = float(stream.summary["step_size"])
+    _put(queue, ("summary", summary), supervisor)
+
+
+class BackgroundRun:
+    """
+    A sampler run in a background thread, whose samples can be read as it runs.
+
+    The chain runs through its stream (see ``metropolis_hastings_stream``) and each
+    chunk is kept as soon as it is produced, so a caller such as the web app can draw
+    the samples so far while the chain continues. Once the run has finished,
+    ``result`` returns the same dictionary as ``run_sampler``, with the statistics
+    computed exactly from all samples, and 'truncated' saying whether ``stop`` ended
+    the run early.
+
+    With ``idle_timeout`` set, a run that nobody has read for that long, e.g. because
+    the web app session that started it has gone, is cancelled, so abandoned runs do
+    not keep using a CPU.
+
+    Args:
+        sampler (str): 'mh', 'amh', 'pt', 'mala' or 'hmc'
+        params (dict): Sampler parameters, as for ``run_sampler``
+        chunk_size (int, optional): Samples per chunk, i.e. how often new samples become
+            visible. Defaults to 10000
+        idle_timeout (float, optional): Seconds without a read of ``done``,
+            ``completed``, ``samples`` or ``result`` after which the run is cancelled.
+            Defaults to None (never)
+
+    Attributes:
+        total (int): Iterations of the run, burn-in included
+    """
+
+    def __init__(self, sampler, params, chunk_size=10000, idle_timeout=None):
+        self.sampler = sampler
+        self.params = dict(params)
+        self.chunk_size = chunk_size
+        self.idle_timeout = idle_timeout
+        self.total = params.get("iterations", 10000) + params.get("burn_in", 1000)
+        self._chunks = []
+        self._completed = 0
+        self._result = None
+        self._error = None
+        self._last_read = time.monotonic()
+        self._waiting = 0
+        self._stop = CancellationToken()
+        self._cancel_event = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def done(self):
+        """Whether the run has finished, failed or been cancelled."""
+        self._last_read = time.monotonic()
+        return self._done.is_set()
+
+    @property
+    def stopped(self):
+        """Whether ``stop`` has been called."""
+        return self._stop.cancelled
+
+    @property
+    def completed(self):
+        """Iterations completed so far, burn-in included."""
+        self._last_read = time.monotonic()
+        return self._completed
+
+    def samples(self):
+        """All samples produced so far, as one numpy.ndarray."""
+        self._last_read = time.monotonic()
+        if self._result is not None:
+            return self._result["samples"]
+        chunks = list(self._chunks)
+        return np.concatenate(chunks) if chunks else np.array([])
+
+    def result(self, timeout=None):
+        """
+        Wait for the run to finish and return its result.
+
+        A caller waiting here counts as reading the run, so it is not cancelled as idle.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to None (no limit)
+
+        Returns:
+            dict: The result, as returned by ``run_sampler``, and 'truncated'
+
+        Raises:
+            TaskTimeoutError: If the run has not finished within timeout
+            Exception: The error the run failed with, e.g. ``TaskCancelledError``
+        """
+        self._waiting += 1
+        try:
+            finished = self._done.wait(timeout)
+        finally:
+            self._waiting -= 1
+            self._last_read = time.monotonic()
+        if not finished:
+            raise TaskTimeoutError("Sampling has not finished")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def stop(self):
+        """
+        Stop the run early, keeping its samples so far.
+
+        The chain stops within one block of iterations, and ``result`` then returns
+        the statistics of the samples so far, with 'truncated' true.
+        """
+        self._stop.cancel()
+
+    def cancel(self):
+        """Stop the run within milliseconds. ``result`` then raises ``TaskCancelledError``."""
+        self._cancel_event.set()
+
+    def _run(self):
+        try:
+            supervisor = TaskSupervisor(
+                CallbackProgress(self._record_progress, min_interval=0),
+                cancel_event=self._cancel_event,
+            )
+            args, kwargs = _sampler_arguments(self.sampler, self.params)
+            kwargs.update(
+                credible_interval=self.params.get("credible_interval", 0.95),
+                chunk_size=self.chunk_size,
+                progress=supervisor,
+                cancel=self._stop,
+            )
+            stream = SAMPLER_STREAMS[self.sampler](*args, **kwargs)
+            for chunk in stream:
+                self._chunks.append(chunk)
+
+            # The stream's quantiles are estimates, so they are computed again exactly
+            samples = np.concatenate(self._chunks) if self._chunks else np.array([])
+            alpha = (1 - self.params.get("credible_interval", 0.95)) / 2
+            if len(samples):
+                statistics = (
+                    np.mean(samples),
+                    np.median(samples),
+                    np.percentile(samples, [100 * alpha, 100 * (1 - alpha)]),
+                )
+            else:
+                # A run stopped during burn-in has no samples to summarize
+                statistics = (np.nan, np.nan, (np.nan, np.nan))
+            self._result = _sampler_result(
+                samples,
+                stream.summary["elapsed_time"],
+                stream.summary["acceptance_rate"],
+                *statistics,
+                stream.summary.get("acceptance_rates"),
+                temperatures=stream.summary.get("temperatures"),
+                swap_rates=stream.summary.get("swap_rates"),
+                step_size=stream.summary.get("step_size"),
+            )
+            self._result["truncated"] = stream.summary["truncated"]
+            self._completed = stream.summary["iterations"]
+            self._chunks = []
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Raised to the caller by result()
+            self._error = e
+        finally:
+            self._done.set()
+
+    def _record_progress(self, completed, _total, _stats):
+        self._completed = completed
+        if (
+            self.idle_timeout is not None
+            and not self._waiting
+            and time.monotonic() - self._last_read > self.idle_timeout
+        ):
+            self._cancel_event.set()
+
+
+def _sampler_result(
+    samples,
+    elapsed_time,
+    acceptance_rate,
+    mean,
+    median,
+    ci,
+    acceptance_rates=None,
+    temperatures=None,
+    swap_rates=None,
+    step_size=None,
+):
+    """Plain-data result of a sampler run, with its diagnostics."""
+    result = {
+        "samples": samples,
+        "elapsed_time": float(elapsed_time),
+        "acceptance_rate": float(acceptance_rate),
+        "mean": float(mean),
+        "median": float(median),
+        "credible_interval": (float(ci[0]), float(ci[1])),
+        "diagnostics": None,
+    }
+    if samples is not None:
+        result["diagnostics"] = {
+            # NaN is not valid JSON, so undefined diagnostics are reported as None
+            key: value if value is not None and np.isfinite(value) else None
+            for key, value in chain_diagnostics(samples, elapsed_time).items()
+        }
+    if acceptance_rates is not None:
+        result["acceptance_rates"] = [float(rate) for rate in acceptance_rates]
+    if swap_rates is not None:
+        result["temperatures"] = [float(value) for value in temperatures]
+        result["swap_rates"] = [float(rate) for rate in swap_rates]
+    if step_size is not None:
+        result["step_size"] = float(step_size)
+    return result
+
+
+def _sample(sampler, args, kwargs):
+    """
+    Run a sampler with the arguments from ``_sampler_arguments``.
+
+    Returns:
+        tuple: samples, elapsed_time, acceptance_rate, mean, median, credible
+            interval, and a dict of the sampler's own results for ``_sampler_result``
+    """
+    if sampler == "mh":
+        samples, elapsed_time, acceptance_rate, mean, median, ci = metropolis_hastings(
+            *args, **kwargs
+        )
+        return samples, elapsed_time, acceptance_rate, mean, median, ci, {}
+    if sampler == "pt":
+        samples, elapsed_time, acceptance_rate, swap_rates, mean, median, ci = (
+            parallel_tempering(*args, **kwargs)
+        )
+        extra = {
+            "temperatures": temperature_ladder(
+                kwargs["n_temperatures"],
+                kwargs["max_temperature"],
+                kwargs["temperatures"],
+            ),
+            "swap_rates": swap_rates,
+        }
+        return samples, elapsed_time, acceptance_rate, mean, median, ci, extra
+    if sampler in ("mala", "hmc"):
+        sample = (
+            metropolis_adjusted_langevin
+            if sampler == "mala"
+            else hamiltonian_monte_carlo
+        )
+        samples, elapsed_time, acceptance_rate, step_size, mean, median, ci = sample(
+            *args, **kwargs
+        )
+        extra = {"step_size": step_size}
+        return samples, elapsed_time, acceptance_rate, mean, median, ci, extra
+
+    samples, elapsed_time, acceptance_rate, acceptance_rates, mean, median, ci = (
+        adaptive_metropolis_hastings(*args, **kwargs)
+    )
+    extra = {"acceptance_rates": acceptance_rates}
+    return samples, elapsed_time, acceptance_rate, mean, median, ci, extra
+
+
+def _sampler_arguments(sampler, params):
+    """Compile the target and map request parameters to sampler arguments."""
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler '{sampler}'")
+
+    target_dist = target_distribution(
+        params.get("expression"), log_density=params.get("log_density", False)
+    )
+    args = [target_dist, params.get("initial", 0.0), params.get("iterations", 10000)]
+    kwargs = {
+        "burn_in": params.get("burn_in", 1000),
+        "thin": params.get("thin", 1),
+        "seed": params.get("seed"),
+    }
+    if sampler == "mh":
+        args.insert(1, proposal_distribution)
+    elif sampler == "pt":
+        kwargs.update(
+            temperatures=params.get("temperatures"),
+            n_temperatures=params.get("n_temperatures", 8),
+            max_temperature=params.get("max_temperature", 100.0),
+            proposal_scale=params.get("proposal_scale", 1.0),
+            swap_interval=params.get("swap_interval", 1),
+        )
+    elif sampler == "mala":
+        kwargs.update(
+            step_size=params.get("step_size", 1.0),
+            target_acceptance=params.get("target_acceptance", 0.574),
+        )
+    elif sampler == "hmc":
+        kwargs.update(
+            step_size=params.get("step_size", 0.5),
+            n_leapfrog=params.get("n_leapfrog", 10),
+            target_acceptance=params.get("target_acceptance", 0.8),
+        )
+    else:
+        kwargs.update(
+            initial_variance=params.get("initial_variance", 1.0),
+            check_interval=params.get("check_interval", 200),
+            increase_factor=params.get("increase_factor", 1.1),
+            decrease_factor=params.get("decrease_factor", 0.9),
+        )
+    return args, kwargs
+
+
+def _put(queue, record, supervisor):
+    """Put a record on a bounded queue, checking the supervisor while it is full."""
+    while True:
+        try:
+            queue.put(record, timeout=0.1)
+            return
+        except Full:
+            supervisor.check()
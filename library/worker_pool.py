@@ -0,0 +1,280 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from library.metrics import REGISTRY
+from library.tasks import initialize_worker, TaskTimeoutError
+
+# In a worker process, the parent's dictionary of worker metrics and this worker's key
+_worker_metrics = None
+_worker_key = None
+
+
+# Weight of the latest task in the moving average of task durations
+DURATION_SMOOTHING = 0.2
+
+
+class PoolSaturatedError(RuntimeError):
+    """
+    Raised when the pool's queue is full and a task cannot be accepted.
+
+    Attributes:
+        retry_after (int): Estimated seconds until the pool can accept a task
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SamplerPool:
+    """
+    Process pool that runs CPU-bound sampling off the asyncio event loop.
+
+    Workers are started with the 'spawn' method, import NumPy and sympy on startup
+    and keep their own compiled-target caches. After each task, a worker publishes
+    a snapshot of its metrics, which ``worker_metrics`` returns for the parent to
+    render with its own. At most ``max_workers + max_queue``
+    tasks are accepted at once; further submissions raise ``PoolSaturatedError``
+    instead of queueing without bound, with an estimate of when to retry from a
+    moving average of task durations.
+
+    Args:
+        max_workers (int, optional): Number of worker processes. 0 runs tasks in a
+            single background thread instead. Defaults to the number of CPUs
+        max_queue (int, optional): Tasks allowed to wait for a free worker. Defaults to 64
+        timeout (float, optional): Seconds before a task's result is abandoned.
+            Defaults to 300
+    """
+
+    def __init__(self, max_workers=None, max_queue=64, timeout=300.0):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._manager = None
+        self._worker_metrics = None
+        self._pending = 0
+        self._mean_duration = 1.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a pool configured by environment variables.
+
+        ``MCMC_WORKERS`` sets the number of worker processes, ``MCMC_MAX_QUEUE`` the
+        queue depth and ``MCMC_REQUEST_TIMEOUT`` the per-task timeout in seconds.
+        """
+        workers = os.environ.get("MCMC_WORKERS")
+        return cls(
+            max_workers=int(workers) if workers else None,
+            max_queue=int(os.environ.get("MCMC_MAX_QUEUE", "64")),
+            timeout=float(os.environ.get("MCMC_REQUEST_TIMEOUT", "300")),
+        )
+
+    @property
+    def pending(self):
+        """Number of tasks running or waiting for a worker."""
+        return self._pending
+
+    def start(self):
+        """Start the workers and wait until each has finished initializing."""
+        executor = self._get_executor()
+        # The executor only spawns processes on demand, so occupy every worker once
+        warmups = [executor.submit(initialize_worker) for _ in range(self.max_workers)]
+        for warmup in warmups:
+            warmup.result()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit ``fn(*args, **kwargs)`` to the pool without waiting for it.
+
+        Returns:
+            concurrent.futures.Future: Future for the task's result
+
+        Raises:
+            PoolSaturatedError: If the pool is running and queueing its maximum number of tasks
+        """
+        with self._lock:
+            if self._pending >= max(1, self.max_workers) + self.max_queue:
+                raise PoolSaturatedError(
+                    "Sampling queue is full, try again later",
+                    retry_after=self._retry_after(),
+                )
+            self._pending += 1
+
+        if self.max_workers > 0:
+            # Workers publish their metrics after each task
+            fn, args = _run_task, (fn, *args)
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        start_time = time.monotonic()
+        future.add_done_callback(lambda f: self._task_done(f, start_time))
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` in the pool and await its result.
+
+        After ``timeout`` seconds a queued task is cancelled and the caller gets
+        ``TaskTimeoutError``. A task that is already running cannot be interrupted
+        and keeps its worker (and counts as pending) until it returns, so long
+        tasks should stop themselves, e.g. ``run_sampler`` with a ``deadline``.
+
+        Raises:
+            PoolSaturatedError: If the pool is running and queueing its maximum number of tasks
+            TaskTimeoutError: If the task does not finish within ``timeout`` seconds
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=self.timeout
+            )
+        except asyncio.TimeoutError as e:
+            future.cancel()
+            raise TaskTimeoutError(
+                f"Sampling did not finish within {self.timeout:g} seconds"
+            ) from e
+
+    def shared_dict(self):
+        """
+        Return a new dictionary that worker processes can write to.
+
+        The dictionary is served by a manager process that is started on first use.
+        """
+        return self._get_manager().dict()
+
+    def shared_queue(self, maxsize=0):
+        """
+        Return a new queue that worker processes can put records on.
+
+        The queue is served by the same manager process as ``shared_dict``.
+
+        Args:
+            maxsize (int, optional): Maximum number of queued records. 0 means no limit.
+                Defaults to 0
+        """
+        return self._get_manager().Queue(maxsize)
+
+    def shared_event(self):
+        """
+        Return a new event that can be set here and checked by worker processes.
+
+        The event is served by the same manager process as ``shared_dict``.
+        """
+        return self._get_manager().Event()
+
+    def worker_metrics(self):
+        """
+        Latest metrics snapshot of each worker process that has run a task.
+
+        Returns:
+            list: Snapshots for ``MetricsRegistry.render``. Empty in thread mode, where
+                tasks report to this process's registry directly
+        """
+        with self._lock:
+            metrics = self._worker_metrics
+        if metrics is None:
+            return []
+        try:
+            return list(metrics.values())
+        except (OSError, EOFError):  # The manager has shut down
+            return []
+
+    def shutdown(self, wait=True):
+        """Stop accepting tasks, cancel queued ones and wait for running ones."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            manager, self._manager = self._manager, None
+            self._worker_metrics = None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+    def _task_done(self, future, start_time):
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled():
+                duration = time.monotonic() - start_time
+                self._mean_duration += DURATION_SMOOTHING * (
+                    duration - self._mean_duration
+                )
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            # A worker died (e.g. out of memory); replace the pool for later tasks
+            self._reset_executor()
+
+    def _retry_after(self):
+        """Seconds for the running and queued tasks to drain by one slot, rounded up."""
+        # Called with the lock held, by a full pool
+        queued = self._pending - max(1, self.max_workers) + 1
+        seconds = self._mean_duration * queued / max(1, self.max_workers)
+        return max(1, math.ceil(seconds))
+
+    def _get_manager(self):
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context("spawn").Manager()
+            return self._manager
+
+    def _get_executor(self):
+        # Created before taking the lock, which _get_manager takes too
+        metrics = None if self.max_workers == 0 else self._get_worker_metrics()
+        with self._lock:
+            if self._executor is None:
+                if self.max_workers == 0:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+                else:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_initialize_worker,
+                        initargs=(metrics,),
+                    )
+            return self._executor
+
+    def _get_worker_metrics(self):
+        manager = self._get_manager()
+        with self._lock:
+            if self._worker_metrics is None:
+                self._worker_metrics = manager.dict()
+            return self._worker_metrics
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _initialize_worker(metrics):
+    """Prepare a worker process, remembering where to publish its metrics."""
+    global _worker_metrics, _worker_key  # pylint: disable=global-statement
+    _worker_metrics = metrics
+    # Unlike process ids, random keys are never reused by a later worker
+    _worker_key = uuid.uuid4().hex
+    initialize_worker()
+
+
+def _run_task(fn, *args, **kwargs):
+    """Run a task in a worker process, then publish the worker's metrics."""
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if _worker_metrics is not None:
+            try:
+                _worker_metrics[_worker_key] = REGISTRY.snapshot()
+            except (OSError, EOFError):  # The parent is shutting down
+                pass
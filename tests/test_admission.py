@@ -0,0 +1,78 @@
+import pytest
+from library.admission import (
+    AdmissionPolicy,
+    BudgetExceededError,
+    ClientQuotas,
+    QuotaExceededError,
+    estimate_cost,
+)
+from library.mcmc_utils import target_distribution
+
+
+def test_estimate_cost():
+    """Test that estimated costs scale with iterations, kept samples and evaluations."""
+    target = target_distribution()
+    assert all(seconds > 0 for seconds in target.evaluation_seconds.values())
+
+    cost = estimate_cost("mh", {"iterations": 10000, "burn_in": 1000}, target)
+    assert cost.iterations == 11000
+    assert cost.stored_samples == 10000
+    assert cost.stored_bytes == 80000
+    assert cost.evaluations == 11000
+
+    thinned = estimate_cost("mh", {"iterations": 10000, "thin": 3}, target)
+    assert thinned.stored_samples == 3334
+    summary = estimate_cost("mh", {"return_samples": False}, target)
+    assert summary.stored_bytes == 0
+
+    doubled = estimate_cost("mh", {"iterations": 21000, "burn_in": 1000}, target)
+    assert doubled.seconds == pytest.approx(2 * cost.seconds)
+
+    # Parallel tempering evaluates every replica, and HMC every leapfrog step
+    tempering = estimate_cost("pt", {"n_temperatures": 8}, target)
+    assert tempering.evaluations == 8 * cost.evaluations
+    assert tempering.seconds > cost.seconds
+    short = estimate_cost("hmc", {"n_leapfrog": 2}, target)
+    long = estimate_cost("hmc", {"n_leapfrog": 40}, target)
+    assert long.seconds > short.seconds
+
+
+def test_admission_policy():
+    """Test that a cost over any budget is rejected with the budget named."""
+    cost = estimate_cost("mh", {"iterations": 10000}, target_distribution())
+    AdmissionPolicy().check(cost)
+    AdmissionPolicy(max_iterations=11000, max_sample_bytes=80000).check(cost)
+
+    with pytest.raises(BudgetExceededError, match="iterations"):
+        AdmissionPolicy(max_iterations=10000).check(cost)
+    with pytest.raises(BudgetExceededError, match="thin"):
+        AdmissionPolicy(max_sample_bytes=1000).check(cost)
+    with pytest.raises(BudgetExceededError, match="seconds"):
+        AdmissionPolicy(max_seconds=1e-9).check(cost)
+
+
+def test_client_quotas():
+    """Test token bucket quotas and concurrency limits per client."""
+    quotas = ClientQuotas(rate=1.0, burst=10.0, max_concurrent=2)
+    quotas.acquire("a", 6.0)
+    quotas.acquire("a", 3.0)
+    with pytest.raises(QuotaExceededError) as excinfo:
+        quotas.acquire("a", 0.1)
+    assert excinfo.value.retry_after == 1
+    assert "in progress" in str(excinfo.value)
+
+    # Other clients have their own quotas
+    quotas.acquire("b", 10.0)
+    quotas.release("a")
+    with pytest.raises(QuotaExceededError) as excinfo:
+        quotas.acquire("a", 5.0)
+    assert excinfo.value.retry_after == 4
+
+    # A run costing more than the burst needs a full bucket
+    quotas.release("b")
+    with pytest.raises(QuotaExceededError):
+        quotas.acquire("b", 100.0)
+
+    unlimited = ClientQuotas()
+    for _ in range(100):
+        unlimited.acquire("a", 1e6)
@@ -1,5 +1,18 @@
+import asyncio
+import base64
+import io
+import json
+import time
+from concurrent.futures.process import BrokenProcessPool
+import httpx
+import numpy as np
+import pytest
 from fastapi.testclient import TestClient
+import api
 from api import app
+from library.admission import AdmissionPolicy, ClientQuotas
+from library.tasks import run_sampler
+from library.worker_pool import SamplerPool, PoolSaturatedError, TaskTimeoutError
 
 client = TestClient(app)
 
@@ -66,6 +79,63 @@ def test_amh_endpoint_default_distribution():
     assert data["credible_interval"][0] < data["credible_interval"][1]
 
 
+def test_pt_endpoint():
+    """Test the parallel tempering endpoint and its validation."""
+    response = client.post(
+        "/mcmc/pt",
+        json={
+            "expression": "exp(-(x - 5)**2 / 2) + exp(-(x + 5)**2 / 2)",
+            "iterations": 2000,
+            "burn_in": 100,
+            "temperatures": [1, 4, 16, 64],
+            "seed": 42,
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["x-cache"] == "miss"
+    data = response.json()
+    assert len(data["samples"]) == 2000
+    assert data["temperatures"] == [1, 4, 16, 64]
+    assert len(data["swap_rates"]) == 3
+    assert all(0 <= rate <= 1 for rate in data["swap_rates"])
+    assert min(data["samples"]) < 0 < max(data["samples"])
+
+    response = client.post("/mcmc/pt", json={"iterations": 100, "n_temperatures": 3})
+    assert len(response.json()["temperatures"]) == 3
+
+    for params in (
+        {"temperatures": [2, 4]},
+        {"temperatures": [1, 4, 2]},
+        {"max_temperature": 0.5},
+        {"swap_interval": 0},
+        {"proposal_scale": 0},
+    ):
+        assert client.post("/mcmc/pt", json=params).status_code == 422
+
+
+def test_gradient_endpoints():
+    """Test the MALA and HMC endpoints and their validation."""
+    params = {
+        "expression": "-1000 * x**2",
+        "log_density": True,
+        "iterations": 2000,
+        "burn_in": 500,
+        "seed": 42,
+    }
+    for sampler in ("mala", "hmc"):
+        response = client.post(f"/mcmc/{sampler}", json=params)
+        assert response.status_code == 200
+        assert response.headers["x-cache"] == "miss"
+        data = response.json()
+        assert len(data["samples"]) == 2000
+        assert 0.001 < data["step_size"] < 0.1
+        assert abs(data["mean"]) < 0.01
+
+        for invalid in ({"step_size": 0}, {"target_acceptance": 1}):
+            assert client.post(f"/mcmc/{sampler}", json=invalid).status_code == 422
+    assert client.post("/mcmc/hmc", json={"n_leapfrog": 0}).status_code == 422
+
+
 def test_seed_reproducibility_statistics():
     """Test that using the same seed produces the same statistical results."""
     response1 = client.post(
@@ -82,6 +152,9 @@ def test_seed_reproducibility_statistics():
     assert data1["mean"] == data2["mean"]
     assert data1["median"] == data2["median"]
     assert data1["credible_interval"] == data2["credible_interval"]
+    assert data1["diagnostics"]["ess"] == data2["diagnostics"]["ess"]
+    assert data1["diagnostics"]["ess"] > 0
+    assert data1["diagnostics"]["r_hat"] > 0
 
 
 def test_invalid_credible_interval():
@@ -107,6 +180,73 @@ def test_invalid_credible_interval():
     assert "credible_interval" in str(error_data["detail"]).lower()
 
 
+def test_invalid_sampling_parameters():
+    """Test that invalid parameters are rejected before sampling."""
+    for params in [{"iterations": 0}, {"thin": 0}, {"burn_in": -1}]:
+        response = client.post("/mcmc/mh", json=params)
+        assert response.status_code == 422
+    response = client.post("/mcmc/amh", json={"check_interval": 0})
+    assert response.status_code == 422
+
+    response = client.post("/mcmc/mh", json={"expression": "exp(-y**2)"})
+    assert response.status_code == 400
+
+
+def test_unavailable_workers(monkeypatch):
+    """Test that worker failures are reported as server errors, not bad requests."""
+
+    async def broken_run(*_args, **_kwargs):
+        raise BrokenProcessPool("A worker process terminated abruptly")
+
+    monkeypatch.setattr(api.sampler_pool, "run", broken_run)
+    response = client.post("/mcmc/mh", json={"iterations": 100})
+    assert response.status_code == 503
+
+
+def test_admission_control(monkeypatch):
+    """Test that runs over a budget or quota, or beyond a full queue, are rejected."""
+    monkeypatch.setattr(api, "admission_policy", AdmissionPolicy(max_iterations=5000))
+    response = client.post("/mcmc/mh", json={"iterations": 10000})
+    assert response.status_code == 422
+    assert "over the limit of 5000" in response.json()["detail"]
+    response = client.post(
+        "/mcmc/batch", json={"jobs": [{"iterations": 100}, {"iterations": 10000}]}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("Job 1:")
+    assert client.post("/mcmc/mh", json={"iterations": 100}).status_code == 200
+
+    monkeypatch.setattr(api, "client_quotas", ClientQuotas(rate=1e-3, burst=1e-3))
+    assert client.post("/mcmc/mh", json={"iterations": 100}).status_code == 200
+    for path in ("/mcmc/mh", "/mcmc/mh/stream", "/jobs", "/mcmc/batch"):
+        json_body = {"iterations": 100}
+        if path == "/mcmc/batch":
+            json_body = {"jobs": [json_body]}
+        response = client.post(path, json=json_body)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+    async def saturated_run(*_args, **_kwargs):
+        raise PoolSaturatedError("Sampling queue is full", retry_after=7)
+
+    monkeypatch.setattr(api, "client_quotas", ClientQuotas(max_concurrent=1))
+    monkeypatch.setattr(api.sampler_pool, "run", saturated_run)
+    response = client.post("/mcmc/mh", json={"iterations": 100})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    # The rejected run no longer counts against the client's concurrency limit
+    assert not api.client_quotas._running  # pylint: disable=protected-access
+
+    # Nor does a job that fails after being admitted
+    def broken_create(*_args, **_kwargs):
+        raise RuntimeError("Job store is unavailable")
+
+    monkeypatch.setattr(api.job_store, "create", broken_create)
+    with pytest.raises(RuntimeError):
+        client.post("/jobs", json={"iterations": 100})
+    assert not api.client_quotas._running  # pylint: disable=protected-access
+
+
 def test_different_credible_intervals():
     """Test different credible interval levels produce different bounds."""
     response95 = client.post(
@@ -121,3 +261,359 @@ def test_different_credible_intervals():
 
     # 99% CI should be wider than 95% CI
     assert ci99[1] - ci99[0] > ci95[1] - ci95[0]
+
+
+def test_log_density_expression():
+    """Test sampling from an expression given as a log-density."""
+    response = client.post(
+        "/mcmc/amh",
+        json={
+            "expression": "-1000*x**2",
+            "log_density": True,
+            "initial": 1.0,
+            "iterations": 500,
+            "seed": 42,
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert all(abs(sample) < 1.5 for sample in data["samples"])
+    assert -0.5 < data["mean"] < 0.5
+
+
+def test_non_differentiable_expression():
+    """Test that a target without a usable derivative fails only the gradient samplers."""
+    body = {"expression": "floor(x) + 1", "initial": 0.5, "iterations": 500}
+    assert client.post("/mcmc/mh", json=body).status_code == 200
+    response = client.post("/mcmc/mala", json=body)
+    assert response.status_code == 400
+    assert "not differentiable" in response.json()["detail"]
+
+
+def test_sampling_does_not_block_event_loop():
+    """Test that a long sampling request does not stall other requests."""
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            long_run = asyncio.create_task(
+                ac.post("/mcmc/mh", json={"iterations": 1_000_000, "seed": 1})
+            )
+            await asyncio.sleep(0.2)
+            health = await ac.get("/health")
+            health_done_first = not long_run.done()
+            response = await long_run
+            return health, health_done_first, response
+
+    health, health_done_first, response = asyncio.run(scenario())
+    assert health.status_code == 200
+    assert health.json()["status"] == "ok"
+    assert health_done_first
+    assert response.status_code == 200
+
+
+def test_sampler_pool_queue_limit_and_timeout():
+    """Test that the pool rejects work beyond its queue and times out slow tasks."""
+    pool = SamplerPool(max_workers=0, max_queue=0, timeout=0.2)
+
+    async def scenario():
+        slow = asyncio.create_task(pool.run(time.sleep, 1.0))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(time.sleep, 0)
+        with pytest.raises(TaskTimeoutError):
+            await slow
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown(wait=True)
+
+
+def test_sampler_pool_timeout_frees_worker():
+    """Test that a sampler that timed out stops and frees its worker."""
+    pool = SamplerPool(max_workers=1, max_queue=0, timeout=0.5)
+    pool.start()
+
+    async def scenario():
+        params = {"iterations": 3_000_000, "seed": 1}
+        with pytest.raises(TaskTimeoutError):
+            await pool.run(run_sampler, "mh", params, deadline=time.time() + 0.5)
+
+        # The worker stops at its deadline instead of finishing the long chain
+        stop = time.time() + 1.0
+        while pool.pending and time.time() < stop:
+            await asyncio.sleep(0.01)
+        assert pool.pending == 0
+
+        params = {"iterations": 10, "burn_in": 0, "seed": 1}
+        result = await pool.run(run_sampler, "mh", params, deadline=time.time() + 0.5)
+        assert len(result["samples"]) == 10
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown(wait=True)
+
+
+def test_binary_sample_formats():
+    """Test that every sample format carries the same samples and statistics."""
+    params = {"iterations": 500, "burn_in": 100, "seed": 42}
+    expected = client.post("/mcmc/amh", json=params).json()
+    samples = np.array(expected["samples"])
+
+    response = client.post("/mcmc/amh?format=base64", json=params)
+    data = response.json()
+    assert data["samples_dtype"] == "<f8"
+    decoded = np.frombuffer(base64.b64decode(data["samples_base64"]), dtype="<f8")
+    assert np.array_equal(decoded, samples)
+    assert data["acceptance_rates"] == expected["acceptance_rates"]
+
+    for query, headers, media_type, dtype in [
+        ("?format=f8", {}, "application/octet-stream", "<f8"),
+        ("?format=f4", {}, "application/octet-stream", "<f4"),
+        ("", {"Accept": "application/octet-stream"}, "application/octet-stream", "<f8"),
+        ("", {"Accept": "application/x-npy"}, "application/x-npy", "<f8"),
+    ]:
+        response = client.post(f"/mcmc/amh{query}", json=params, headers=headers)
+        assert response.headers["content-type"] == media_type
+        if media_type == "application/x-npy":
+            decoded = np.load(io.BytesIO(response.content))
+        else:
+            decoded = np.frombuffer(response.content, dtype=dtype)
+        assert np.array_equal(decoded, samples.astype(dtype))
+
+        metadata = json.loads(response.headers["x-mcmc-metadata"])
+        assert metadata["dtype"] == dtype
+        assert metadata["count"] == len(samples)
+        assert metadata["mean"] == expected["mean"]
+        assert metadata["credible_interval"] == expected["credible_interval"]
+
+    assert client.post("/mcmc/mh?format=xml", json=params).status_code == 422
+
+
+def test_summary_only_responses():
+    """Test that return_samples false returns a small summary in every format."""
+    params = {"iterations": 20000, "seed": 42}
+    expected = client.post("/mcmc/mh", json=params).json()
+    for query in ["", "?format=f8", "?format=base64"]:
+        response = client.post(
+            f"/mcmc/mh{query}", json={**params, "return_samples": False}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert len(response.content) < 500
+        data = response.json()
+        assert "samples" not in data
+        assert abs(data["mean"] - expected["mean"]) < 1e-12
+        assert abs(data["median"] - expected["median"]) < 0.01
+        assert data["acceptance_rate"] == expected["acceptance_rate"]
+
+    response = client.post(
+        "/mcmc/amh", json={"iterations": 1000, "return_samples": False}
+    )
+    assert response.status_code == 200
+    assert "acceptance_rates" in response.json()
+
+
+def test_seeded_requests_are_cached():
+    """Test that seeded requests are served from the cache and unseeded ones never are."""
+    params = {"iterations": 2000, "seed": 7}
+    first = client.post("/mcmc/amh", json=params)
+    assert first.headers["x-cache"] == "miss"
+    second = client.post("/mcmc/amh", json=params)
+    assert second.headers["x-cache"] == "hit"
+    assert second.json() == first.json()
+
+    # An equivalent expression, and another format, share the cached result
+    response = client.post(
+        "/mcmc/amh?format=f8",
+        json={**params, "expression": "exp(-0.5 * x * x) / sqrt(2 * pi)"},
+    )
+    assert response.headers["x-cache"] == "hit"
+    assert np.frombuffer(response.content).tolist() == first.json()["samples"]
+    assert client.post("/mcmc/mh", json=params).headers["x-cache"] == "miss"
+
+    unseeded = [client.post("/mcmc/mh", json={"iterations": 2000}) for _ in range(2)]
+    assert [response.headers["x-cache"] for response in unseeded] == ["miss", "miss"]
+    assert unseeded[0].json()["samples"] != unseeded[1].json()["samples"]
+
+
+def test_profiled_requests():
+    """Test that profiled requests return a phase breakdown and are never cached."""
+    params = {"iterations": 1000, "seed": 5, "profile": True}
+    responses = [client.post("/mcmc/mala", json=params) for _ in range(2)]
+    assert [response.headers["x-cache"] for response in responses] == ["miss", "miss"]
+    profile = responses[0].json()["profile"]
+    assert set(profile["phases"]) == {
+        "compile",
+        "sampling",
+        "statistics",
+        "diagnostics",
+        "dispatch",
+    }
+    assert profile["gradient_evaluations"] > 0
+    assert "serialization;dur=" in responses[0].headers["server-timing"]
+
+    response = client.post(
+        "/mcmc/mh?format=f8", json={**params, "profile_report": "cprofile"}
+    )
+    metadata = json.loads(response.headers["x-mcmc-metadata"])
+    assert "cprofile" not in metadata["profile"]
+    assert client.post("/mcmc/mh/stream", json=params).status_code == 400
+    assert client.post("/mcmc/mh", json={"profile_report": "perf"}).status_code == 422
+
+
+def test_streaming_endpoints():
+    """Test that streamed chunks and the trailer match the regular endpoints."""
+    params = {"iterations": 1000, "burn_in": 100, "seed": 42}
+    for sampler in ["mh", "amh", "pt", "mala", "hmc"]:
+        response = client.post(f"/mcmc/{sampler}/stream?chunk_size=300", json=params)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        records = [json.loads(line) for line in response.text.splitlines()]
+
+        chunks = [record["samples"] for record in records[:-1]]
+        assert [len(chunk) for chunk in chunks] == [300, 300, 300, 100]
+        summary = records[-1]["summary"]
+        expected = client.post(f"/mcmc/{sampler}", json=params).json()
+        assert sum(chunks, []) == expected["samples"]
+        assert summary["n_samples"] == 1000
+        assert summary["acceptance_rate"] == expected["acceptance_rate"]
+        assert abs(summary["mean"] - expected["mean"]) < 1e-12
+        assert summary["credible_interval"][0] < summary["median"]
+        assert summary["median"] < summary["credible_interval"][1]
+
+    response = client.post("/mcmc/mh/stream", json={"expression": "exp(-y**2)"})
+    assert response.status_code == 400
+    response = client.post("/mcmc/mh/stream?chunk_size=0", json=params)
+    assert response.status_code == 422
+
+
+def test_batch_endpoint():
+    """Test that batch results come in order, with failed jobs reported individually."""
+    jobs = [{"iterations": 1000, "seed": seed} for seed in range(4)]
+    jobs[1] = {"expression": "exp(-y**2)"}
+    jobs[3] = {"sampler": "amh", "iterations": 500, "seed": 3, "return_samples": False}
+    response = client.post("/mcmc/batch", json={"jobs": jobs})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [item["index"] for item in results] == [0, 1, 2, 3]
+    assert results[1]["error"] == "Expression must contain the variable 'x'"
+    expected = client.post("/mcmc/mh", json=jobs[2]).json()
+    assert results[2]["result"]["samples"] == expected["samples"]
+    assert results[3]["result"]["samples"] is None
+    assert "acceptance_rates" in results[3]["result"]
+
+    response = client.post("/mcmc/batch?stream=true", json={"jobs": jobs})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(record["index"] for record in records) == [0, 1, 2, 3]
+    streamed = {record["index"]: record for record in records}
+    assert streamed[2]["result"]["samples"] == expected["samples"]
+    assert streamed[1] == results[1]
+
+    for body in ({"jobs": []}, {"jobs": [{"iterations": 0}]}):
+        assert client.post("/mcmc/batch", json=body).status_code == 422
+
+
+def test_metrics_endpoint():
+    """Test that /metrics reports requests by route and the workers' sampler runs."""
+    client.post("/mcmc/mh", json={"iterations": 500, "seed": 11})
+    client.post("/mcmc/mh", json={"iterations": 500, "seed": 11})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert (
+        'http_request_duration_seconds_count{method="POST",endpoint="/mcmc/mh",'
+        'status="200"}' in text
+    )
+    assert 'mcmc_sampler_iterations_total{sampler="mh"}' in text
+    assert 'mcmc_result_cache_requests_total{result="hit"}' in text
+    assert "# TYPE mcmc_sampler_tasks_pending gauge" in text
+
+
+def wait_for_job(job_id, timeout=60):
+    """Poll a job until it finishes and return its final status."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_job_lifecycle():
+    """Test submitting a job, polling it and fetching its result."""
+    params = {"iterations": 2000, "burn_in": 100, "seed": 42}
+    response = client.post("/jobs", json={"sampler": "amh", **params})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert job["sampler"] == "amh"
+
+    job = wait_for_job(job["job_id"])
+    assert job["status"] == "succeeded"
+    assert job["progress"] == 1.0
+
+    result = client.get(f"/jobs/{job['job_id']}/result")
+    assert result.status_code == 200
+    expected = client.post("/mcmc/amh", json=params).json()
+    assert result.json()["samples"] == expected["samples"]
+    assert result.json()["acceptance_rates"] == expected["acceptance_rates"]
+
+    # Deleting a finished job removes it
+    assert client.delete(f"/jobs/{job['job_id']}").status_code == 200
+    assert client.get(f"/jobs/{job['job_id']}").status_code == 404
+
+
+def test_job_cancel_and_errors():
+    """Test cancelling a job and the errors for missing, unfinished and failed jobs."""
+    assert client.get("/jobs/missing").status_code == 404
+
+    job = client.post("/jobs", json={"iterations": 50_000_000}).json()
+    deadline = time.time() + 30
+    while client.get(f"/jobs/{job['job_id']}").json()["status"] == "queued":
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+    # A running job keeps its worker until the sampler has actually stopped
+    cancelling = client.delete(f"/jobs/{job['job_id']}").json()
+    assert cancelling["status"] in ("cancelling", "cancelled")
+    assert wait_for_job(job["job_id"], timeout=10)["status"] == "cancelled"
+    assert client.get(f"/jobs/{job['job_id']}/result").status_code == 409
+    assert client.get("/health").json()["pending_tasks"] == 0
+
+    failed = wait_for_job(
+        client.post("/jobs", json={"expression": "exp(-y**2)"}).json()["job_id"]
+    )
+    assert failed["status"] == "failed"
+    result = client.get(f"/jobs/{failed['job_id']}/result")
+    assert result.status_code == 400
+    assert "must contain the variable 'x'" in result.json()["detail"]
+
+
+def test_disconnected_client_stops_run():
+    """Test that a run stops, freeing its worker, once its client disconnects."""
+
+    class DisconnectingRequest:
+        """Request whose client disconnects after 0.3 seconds."""
+
+        def __init__(self):
+            self.disconnect_time = time.time() + 0.3
+
+        async def is_disconnected(self):
+            return time.time() > self.disconnect_time
+
+    async def scenario():
+        request = api.MCMCRequest(iterations=10**9, burn_in=0)
+        with pytest.raises(api.HTTPException) as excinfo:
+            await api.run_in_pool("mh", request, DisconnectingRequest())
+        return excinfo.value.status_code
+
+    start_time = time.time()
+    assert asyncio.run(scenario()) == 499
+    assert time.time() - start_time < 5
+    assert client.get("/health").json()["pending_tasks"] == 0
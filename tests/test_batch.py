@@ -0,0 +1,52 @@
+import json
+import numpy as np
+import pytest
+from library.batch import run_batch, jsonable_record
+from library.tasks import run_sampler
+from library.worker_pool import SamplerPool
+
+
+@pytest.fixture(name="pool", scope="module")
+def pool_fixture():
+    """Two worker processes shared by the tests in this module."""
+    sampler_pool = SamplerPool(max_workers=2, max_queue=0)
+    yield sampler_pool
+    sampler_pool.shutdown()
+
+
+def test_batch_matches_individual_runs(pool):
+    """Test that batch results match individual runs, with failures reported per job."""
+    jobs = [("mh", {"iterations": 2000, "seed": seed}) for seed in range(6)]
+    jobs[2] = ("mh", {"expression": "exp(-y**2)"})
+    jobs[4] = ("amh", {"iterations": 1000, "seed": 4, "return_samples": False})
+
+    records = list(run_batch(pool, jobs, ordered=True))
+    assert [record["index"] for record in records] == list(range(6))
+    assert records[2] == {
+        "index": 2,
+        "error": "Expression must contain the variable 'x'",
+    }
+    for index in (0, 1, 3, 5):
+        expected = run_sampler(*jobs[index])
+        assert np.array_equal(records[index]["result"]["samples"], expected["samples"])
+    assert records[4]["result"]["samples"] is None
+    assert len(records[4]["result"]["acceptance_rates"]) == 10
+
+    # Unordered batches report every job once, and results encode as JSON
+    records = list(run_batch(pool, jobs))
+    assert sorted(record["index"] for record in records) == list(range(6))
+    assert all(json.dumps(jsonable_record(record)) for record in records)
+    assert not list(run_batch(pool, []))
+
+
+def test_batch_timeout_and_cancel(pool):
+    """Test that a job past its timeout fails alone and a cancelled batch stops."""
+    jobs = [("mh", {"iterations": 10**9}), ("mh", {"iterations": 100, "seed": 1})]
+    records = list(run_batch(pool, jobs, timeout=0.5, ordered=True))
+    assert "did not finish" in records[0]["error"]
+    assert "result" in records[1]
+
+    cancel_event = pool.shared_event()
+    cancel_event.set()
+    records = list(run_batch(pool, jobs, cancel_event=cancel_event))
+    assert [record["error"] for record in records] == ["Batch was cancelled"] * 2
@@ -0,0 +1,50 @@
+import json
+from click.testing import CliRunner
+from bench import bench, benchmark_sampler, compare_results, METRICS
+from library.mcmc_utils import target_distribution
+
+
+def test_benchmark_sampler_metrics():
+    """Test that a sampler benchmark reports every sampler metric."""
+    metrics = benchmark_sampler("amh", target_distribution(), 2000, repeat=1)
+    assert metrics["iterations_per_second"] > 0
+    assert metrics["ess_per_second"] > 0
+    assert metrics["peak_memory_mb"] > 0
+
+
+def test_compare_results_flags_regressions():
+    """Test that only changes in the worse direction beyond the threshold are flagged."""
+    baseline = {
+        "results": {
+            "mh/normal": {"iterations_per_second": 1000.0, "peak_memory_mb": 10.0},
+            "api/mh/json": {"latency_ms": 100.0},
+        }
+    }
+    current = {
+        "results": {
+            "mh/normal": {"iterations_per_second": 700.0, "peak_memory_mb": 5.0},
+            "api/mh/json": {"latency_ms": 110.0},
+            "mh/new": {"iterations_per_second": 1.0},
+        }
+    }
+    regressions = compare_results(baseline, current, threshold=0.2)
+    assert [(r["name"], r["metric"]) for r in regressions] == [
+        ("mh/normal", "iterations_per_second")
+    ]
+    assert compare_results(baseline, current, threshold=0.05)[-1]["metric"] in METRICS
+
+
+def test_bench_cli_run_and_compare(tmp_path):
+    """Test the run and compare commands."""
+    runner = CliRunner()
+    output = tmp_path / "latest.json"
+    result = runner.invoke(
+        bench, ["run", "-n", "1000", "-r", "1", "--no-api", "-o", str(output)]
+    )
+    assert result.exit_code == 0
+    results = json.loads(output.read_text())["results"]
+    assert {"compile/normal", "mh/narrow", "amh/multimodal"} <= set(results)
+
+    result = runner.invoke(bench, ["compare", str(output), str(output)])
+    assert result.exit_code == 0
+    assert "No regressions" in result.output
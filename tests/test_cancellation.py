@@ -0,0 +1,89 @@
+import threading
+import time
+import numpy as np
+from library.cancellation import CancellationToken
+from library.checkpoint import Checkpoint
+from library.mcmc_algorithms import (
+    metropolis_hastings,
+    metropolis_hastings_stream,
+    hamiltonian_monte_carlo,
+    RNG_BLOCK_SIZE,
+)
+from library.mcmc_utils import target_distribution, proposal_distribution
+from library.progress import ProgressReporter
+
+
+def test_token():
+    """Test cancelling a token directly, through its event and by its deadline."""
+    token = CancellationToken()
+    assert not token.stop_requested()
+    token.cancel()
+    assert token.cancelled and token.stop_requested()
+
+    event = threading.Event()
+    token = CancellationToken(event=event, poll_interval=0)
+    assert not token.cancelled
+    event.set()
+    assert token.cancelled
+
+    token = CancellationToken(deadline=time.time() - 1)
+    assert token.expired and token.stop_requested() and not token.cancelled
+
+
+def test_cancelled_runs_keep_their_samples():
+    """Test that a stopped chain returns the samples so far, as in a full run."""
+    target = target_distribution()
+    full = metropolis_hastings(target, proposal_distribution, 0.0, 100000, seed=1)
+
+    cancel = CancellationToken(deadline=time.time() + 0.05)
+    result = metropolis_hastings(
+        target, proposal_distribution, 0.0, 10**9, seed=1, cancel=cancel
+    )
+    samples, _, acceptance_rate, mean, _, _ = result
+    assert result.truncated and result.iterations == cancel.stopped_at
+    assert cancel.stopped_at % RNG_BLOCK_SIZE == 0
+    assert len(samples) == cancel.stopped_at - 1000
+    assert np.array_equal(samples[:1000], full[0][:1000])
+    assert 0 < acceptance_rate < 1 and mean == np.mean(samples)
+
+    cancel = CancellationToken()
+    cancel.cancel()
+    result = hamiltonian_monte_carlo(target, 0.0, 1000, cancel=cancel)
+    assert len(result[0]) == 0 and cancel.stopped_at == 0
+
+    # Finished runs are not truncated, and streams report truncation in their summary
+    cancel = CancellationToken()
+    result = metropolis_hastings(
+        target, proposal_distribution, 0.0, 1000, cancel=cancel
+    )
+    assert cancel.stopped_at is None
+    assert not result.truncated and result.iterations == 2000
+    stream = metropolis_hastings_stream(
+        target, proposal_distribution, 0.0, 10**9, cancel=CancellationToken(time.time())
+    )
+    assert stream.run()["truncated"]
+
+
+def test_cancelled_checkpointed_run_resumes(tmp_path):
+    """Test that a chain stopped early is saved, and resumes to the full run's samples."""
+    target = target_distribution()
+    full = metropolis_hastings(target, proposal_distribution, 0.0, 50000, seed=3)
+    checkpoint = Checkpoint(str(tmp_path / "chain.npz"), interval=3600)
+
+    class CancelAfter(ProgressReporter):
+        """Reporter that cancels the run once it passes 10000 iterations."""
+
+        def update(self, completed, **stats):
+            if completed > 10000:
+                cancel.cancel()
+
+    cancel = CancellationToken()
+    arguments = (target, proposal_distribution, 0.0, 50000)
+    metropolis_hastings(
+        *arguments, seed=3, checkpoint=checkpoint, progress=CancelAfter(), cancel=cancel
+    )
+    assert cancel.stopped_at == 3 * RNG_BLOCK_SIZE
+    resumed = metropolis_hastings(
+        *arguments, seed=3, checkpoint=checkpoint, resume=True
+    )
+    assert np.array_equal(resumed[0], full[0])
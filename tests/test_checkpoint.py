@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from library.checkpoint import Checkpoint
+from library.mcmc_algorithms import metropolis_hastings, adaptive_metropolis_hastings
+from library.mcmc_utils import target_distribution, proposal_distribution
+from library.progress import ProgressReporter
+
+
+class Crash(Exception):
+    """Stands in for the process dying mid-run."""
+
+
+class CrashAfter(ProgressReporter):
+    """Progress reporter that crashes the run after a number of iterations."""
+
+    def __init__(self, iterations):
+        super().__init__(min_interval=0, every=1000)
+        self.iterations = iterations
+
+    def report(self, completed, stats):
+        if completed >= self.iterations:
+            raise Crash()
+
+
+def run_sampler(sampler, **kwargs):
+    """Run a sampler on a standard normal with fixed arguments."""
+    target = target_distribution()
+    if sampler == "mh":
+        return metropolis_hastings(
+            target,
+            proposal_distribution,
+            0.0,
+            30000,
+            burn_in=500,
+            thin=3,
+            seed=7,
+            **kwargs
+        )
+    return adaptive_metropolis_hastings(
+        target, 0.0, 30000, burn_in=500, thin=3, seed=7, **kwargs
+    )
+
+
+@pytest.mark.parametrize("sampler", ["mh", "amh"])
+def test_resume_matches_uninterrupted_run(tmp_path, sampler):
+    """Test that a crashed and resumed run equals the uninterrupted run."""
+    expected = run_sampler(sampler)
+    path = str(tmp_path / "run.ckpt")
+
+    with pytest.raises(Crash):
+        run_sampler(
+            sampler, checkpoint=Checkpoint(path, interval=0), progress=CrashAfter(21000)
+        )
+    result = run_sampler(sampler, checkpoint=Checkpoint(path, interval=0), resume=True)
+
+    assert np.array_equal(result[0], expected[0])
+    # Everything but the elapsed time
+    for value, expected_value in list(zip(result, expected))[2:]:
+        assert np.array_equal(value, expected_value)
+
+
+def test_interrupted_save_is_ignored(tmp_path):
+    """Test that values appended after the last state file are dropped on load."""
+    checkpoint = Checkpoint(str(tmp_path / "run.ckpt"), metadata={"expression": "x"})
+    checkpoint.save({"iteration": 1}, {"samples": [1.0, 2.0]})
+    with open(tmp_path / "run.ckpt.samples", "ab") as file:
+        file.write(np.array([3.0]).tobytes())
+
+    reloaded = Checkpoint(str(tmp_path / "run.ckpt"))
+    state, series = reloaded.load()
+    assert state == {"iteration": 1}
+    assert series["samples"].tolist() == [1.0, 2.0]
+    assert reloaded.read_metadata() == {"expression": "x"}
+
+    reloaded.save({"iteration": 2}, {"samples": [4.0]})
+    assert reloaded.load()[1]["samples"].tolist() == [1.0, 2.0, 4.0]
+    reloaded.remove()
+    assert not list(tmp_path.iterdir())
+
+
+def test_resume_checks_arguments(tmp_path):
+    """Test that a checkpoint cannot be resumed by a run with other arguments."""
+    path = str(tmp_path / "run.ckpt")
+    with pytest.raises(Crash):
+        run_sampler(
+            "amh", checkpoint=Checkpoint(path, interval=0), progress=CrashAfter(10000)
+        )
+    with pytest.raises(ValueError):
+        run_sampler("mh", checkpoint=Checkpoint(path), resume=True)
+    with pytest.raises(ValueError):
+        run_sampler("mh", resume=True)
@@ -1,7 +1,14 @@
+import json
 import os
+import signal
+import subprocess
+import sys
+import threading
+import numpy as np
 import pytest
 from click.testing import CliRunner
-from cli import mh, amh
+import cli
+from cli import mh, amh, pt, mala, hmc, batch
 
 # Safely ignore the pylint error: Redefining name 'runner' from outer scope
 # pylint: disable=redefined-outer-name
@@ -33,6 +40,111 @@ def test_amh_basic(runner):
         assert "Acceptance rate:" in result.output
 
 
+def test_pt_basic(runner):
+    """Test parallel tempering command with a custom ladder."""
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            pt,
+            [
+                "--expression",
+                "exp(-(x - 5)**2 / 2) + exp(-(x + 5)**2 / 2)",
+                "--iterations",
+                "500",
+                "--temperatures",
+                "1,4,16",
+                "--seed",
+                "42",
+            ],
+        )
+        assert result.exit_code == 0
+        assert "Running parallel tempering sampler with 3 temperatures" in result.output
+        assert "Swap rate T=1.00 <-> T=4.00:" in result.output
+        assert "Swap rate T=4.00 <-> T=16.00:" in result.output
+        assert len(os.listdir("output/plots")) > 0
+
+        result = runner.invoke(pt, ["--temperatures", "1,x", "--no-plot"])
+        assert result.exit_code != 0
+        result = runner.invoke(pt, ["--temperatures", "2,4", "--no-plot"])
+        assert "Error: temperatures must be a list starting at 1" in result.output
+
+
+def test_gradient_samplers_basic(runner):
+    """Test MALA and HMC commands report their adapted step size."""
+    with runner.isolated_filesystem():
+        for command, name in (
+            (mala, "Metropolis-adjusted Langevin"),
+            (hmc, "Hamiltonian Monte Carlo"),
+        ):
+            result = runner.invoke(
+                command, ["--iterations", "500", "--seed", "42", "--no-plot"]
+            )
+            assert result.exit_code == 0
+            assert f"Running {name} sampler..." in result.output
+            assert "Adapted step size:" in result.output
+            assert "Sample mean:" in result.output
+
+        result = runner.invoke(hmc, ["--n-leapfrog", "0", "--no-plot"])
+        assert "Error: n_leapfrog must be at least 1" in result.output
+
+
+def test_batch(runner):
+    """Test the batch command writes one result per job, in order."""
+    with runner.isolated_filesystem():
+        with open("jobs.jsonl", "w", encoding="utf-8") as file:
+            file.write('{"iterations": 500, "seed": 1}\n\n')
+            file.write('{"expression": "exp(-y**2)"}\n')
+            file.write(
+                '{"sampler": "amh", "iterations": 500, "return_samples": false}\n'
+            )
+        result = runner.invoke(
+            batch, ["jobs.jsonl", "--workers", "0", "-o", "out.jsonl"]
+        )
+        assert result.exit_code == 0
+        assert "Job 1 failed: Expression must contain the variable 'x'" in result.output
+        assert "Ran 3 jobs" in result.output
+        with open("out.jsonl", encoding="utf-8") as file:
+            records = [json.loads(line) for line in file]
+        assert [record["index"] for record in records] == [0, 1, 2]
+        assert len(records[0]["result"]["samples"]) == 500
+        assert records[2]["result"]["samples"] is None
+
+        with open("bad.jsonl", "w", encoding="utf-8") as file:
+            file.write('{"seed": 1}\n[1]\n')
+        result = runner.invoke(batch, ["bad.jsonl", "--workers", "0"])
+        assert "Error: Invalid job on line 2" in result.output
+
+
+def test_metrics_file(runner):
+    """Test that --metrics-file writes the command's sampler metrics on exit."""
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            cli.cli,
+            ["--metrics-file", "metrics.prom", "mh", "-n", "500", "--no-plot"],
+        )
+        assert result.exit_code == 0
+        with open("metrics.prom", encoding="utf-8") as file:
+            text = file.read()
+        assert "# TYPE mcmc_sampler_runs_total counter" in text
+        assert 'mcmc_sampler_runs_total{sampler="mh"}' in text
+        assert not os.path.exists("metrics.prom.tmp")
+
+
+def test_profile(runner):
+    """Test that --profile prints the phase breakdown after the results."""
+    with runner.isolated_filesystem():
+        result = runner.invoke(hmc, ["-n", "500", "--no-plot", "--profile"])
+        assert result.exit_code == 0
+        assert "Profile:" in result.output
+        for phase in ("compile", "sampling", "statistics", "results"):
+            assert phase in result.output
+        assert "gradient evaluations" in result.output
+
+        result = runner.invoke(
+            pt, ["-n", "200", "--no-plot", "--profile-report", "cprofile"]
+        )
+        assert "function calls" in result.output
+
+
 def test_mh_with_custom_expression(runner):
     """Test MH with custom target distribution."""
     with runner.isolated_filesystem():
@@ -62,6 +174,32 @@ def test_save_samples(runner):
         assert os.path.exists("output/samples/test_samples.txt")
 
 
+def test_sample_formats(runner, monkeypatch):
+    """Test that samples saved in every format, or spilled to a scratch file, agree."""
+    with runner.isolated_filesystem():
+        args = ["--iterations", "2000", "--seed", "42", "--no-plot", "--save"]
+        for sample_format in ("npy", "bin", "txt"):
+            result = runner.invoke(mh, args + ["--format", sample_format])
+            assert result.exit_code == 0
+            assert f"samples.{sample_format}" in result.output
+
+        samples = np.load("output/samples/samples.npy")
+        assert len(samples) == 2000
+        assert np.array_equal(np.fromfile("output/samples/samples.bin"), samples)
+        assert np.array_equal(np.loadtxt("output/samples/samples.txt"), samples)
+
+        # Long runs keep their samples in a scratch file, deleted afterwards
+        monkeypatch.setattr(cli, "IN_MEMORY_SAMPLES", 100)
+        result = runner.invoke(amh, args + ["-o", "amh.txt"])
+        assert result.exit_code == 0
+        assert sorted(os.listdir("output/samples")) == [
+            "amh.txt",
+            "samples.bin",
+            "samples.npy",
+            "samples.txt",
+        ]
+
+
 def test_plot_generation(runner):
     """Test plot generation."""
     with runner.isolated_filesystem():
@@ -113,6 +251,9 @@ def test_mh_statistics_output(runner):
         assert "Sample mean:" in result.output
         assert "Sample median:" in result.output
         assert "95% Credible interval:" in result.output
+        assert "Effective sample size:" in result.output
+        assert "ESS per second:" in result.output
+        assert "Split R-hat:" in result.output
 
 
 def test_amh_statistics_output(runner):
@@ -125,6 +266,37 @@ def test_amh_statistics_output(runner):
         assert "95% Credible interval:" in result.output
 
 
+def test_summary_only(runner):
+    """Test that --summary-only reports statistics without plotting the samples."""
+    with runner.isolated_filesystem():
+        for command in (mh, amh):
+            result = runner.invoke(command, ["--iterations", "1000", "--summary-only"])
+            assert result.exit_code == 0
+            assert "Sample median:" in result.output
+            assert "95% Credible interval:" in result.output
+            assert "Number of samples" not in result.output
+            assert not os.path.exists("output")
+
+
+def test_checkpoint_resume(runner):
+    """Test that resuming a finished run's checkpoint is an error and --resume needs one."""
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            amh, ["--iterations", "5000", "--no-plot", "--checkpoint", "run.ckpt"]
+        )
+        assert result.exit_code == 0
+        # Finished runs delete their checkpoint
+        assert not os.path.exists("run.ckpt")
+
+        result = runner.invoke(
+            amh, ["--no-plot", "--checkpoint", "run.ckpt", "--resume"]
+        )
+        assert result.exit_code != 0
+        assert "No checkpoint found" in result.output
+        result = runner.invoke(mh, ["--no-plot", "--resume"])
+        assert result.exit_code != 0
+
+
 def test_custom_credible_interval(runner):
     """Test custom credible interval level."""
     with runner.isolated_filesystem():
@@ -211,3 +383,62 @@ def test_seed_reproducibility_statistics(runner):
             line for line in result2.output.split("\n") if "Credible interval:" in line
         ][0]
         assert ci1 == ci2
+
+
+def test_log_density_option(runner):
+    """Test sampling from an expression given as a log-density."""
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            mh,
+            ["-e", "-1000*x**2", "--log-density", "--iterations", "100", "--no-plot"],
+        )
+        assert result.exit_code == 0
+        assert "Sample mean:" in result.output
+
+
+# Most seconds ``import cli`` may take. It took about 0.1 s, against 1.8 s when
+# matplotlib and sympy were imported at startup
+IMPORT_TIME_BUDGET = 0.6
+
+
+def test_startup_skips_heavy_imports():
+    """Test that importing the CLI loads neither matplotlib nor sympy, within budget."""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = (
+        "import sys, cli; "
+        "print(sorted({'matplotlib', 'sympy', 'tqdm'} & set(sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=repo,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+    # Lines read "import time: <self us> | <cumulative us> | <module>"
+    cumulative = {
+        fields[2].strip(): int(fields[1])
+        for fields in (line.split("|") for line in result.stderr.splitlines())
+        if len(fields) == 3 and fields[1].strip().isdigit()
+    }
+    assert cumulative["cli"] / 1e6 < IMPORT_TIME_BUDGET
+
+
+def test_interrupt(runner):
+    """Test that Ctrl-C stops a run early and reports the samples so far."""
+    timer = threading.Timer(1.0, os.kill, (os.getpid(), signal.SIGINT))
+    args = ["--iterations", "1000000000", "--no-plot", "--save", "--format", "npy"]
+    with runner.isolated_filesystem():
+        timer.start()
+        try:
+            result = runner.invoke(mh, args)
+        finally:
+            timer.cancel()
+        assert result.exit_code == 0
+        assert "Stopping the run" in result.output
+        assert "Interrupted after" in result.output
+        assert "truncated run" in result.output
+        assert "Sample mean:" in result.output
+        assert len(np.load("output/samples/samples.npy")) > 0
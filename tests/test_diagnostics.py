@@ -0,0 +1,66 @@
+import numpy as np
+from library.diagnostics import (
+    autocorrelation,
+    effective_sample_size,
+    monte_carlo_standard_error,
+    split_rhat,
+    chain_diagnostics,
+)
+
+
+def ar1_chain(phi, n_samples, seed=0):
+    """AR(1) chain with known autocorrelation phi**lag."""
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(size=n_samples)
+    chain = np.empty(n_samples)
+    chain[0] = noise[0] / np.sqrt(1 - phi**2)
+    for i in range(1, n_samples):
+        chain[i] = phi * chain[i - 1] + noise[i]
+    return chain
+
+
+def test_autocorrelation_matches_direct_sum():
+    """Test that the FFT autocorrelation equals the direct lagged-product sum."""
+    chain = np.random.default_rng(1).normal(size=1001)
+    centered = chain - chain.mean()
+    direct = [
+        np.sum(centered[: len(chain) - lag] * centered[lag:]) / np.sum(centered**2)
+        for lag in range(20)
+    ]
+    assert np.allclose(autocorrelation(chain, max_lag=19), direct)
+    assert autocorrelation(np.stack([chain, chain])).shape == (2, 1001)
+
+
+def test_effective_sample_size():
+    """Test the ESS of independent and AR(1) chains against theory."""
+    independent = np.random.default_rng(2).normal(size=(4, 5000))
+    assert 0.9 * 20000 < effective_sample_size(independent) < 1.1 * 20000
+
+    phi = 0.9
+    chain = ar1_chain(phi, 100000)
+    expected = len(chain) * (1 - phi) / (1 + phi)
+    assert 0.85 * expected < effective_sample_size(chain) < 1.15 * expected
+    mcse = monte_carlo_standard_error(chain)
+    assert np.isclose(mcse, np.std(chain, ddof=1) / np.sqrt(expected), rtol=0.1)
+
+    assert np.isnan(effective_sample_size([1.0, 2.0]))
+    assert np.isnan(effective_sample_size(np.ones(100)))
+
+
+def test_split_rhat():
+    """Test that split R-hat is near 1 for mixed chains and large for stuck ones."""
+    rng = np.random.default_rng(3)
+    assert abs(split_rhat(rng.normal(size=(4, 2000))) - 1) < 0.01
+    drifting = np.concatenate([rng.normal(0, 1, 1000), rng.normal(3, 1, 1000)])
+    assert split_rhat(drifting) > 1.5
+    separated = np.stack([rng.normal(0, 1, 1000), rng.normal(3, 1, 1000)])
+    assert split_rhat(separated) > 1.5
+
+
+def test_chain_diagnostics():
+    """Test the combined diagnostics and ESS per second."""
+    chain = ar1_chain(0.5, 10000)
+    diagnostics = chain_diagnostics(chain, elapsed_time=2.0)
+    assert diagnostics["ess_per_second"] == diagnostics["ess"] / 2.0
+    assert diagnostics["mcse"] > 0
+    assert chain_diagnostics(chain)["ess_per_second"] is None
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from library.job_store import (
+    JobStore,
+    InMemoryJobStore,
+    SQLiteJobStore,
+    job_store_from_url,
+)
+
+
+@pytest.fixture(name="store", params=["memory", "sqlite"])
+def store_fixture(request, tmp_path):
+    """Fixture that creates each kind of job store."""
+    if request.param == "memory":
+        return InMemoryJobStore(ttl=60)
+    return SQLiteJobStore(str(tmp_path / "jobs.db"), ttl=60)
+
+
+def test_job_round_trip(store):
+    """Test creating, updating and finishing a job."""
+    job = store.create("mh", {"iterations": 100, "seed": 1})
+    assert store.get(job["job_id"])["status"] == "queued"
+
+    store.update(job["job_id"], status="running", progress=0.5)
+    assert store.get(job["job_id"])["progress"] == 0.5
+
+    result = {
+        "samples": np.array([0.1, -0.2, 0.3]),
+        "acceptance_rate": 0.5,
+        "credible_interval": (-0.2, 0.3),
+    }
+    assert store.finish(job["job_id"], "succeeded", result=result)
+    finished = store.get(job["job_id"])
+    assert finished["status"] == "succeeded"
+    assert finished["progress"] == 1.0
+    assert finished["params"] == {"iterations": 100, "seed": 1}
+
+    stored = store.get_result(job["job_id"])
+    assert np.array_equal(stored["samples"], result["samples"])
+    assert stored["credible_interval"] == (-0.2, 0.3)
+
+    # A finished job cannot be finished again, e.g. after it was cancelled
+    assert not store.finish(job["job_id"], "failed", error="too late")
+
+
+def test_finished_jobs_expire(store):
+    """Test TTL-based eviction of finished jobs only."""
+    finished = store.create("mh", {})
+    running = store.create("amh", {})
+    store.finish(finished["job_id"], "succeeded", result={"samples": [1.0]})
+
+    store.ttl = -1  # Everything finished is now past its TTL
+    assert store.get(finished["job_id"]) is None
+    assert store.get_result(finished["job_id"]) is None
+    assert store.get(running["job_id"])["status"] == "queued"
+
+
+def test_sqlite_store_persists_and_fails_unfinished(tmp_path):
+    """Test that a new SQLite store sees earlier jobs and fails orphaned ones."""
+    path = str(tmp_path / "jobs.db")
+    job = job_store_from_url(f"sqlite:{path}").create("mh", {})
+
+    reopened = job_store_from_url(f"sqlite:{path}")
+    reopened.fail_unfinished()
+    assert reopened.get(job["job_id"])["status"] == "failed"
+
+    with pytest.raises(ValueError):
+        job_store_from_url("redis://localhost")
+
+
+def test_job_store_is_abstract():
+    """Test that a job store must implement the storage methods."""
+    with pytest.raises(TypeError):
+        JobStore()  # pylint: disable=abstract-class-instantiated
@@ -1,6 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
 import numpy as np
 from library.mcmc_utils import target_distribution, proposal_distribution
-from library.mcmc_algorithms import metropolis_hastings, adaptive_metropolis_hastings
+from library.mcmc_algorithms import (
+    metropolis_hastings,
+    adaptive_metropolis_hastings,
+    metropolis_hastings_stream,
+    adaptive_metropolis_hastings_stream,
+    parallel_tempering,
+    parallel_tempering_stream,
+    temperature_ladder,
+    metropolis_adjusted_langevin,
+    metropolis_adjusted_langevin_stream,
+    hamiltonian_monte_carlo,
+    hamiltonian_monte_carlo_stream,
+    RNG_BLOCK_SIZE,
+)
+from library.diagnostics import effective_sample_size
+from library.progress import CallbackProgress
+from library.sample_store import open_sample_file, sample_count
 
 
 def test_metropolis_hastings():
@@ -200,3 +218,396 @@ def test_different_credible_intervals():
     ci_95_width = ci_95[1] - ci_95[0]
     ci_99_width = ci_99[1] - ci_99[0]
     assert ci_99_width > ci_95_width
+
+
+def test_multi_chain_metropolis_hastings():
+    """Test vectorized multi-chain Metropolis-Hastings."""
+    target_dist = target_distribution()
+    n_chains = 8
+    num_iterations = 1000
+    thin = 2
+
+    samples, _, acc_rates, mean, median, ci = metropolis_hastings(
+        target_dist,
+        proposal_distribution,
+        0.0,
+        num_iterations,
+        burn_in=200,
+        thin=thin,
+        seed=42,
+        n_chains=n_chains,
+    )
+    samples2, _, acc_rates2, _, _, _ = metropolis_hastings(
+        target_dist,
+        proposal_distribution,
+        0.0,
+        num_iterations,
+        burn_in=200,
+        thin=thin,
+        seed=42,
+        n_chains=n_chains,
+    )
+
+    assert samples.shape == (n_chains, num_iterations // thin)
+    assert np.array_equal(samples, samples2)
+    assert np.array_equal(acc_rates, acc_rates2)
+    assert acc_rates.shape == (n_chains,)
+    assert np.all((0 < acc_rates) & (acc_rates < 1))
+    # Chains are independent, so they should not coincide
+    assert not np.array_equal(samples[0], samples[1])
+    assert -0.5 < mean < 0.5
+    assert -0.5 < median < 0.5
+    assert -3 < ci[0] < 0 < ci[1] < 3
+
+
+def test_multi_chain_adaptive_metropolis_hastings():
+    """Test vectorized multi-chain adaptive Metropolis-Hastings."""
+    target_dist = target_distribution()
+    n_chains = 4
+    num_iterations = 1000
+    burn_in = 200
+    check_interval = 100
+
+    samples, _, acc_rate, acc_rates, mean, _, ci = adaptive_metropolis_hastings(
+        target_dist,
+        [-1.0, 0.0, 1.0, 2.0],
+        num_iterations,
+        check_interval=check_interval,
+        burn_in=burn_in,
+        seed=42,
+        n_chains=n_chains,
+    )
+
+    assert samples.shape == (n_chains, num_iterations)
+    assert acc_rate.shape == (n_chains,)
+    expected_rate_checks = (num_iterations + burn_in) // check_interval
+    assert acc_rates.shape == (expected_rate_checks, n_chains)
+    assert np.all((0 <= acc_rates) & (acc_rates <= 1))
+    assert -0.5 < mean < 0.5
+    assert ci[0] < ci[1]
+
+
+def test_parallel_tempering_crosses_modes():
+    """Test that parallel tempering samples both modes of a target that traps MH."""
+    target_dist = target_distribution("exp(-(x - 5)**2 / 2) + exp(-(x + 5)**2 / 2)")
+    samples, _, acceptance_rate, swap_rates, mean, median, ci = parallel_tempering(
+        target_dist, 5.0, 10000, seed=42
+    )
+    mh_samples = metropolis_hastings(
+        target_dist, proposal_distribution, 5.0, 10000, seed=42
+    )[0]
+
+    assert np.all(mh_samples > 0)
+    assert 0.4 < np.mean(samples > 0) < 0.6
+    assert abs(mean) < 1
+    assert ci[0] < -5 < median < 5 < ci[1]
+    assert 0 < acceptance_rate < 1
+    assert swap_rates.shape == (7,)
+    assert np.all((swap_rates > 0) & (swap_rates <= 1))
+
+    # Seeded runs and their streams are reproducible
+    repeated = parallel_tempering(target_dist, 5.0, 10000, seed=42)
+    assert np.array_equal(repeated[0], samples)
+    assert np.array_equal(repeated[3], swap_rates)
+    stream = parallel_tempering_stream(
+        target_dist, 5.0, 10000, seed=42, chunk_size=3000
+    )
+    assert np.array_equal(np.concatenate(list(stream)), samples)
+    assert stream.summary["swap_rates"] == swap_rates.tolist()
+    assert len(stream.summary["temperatures"]) == 8
+
+
+def test_parallel_tempering_temperatures():
+    """Test the temperature ladder and its validation."""
+    ladder = temperature_ladder(4, 8.0)
+    assert np.allclose(ladder, [1, 2, 4, 8])
+    assert np.array_equal(temperature_ladder(1), [1.0])
+    assert np.array_equal(temperature_ladder(temperatures=[1, 3]), [1.0, 3.0])
+
+    target_dist = target_distribution()
+    result = parallel_tempering(
+        target_dist, 0.0, 500, temperatures=[1.0, 2.0], swap_interval=5, seed=1
+    )
+    assert result[3].shape == (1,)
+    assert len(parallel_tempering(target_dist, 0.0, 500, n_temperatures=1)[3]) == 0
+
+    for temperatures in ([2.0, 4.0], [1.0, 1.0], []):
+        with pytest.raises(ValueError):
+            parallel_tempering(target_dist, 0.0, 100, temperatures=temperatures)
+    with pytest.raises(ValueError):
+        parallel_tempering(target_dist, 0.0, 100, swap_interval=0)
+    with pytest.raises(ValueError):
+        parallel_tempering(target_dist, 0.0, 100, max_temperature=0.5)
+
+
+@pytest.mark.parametrize(
+    "sample, stream",
+    [
+        (metropolis_adjusted_langevin, metropolis_adjusted_langevin_stream),
+        (hamiltonian_monte_carlo, hamiltonian_monte_carlo_stream),
+    ],
+)
+def test_gradient_samplers(sample, stream):
+    """Test that MALA and HMC sample a badly scaled target far better than MH."""
+    target_dist = target_distribution("-1000 * x**2", log_density=True)
+    samples, _, acceptance_rate, step_size, mean, _, ci = sample(
+        target_dist, 1.0, 10000, step_size=1.0, seed=42
+    )
+    mh_samples = metropolis_hastings(
+        target_dist, proposal_distribution, 1.0, 10000, seed=42
+    )[0]
+
+    # The step size adapts from 1.0 to the target's scale of about 0.02
+    assert 0.001 < step_size < 0.1
+    assert 0.5 < acceptance_rate < 0.95
+    assert abs(mean) < 0.005
+    assert np.isclose(np.std(samples), np.sqrt(1 / 2000), rtol=0.1)
+    assert ci[0] < 0 < ci[1]
+    assert effective_sample_size(samples) > 20 * effective_sample_size(mh_samples)
+
+    # Seeded runs and their streams are reproducible
+    repeated = sample(target_dist, 1.0, 10000, step_size=1.0, seed=42)
+    assert np.array_equal(repeated[0], samples)
+    streamed = stream(target_dist, 1.0, 10000, step_size=1.0, seed=42, chunk_size=3000)
+    assert np.array_equal(np.concatenate(list(streamed)), samples)
+    assert streamed.summary["step_size"] == step_size
+
+    # Gradients come from compiled targets only
+    with pytest.raises(ValueError):
+        sample(lambda x: np.exp(-(x**2)), 0.0, 100)
+    with pytest.raises(ValueError):
+        sample(target_dist, 0.0, 100, step_size=0)
+    with pytest.raises(ValueError):
+        sample(target_dist, 0.0, 100, target_acceptance=1.0)
+    if sample is hamiltonian_monte_carlo:
+        with pytest.raises(ValueError):
+            sample(target_dist, 0.0, 100, n_leapfrog=0)
+
+
+def test_log_density_peaked_target():
+    """Test that a sharply peaked target samples in log space without NaN ratios."""
+    # exp(-1000) underflows to 0, so the raw density ratio at x=1 would be 0/0
+    target_dist = target_distribution("exp(-1000*x**2)")
+    assert target_dist(1.0) == 0.0
+    assert target_dist.log_density(1.0) == -1000.0
+
+    samples, _, acc_rate, mean, _, ci = metropolis_hastings(
+        target_dist, proposal_distribution, 1.0, 2000, burn_in=500, seed=42
+    )
+    assert np.all(np.isfinite(samples))
+    assert acc_rate > 0
+    assert -0.1 < mean < 0.1
+    assert -0.1 < ci[0] < ci[1] < 0.1
+
+    # The same target given directly as a log-density
+    log_target = target_distribution("-1000*x**2", log_density=True)
+    log_samples, _, _, _, _, _ = metropolis_hastings(
+        log_target, proposal_distribution, 1.0, 2000, burn_in=500, seed=42
+    )
+    assert np.allclose(samples, log_samples)
+
+
+def test_seeded_runs_do_not_share_global_random_state():
+    """Test that seeded runs use their own Generator, so concurrent runs agree."""
+    target_dist = target_distribution()
+
+    def run(seed):
+        return metropolis_hastings(
+            target_dist, proposal_distribution, 0.0, 2000, burn_in=100, seed=seed
+        )[0]
+
+    np.random.seed(0)
+    global_state = np.random.get_state()[1].copy()
+    expected = run(42)
+    assert np.array_equal(np.random.get_state()[1], global_state)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(run, [42] * 8))
+    assert all(np.array_equal(result, expected) for result in results)
+
+
+def test_seeded_runs_longer_than_one_block():
+    """Test that seeded runs spanning several RNG blocks are reproducible."""
+    target_dist = target_distribution()
+    iterations = 2 * RNG_BLOCK_SIZE + 17
+
+    runs = [
+        lambda: metropolis_hastings(
+            target_dist, proposal_distribution, 0.0, iterations, burn_in=0, seed=7
+        )[0],
+        lambda: adaptive_metropolis_hastings(
+            target_dist, 0.0, iterations, burn_in=0, seed=7
+        )[0],
+        lambda: metropolis_hastings(
+            target_dist,
+            proposal_distribution,
+            0.0,
+            iterations,
+            burn_in=0,
+            seed=7,
+            n_chains=3,
+        )[0].T,
+        lambda: adaptive_metropolis_hastings(
+            target_dist, 0.0, iterations, burn_in=0, seed=7, n_chains=3
+        )[0].T,
+    ]
+    for run in runs:
+        samples = run()
+        assert len(samples) == iterations
+        assert np.array_equal(samples, run())
+        # Every block is freshly drawn rather than a replay of the first one
+        assert not np.array_equal(
+            np.diff(samples[:100], axis=0),
+            np.diff(samples[RNG_BLOCK_SIZE : RNG_BLOCK_SIZE + 100], axis=0),
+        )
+
+
+def test_custom_proposals_are_reproducible():
+    """Test that seeded runs with custom proposals give identical samples."""
+    target_dist = target_distribution()
+
+    def generator_proposal(x, rng=None):
+        return x + rng.uniform(-1.0, 1.0, size=np.shape(x))
+
+    def legacy_proposal(x):
+        return x + np.random.uniform(-1.0, 1.0, size=np.shape(x))
+
+    for n_chains in [None, 4]:
+
+        def run(proposal, seed, chains=n_chains):
+            return metropolis_hastings(
+                target_dist,
+                proposal,
+                0.0,
+                RNG_BLOCK_SIZE + 100,
+                burn_in=0,
+                seed=seed,
+                n_chains=chains,
+            )[0]
+
+        # Proposals with an rng argument draw from the run's Generator only
+        global_state = np.random.get_state()[1].copy()
+        expected = run(generator_proposal, 42)
+        assert np.array_equal(np.random.get_state()[1], global_state)
+        assert np.array_equal(run(generator_proposal, 42), expected)
+        assert not np.array_equal(run(generator_proposal, 43), expected)
+
+        # Other proposals get a seeded global random state
+        assert np.array_equal(run(legacy_proposal, 42), run(legacy_proposal, 42))
+
+
+def test_progress_reporting():
+    """Test that progress callbacks are rate-limited by iteration count."""
+    calls = []
+    progress = CallbackProgress(
+        lambda completed, total, stats: calls.append((completed, total, stats)),
+        min_interval=0,
+        every=250,
+    )
+
+    adaptive_metropolis_hastings(
+        target_distribution(), 0.0, 1000, burn_in=0, seed=42, progress=progress
+    )
+
+    # Four rate-limited updates plus the final report
+    assert [completed for completed, _, _ in calls] == [250, 500, 750, 1000, 1000]
+    assert all(total == 1000 for _, total, _ in calls)
+    assert all(0 <= stats["acceptance_rate"] <= 1 for _, _, stats in calls)
+
+
+def test_streams_match_collected_runs():
+    """Test that streamed chunks and summaries match the collected samplers."""
+    target_dist = target_distribution()
+
+    stream = metropolis_hastings_stream(
+        target_dist,
+        proposal_distribution,
+        0.0,
+        2500,
+        burn_in=100,
+        seed=42,
+        chunk_size=1000,
+    )
+    chunks = list(stream)
+    samples, _, acceptance_rate, mean, _, _ = metropolis_hastings(
+        target_dist, proposal_distribution, 0.0, 2500, burn_in=100, seed=42
+    )
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+    assert np.array_equal(np.concatenate(chunks), samples)
+    assert stream.summary["n_samples"] == 2500
+    assert stream.summary["acceptance_rate"] == acceptance_rate
+    assert np.isclose(stream.summary["mean"], mean)
+    assert np.isclose(stream.summary["std"], np.std(samples))
+
+    stream = adaptive_metropolis_hastings_stream(
+        target_dist, 0.0, 2500, burn_in=100, thin=3, seed=42, chunk_size=400
+    )
+    chunks = list(stream)
+    samples, _, _, acceptance_rates, _, _, _ = adaptive_metropolis_hastings(
+        target_dist, 0.0, 2500, burn_in=100, thin=3, seed=42
+    )
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    assert np.array_equal(np.concatenate(chunks), samples)
+    assert stream.summary["acceptance_rates"] == acceptance_rates
+
+
+def test_summary_only_runs():
+    """Test that summary-only runs match the full statistics without keeping samples."""
+    target_dist = target_distribution()
+    _, _, acceptance_rate, mean, median, ci = metropolis_hastings(
+        target_dist, proposal_distribution, 0.0, 20000, seed=42
+    )
+    summary = metropolis_hastings(
+        target_dist, proposal_distribution, 0.0, 20000, seed=42, return_samples=False
+    )
+    assert summary[0] is None
+    assert summary[2] == acceptance_rate
+    assert np.isclose(summary[3], mean)
+    # The median and interval bounds are sketch estimates of order statistics
+    assert np.isclose(summary[4], median, rtol=0.01, atol=1e-3)
+    assert np.allclose(summary[5], ci, rtol=0.01)
+
+    summary = adaptive_metropolis_hastings(
+        target_dist, 0.0, 5000, seed=42, return_samples=False
+    )
+    assert summary[0] is None
+    assert len(summary[3]) > 0
+    assert summary[6][0] < summary[5] < summary[6][1]
+
+    with pytest.raises(ValueError):
+        metropolis_hastings(
+            target_dist,
+            proposal_distribution,
+            0.0,
+            100,
+            n_chains=2,
+            return_samples=False,
+        )
+
+
+def test_runs_into_memory_mapped_file(tmp_path):
+    """Test that runs written into a memory-mapped file match in-memory runs."""
+    target_dist = target_distribution()
+    expected = metropolis_hastings(
+        target_dist, proposal_distribution, 0.0, 10001, thin=3, seed=42
+    )
+    out = open_sample_file(str(tmp_path / "mh.npy"), sample_count(10001, 3))
+    result = metropolis_hastings(
+        target_dist, proposal_distribution, 0.0, 10001, thin=3, seed=42, out=out
+    )
+    assert result[0] is out
+    assert np.array_equal(np.load(tmp_path / "mh.npy"), expected[0])
+    assert np.isclose(result[3], expected[3])
+    assert result[4] == expected[4]
+    assert result[5] == expected[5]
+
+    expected = adaptive_metropolis_hastings(target_dist, 0.0, 5000, seed=42)
+    out = open_sample_file(str(tmp_path / "amh.bin"), 5000, "bin")
+    result = adaptive_metropolis_hastings(target_dist, 0.0, 5000, seed=42, out=out)
+    assert np.array_equal(np.fromfile(tmp_path / "amh.bin"), expected[0])
+    assert result[3] == expected[3]
+
+    with pytest.raises(ValueError, match="shape"):
+        metropolis_hastings(
+            target_dist, proposal_distribution, 0.0, 100, out=np.zeros(99)
+        )
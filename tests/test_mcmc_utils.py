@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+from library import mcmc_utils
+from library.mcmc_utils import (
+    target_distribution,
+    target_cache_info,
+    set_target_cache_size,
+    clear_target_cache,
+    proposal_distribution,
+)
+from library.mcmc_algorithms import metropolis_hastings, metropolis_adjusted_langevin
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    """Start every test with an empty compiled-target cache."""
+    clear_target_cache()
+    yield
+    set_target_cache_size(128)
+    clear_target_cache()
+
+
+def test_equivalent_expressions_share_cache_entry():
+    """Test that canonically equal expressions are compiled once."""
+    first = target_distribution("exp(-x**2)")
+    second = target_distribution("exp(-x*x)")
+
+    assert first is second
+    info = target_cache_info()
+    assert info["misses"] == 1
+    assert info["hits"] == 1
+    assert info["currsize"] == 1
+
+
+def test_repeated_expression_skips_parsing(monkeypatch):
+    """Test that an identical expression string is found without parsing it again."""
+    parsed = []
+    parse_expression = mcmc_utils._parse_expression  # pylint: disable=protected-access
+
+    def counting_parse(expression):
+        parsed.append(expression)
+        return parse_expression(expression)
+
+    monkeypatch.setattr(mcmc_utils, "_parse_expression", counting_parse)
+    first = target_distribution("exp(-x**2)")
+    second = target_distribution("exp(-x**2)")
+
+    assert first is second
+    assert parsed == ["exp(-x**2)"]
+
+
+def test_density_and_log_density_cached_separately():
+    """Test that the log-density flag is part of the cache key."""
+    density = target_distribution("-x**2")
+    log_density = target_distribution("-x**2", log_density=True)
+
+    assert density is not log_density
+    assert target_cache_info()["misses"] == 2
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first."""
+    set_target_cache_size(2)
+    target_distribution("exp(-x**2)")
+    target_distribution("exp(-x**4)")
+    target_distribution("exp(-x**2)")  # Refresh the first entry
+    target_distribution("exp(-abs(x))")  # Evicts exp(-x**4)
+
+    info = target_cache_info()
+    assert info["evictions"] == 1
+    assert info["currsize"] == 2
+
+    target_distribution("exp(-x**2)")
+    assert target_cache_info()["hits"] == 2
+    target_distribution("exp(-x**4)")
+    assert target_cache_info()["misses"] == 4
+
+
+def test_compile_errors_cached():
+    """Test that invalid expressions fail fast from negative cache entries."""
+    for expression, message in [
+        ("exp(-x**2", "Cannot parse"),
+        ("exp(-y**2)", "must contain the variable 'x'"),
+        ("1/x", "Cannot evaluate expression"),
+    ]:
+        for _ in range(3):
+            with pytest.raises(ValueError, match=message):
+                target_distribution(expression)
+
+    info = target_cache_info()
+    assert info["misses"] == 3
+    assert info["hits"] == 6
+
+
+def test_gradient():
+    """Test that compiled targets evaluate the symbolic gradient of their log-density."""
+    x = np.linspace(-3, 3, 7)
+    target = target_distribution()
+    assert np.allclose(target.log_density_gradient(x), -x)
+    log_density, gradient = target.log_density_and_gradient(x)
+    assert np.allclose(log_density, target.log_density(x))
+    assert np.allclose(gradient, -x)
+
+    target = target_distribution("-x**4 / 4 + 2 * x", log_density=True)
+    assert np.allclose(target.log_density_gradient(x), -(x**3) + 2)
+
+
+def test_non_differentiable_target():
+    """Test that a target without a usable derivative samples with MH but not MALA."""
+    target = target_distribution("floor(x) + 1")
+    assert "log_density_and_gradient" not in target.evaluation_seconds
+    samples, *_ = metropolis_hastings(
+        target, proposal_distribution, 0.5, 1000, burn_in=0, seed=1
+    )
+    assert len(samples) == 1000
+
+    with pytest.raises(ValueError, match="not differentiable"):
+        metropolis_adjusted_langevin(target, 0.5, 1000)
+
+
+def test_log_density_validation():
+    """Test that log-densities are validated in log space."""
+    # exp(800) overflows as a density but is a valid unnormalized log-density
+    target = target_distribution("800 - x**2", log_density=True)
+    assert target.log_density(0.0) == 800.0
+
+    # A density of zero at the test point is allowed
+    target = target_distribution("log(x**2)", log_density=True)
+    assert target.log_density(1.0) == 0.0
+
+    for expression in ["log(-x**2 - 1)", "1/x**2"]:
+        with pytest.raises(ValueError, match="Cannot evaluate expression"):
+            target_distribution(expression, log_density=True)
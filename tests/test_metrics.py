@@ -0,0 +1,54 @@
+import pytest
+from library.metrics import MetricsRegistry, Counter, Gauge, Histogram
+from library.mcmc_algorithms import (
+    metropolis_hastings,
+    SAMPLER_ITERATIONS,
+    SAMPLER_RUNS,
+)
+from library.mcmc_utils import target_distribution, proposal_distribution
+
+
+def test_render_and_merge_snapshots():
+    """Test the text format of each metric type and the merging of worker snapshots."""
+    registry = MetricsRegistry()
+    requests = Counter("requests_total", "Requests.", ["path"], registry=registry)
+    in_progress = Gauge("in_progress", "Requests in progress.", registry=registry)
+    seconds = Histogram("seconds", "Durations.", buckets=(0.1, 1.0), registry=registry)
+    requests.inc(path='/a"b')
+    requests.inc(2, path="/c")
+    in_progress.inc()
+    seconds.observe(0.05)
+    seconds.observe(0.5)
+
+    worker = registry.snapshot()
+    assert "in_progress" not in worker
+    lines = registry.render([worker]).splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{path="/a\\"b"} 2' in lines
+    assert 'requests_total{path="/c"} 4' in lines
+    assert "in_progress 1" in lines
+    assert 'seconds_bucket{le="0.1"} 2' in lines
+    assert 'seconds_bucket{le="1"} 4' in lines
+    assert 'seconds_bucket{le="+Inf"} 4' in lines
+    assert "seconds_count 4" in lines
+    assert seconds.count() == 2
+
+    with pytest.raises(ValueError):
+        requests.inc(-1, path="/a")
+    with pytest.raises(ValueError):
+        requests.inc(method="GET")
+
+
+def test_samplers_record_runs():
+    """Test that library samplers count their runs and iterations without the API."""
+    runs = SAMPLER_RUNS.get(sampler="mh")
+    iterations = SAMPLER_ITERATIONS.get(sampler="mh")
+    metropolis_hastings(
+        target_distribution(),
+        proposal_distribution,
+        0.0,
+        1000,
+        burn_in=100,
+    )
+    assert SAMPLER_RUNS.get(sampler="mh") == runs + 1
+    assert SAMPLER_ITERATIONS.get(sampler="mh") == iterations + 1100
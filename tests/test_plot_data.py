@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from library.mcmc_utils import target_distribution
+from library.plot_data import binned_histogram, density_curve, downsample_trace
+
+
+def test_minmax_downsampling_keeps_the_envelope():
+    """Test that min/max decimation keeps each bucket's extremes in iteration order."""
+    samples = np.cumsum(np.random.default_rng(0).normal(size=100003))
+    iterations, values = downsample_trace(samples, max_points=1000)
+    assert len(iterations) <= 1000
+    assert np.all(np.diff(iterations) > 0)
+    assert np.array_equal(values, samples[iterations])
+    assert values.min() == samples.min() and values.max() == samples.max()
+
+    # Flat buckets keep a single sample
+    iterations, values = downsample_trace(np.ones(100), max_points=10)
+    assert len(iterations) == 5
+    assert np.all(values == 1.0)
+
+
+def test_lttb_downsampling():
+    """Test that LTTB keeps the ends, one sample per bucket and a lone spike."""
+    samples = np.zeros(10000)
+    samples[5000] = 10.0
+    iterations, values = downsample_trace(samples, max_points=100, method="lttb")
+    assert len(iterations) == 100
+    assert iterations[0] == 0 and iterations[-1] == 9999
+    assert np.all(np.diff(iterations) > 0)
+    assert 5000 in iterations
+    assert np.array_equal(values, samples[iterations])
+
+
+def test_short_traces_and_invalid_arguments():
+    """Test that short traces are returned whole and bad arguments are rejected."""
+    iterations, values = downsample_trace([3.0, 1.0, 2.0])
+    assert np.array_equal(iterations, [0, 1, 2])
+    assert np.array_equal(values, [3.0, 1.0, 2.0])
+    with pytest.raises(ValueError):
+        downsample_trace(np.zeros(10), method="stride")
+    with pytest.raises(ValueError):
+        downsample_trace(np.zeros(10), max_points=2)
+
+
+def test_density_curve_and_histogram():
+    """Test the vectorized density overlay and the pre-binned histogram."""
+    x, density = density_curve(target_distribution(), -1.0, 1.0, n_points=3)
+    assert np.allclose(x, [-1.0, 0.0, 1.0])
+    assert np.allclose(density, np.exp(-0.5 * x**2) / np.sqrt(2 * np.pi))
+    x, density = density_curve(lambda x: 2.0, 0.0, 1.0, n_points=4)
+    assert np.array_equal(density, np.full(4, 2.0))
+
+    samples = np.random.default_rng(1).normal(size=10000)
+    densities, edges = binned_histogram(samples, bins=20)
+    assert len(densities) == 20 and len(edges) == 21
+    assert np.isclose(np.sum(densities * np.diff(edges)), 1.0)
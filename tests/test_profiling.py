@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import pytest
+from library.mcmc_utils import target_distribution
+from library.profiling import RunProfiler, CountingTarget, format_profile
+from library.tasks import run_sampler
+
+
+def test_phases_and_evaluation_counts():
+    """Test phase timing, splitting a phase, and counting target evaluations."""
+    profiler = RunProfiler()
+    target = profiler.count_evaluations(target_distribution())
+    with profiler:
+        with profiler.phase("sampling"):
+            time.sleep(0.02)
+            target.log_density(0.5)
+            target.log_density(np.zeros(4))
+            target.log_density_and_gradient(0.5)
+        profiler.split("sampling", "statistics", 0.01)
+
+    profile = profiler.result(iterations=10)
+    assert list(profile["phases"]) == ["sampling", "statistics"]
+    assert profile["phases"]["sampling"] == 0.01
+    assert profile["phases"]["statistics"] >= 0.01
+    assert profile["seconds_per_iteration"] == pytest.approx(0.001)
+    assert profile["target_evaluations"] == 6
+    assert profile["gradient_evaluations"] == 1
+    assert profile["total_time"] >= 0.02
+    assert format_profile(profile)[0] == "Profile:"
+
+    disabled = RunProfiler(enabled=False)
+    assert not isinstance(disabled.count_evaluations(target.target), CountingTarget)
+    with disabled, disabled.phase("compile"):
+        pass
+    assert disabled.result(10) is None
+    assert RunProfiler(enabled=False, report="memory").enabled
+    with pytest.raises(ValueError):
+        RunProfiler(report="perf")
+
+
+def test_profiled_sampler_runs():
+    """Test that profiled runs report every phase and match unprofiled results."""
+    params = {"iterations": 2000, "burn_in": 100, "seed": 3}
+    result = run_sampler("hmc", {**params, "profile": True})
+    profile = result["profile"]
+    assert list(profile["phases"]) == [
+        "compile",
+        "sampling",
+        "statistics",
+        "diagnostics",
+    ]
+    assert profile["iterations"] == 2100
+    assert profile["target_evaluations"] > 2100
+    assert profile["gradient_evaluations"] > profile["target_evaluations"]
+    expected = run_sampler("hmc", params)
+    assert "profile" not in expected
+    assert np.array_equal(result["samples"], expected["samples"])
+
+    result = run_sampler("pt", {**params, "profile_report": "cprofile"})
+    assert result["profile"]["target_evaluations"] >= 8 * 2100
+    assert "cumulative" in result["profile"]["cprofile"]
+    memory = run_sampler("mh", {**params, "profile_report": "memory"})["profile"]
+    assert memory["memory"]["peak_bytes"] > 0
+    assert memory["memory"]["top_allocations"]
@@ -0,0 +1,101 @@
+import threading
+import numpy as np
+from library.mcmc_utils import target_distribution
+from library.result_cache import ResultCache, result_cache_key
+
+
+def make_result(n_samples, value=0.0):
+    """A sampler result with n_samples samples."""
+    return {
+        "samples": np.full(n_samples, value),
+        "elapsed_time": 1.0,
+        "acceptance_rate": 0.5,
+        "mean": value,
+        "median": value,
+        "credible_interval": (value - 1, value + 1),
+        "diagnostics": {"ess": 10.0, "ess_per_second": 10.0, "mcse": 0.1, "r_hat": 1.0},
+    }
+
+
+def test_result_cache_key():
+    """Test that equivalent targets share a key and any parameter changes it."""
+    params = {"expression": None, "log_density": False, "iterations": 100, "seed": 1}
+    density = target_distribution("exp(-0.5 * x**2)")
+    log_density = target_distribution("-0.5 * x * x", log_density=True)
+    key = result_cache_key("mh", density, params)
+    assert result_cache_key("mh", log_density, params) == key
+    assert result_cache_key("amh", density, params) != key
+    assert result_cache_key("mh", density, {**params, "seed": 2}) != key
+    assert result_cache_key("mh", target_distribution("exp(-x**2)"), params) != key
+
+
+def test_memory_tier_evicts_least_recently_used():
+    """Test that the memory tier stays within its byte limit, evicting LRU results."""
+    cache = ResultCache(max_bytes=3 * (1024 + 800))
+    for key in "abc":
+        cache.put(key, make_result(100))
+    cache.get("a")
+    cache.put("d", make_result(100))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.info()["entries"] == 3
+    assert cache.info()["bytes"] <= cache.max_bytes
+
+    cache.put("big", make_result(10000))
+    assert cache.get("big") is None
+
+    disabled = ResultCache(max_bytes=0)
+    disabled.put("a", make_result(10))
+    assert disabled.get("a") is None
+
+
+def test_disk_tier(tmp_path):
+    """Test that the disk tier outlives the process's cache and respects its size cap."""
+    cache = ResultCache(max_bytes=2**20, directory=str(tmp_path), max_disk_bytes=20000)
+    cache.put("a", make_result(1000, 1.0))
+    summary = {**make_result(0), "samples": None}
+    cache.put("summary", summary)
+
+    restarted = ResultCache(directory=str(tmp_path), max_disk_bytes=20000)
+    result = restarted.get("a")
+    assert np.array_equal(result["samples"], np.full(1000, 1.0))
+    assert result["credible_interval"] == (0.0, 2.0)
+    assert restarted.get("summary")["samples"] is None
+    assert restarted.info()["disk_hits"] == 2
+
+    # 'a' was used more recently than 'b', so 'b' is evicted first
+    restarted.put("b", make_result(1000, 2.0))
+    restarted.get("a")
+    restarted.put("c", make_result(1000, 3.0))
+    assert restarted.info()["disk_bytes"] <= 20000
+    fresh = ResultCache(directory=str(tmp_path), max_disk_bytes=20000)
+    assert fresh.get("b") is None
+    assert fresh.get("c") is not None
+
+    fresh.clear()
+    assert not list(tmp_path.iterdir())
+
+
+def test_concurrent_disk_writes(tmp_path):
+    """Test that results written at once by many threads are stored and counted once."""
+    cache = ResultCache(directory=str(tmp_path))
+    threads = [
+        threading.Thread(target=cache.put, args=(key, make_result(10000, 1.0)))
+        for key in "aabbab"
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "a.f8",
+        "a.json",
+        "b.f8",
+        "b.json",
+    ]
+    assert cache.info()["disk_bytes"] == sum(
+        path.stat().st_size for path in tmp_path.iterdir()
+    )
+    restarted = ResultCache(directory=str(tmp_path))
+    assert np.array_equal(restarted.get("b")["samples"], np.full(10000, 1.0))
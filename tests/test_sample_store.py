@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from library.sample_store import (
+    load_samples,
+    open_sample_file,
+    sample_count,
+    save_samples,
+)
+
+
+def test_sample_count():
+    """Test that the sample count matches the samples a thinned chain keeps."""
+    assert sample_count(10) == 10
+    assert sample_count(10, 3) == len(range(0, 10, 3)) == 4
+    assert sample_count(0) == 0
+
+
+def test_save_and_load_formats(tmp_path):
+    """Test that samples round-trip through every format, with binary ones memory-mapped."""
+    samples = np.random.default_rng(0).normal(size=1001)
+    for sample_format in ("npy", "bin", "txt"):
+        path = str(tmp_path / f"samples.{sample_format}")
+        save_samples(path, samples, sample_format)
+        loaded = load_samples(path)
+        assert np.array_equal(loaded, samples)
+        assert isinstance(loaded, np.memmap) == (sample_format != "txt")
+
+    for sample_format in ("npy", "bin"):
+        path = str(tmp_path / f"empty.{sample_format}")
+        assert len(open_sample_file(path, 0, sample_format)) == 0
+        assert len(load_samples(path)) == 0
+
+    with pytest.raises(ValueError):
+        save_samples(str(tmp_path / "samples.csv"), samples, "csv")
+    with pytest.raises(ValueError):
+        open_sample_file(str(tmp_path / "samples.txt"), 10, "txt")
+
+
+def test_memory_mapped_file_is_flushed_in_place(tmp_path):
+    """Test that saving a file's own memory map flushes it rather than rewriting it."""
+    path = str(tmp_path / "samples.npy")
+    out = open_sample_file(path, 5)
+    out[:] = np.arange(5.0)
+    save_samples(path, out)
+    assert np.array_equal(np.load(path), np.arange(5.0))
+
+    # A run stopped early fills only the start of the file, which is cut down to it
+    for sample_format in ("npy", "bin"):
+        path = str(tmp_path / f"partial.{sample_format}")
+        out = open_sample_file(path, 1000, sample_format)
+        out[:3] = [1.0, 2.0, 3.0]
+        save_samples(path, out[:3], sample_format)
+        assert np.array_equal(load_samples(path), [1.0, 2.0, 3.0])
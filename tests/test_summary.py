@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from library.summary import RunningMoments, QuantileSketch, chunked_percentile
+
+
+def test_running_moments_match_numpy():
+    """Test that chunked moments match the moments of the whole array."""
+    values = np.random.default_rng(0).normal(1e6, 3.0, 10001)
+    moments = RunningMoments()
+    for chunk in np.array_split(values, 7):
+        moments.add(chunk)
+    moments.add([])
+    assert moments.count == len(values)
+    assert np.isclose(moments.mean, np.mean(values))
+    assert np.isclose(moments.std, np.std(values))
+    assert np.isnan(RunningMoments().std)
+
+
+def test_quantile_sketch_error_bound():
+    """Test that sketch quantiles are within the relative accuracy of the order statistics."""
+    rng = np.random.default_rng(1)
+    levels = np.array([0.0, 0.025, 0.1, 0.5, 0.9, 0.975, 1.0])
+    for values in [
+        rng.normal(0.0, 1.0, 50000),
+        rng.standard_cauchy(50000),
+        rng.exponential(1e-3, 50000),
+        np.concatenate([np.zeros(100), rng.normal(5.0, 1.0, 1000)]),
+    ]:
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for chunk in np.array_split(values, 5):
+            sketch.add(chunk)
+        exact = np.sort(values)[np.floor(levels * (len(values) - 1)).astype(int)]
+        estimates = sketch.quantile(levels)
+        assert np.all(np.abs(estimates - exact) <= 0.01 * np.abs(exact) + 1e-9)
+
+    assert np.isnan(QuantileSketch().quantile(0.5))
+    with pytest.raises(ValueError):
+        QuantileSketch(relative_accuracy=1.5)
+
+
+def test_chunked_percentile_matches_numpy():
+    """Test that block-wise percentiles equal np.percentile exactly, ties included."""
+    rng = np.random.default_rng(2)
+    levels = [0.0, 2.5, 33.3, 50.0, 97.5, 100.0]
+    for values in [
+        rng.normal(0.0, 1.0, 100001),
+        rng.standard_cauchy(100000),
+        np.repeat([1.0, 2.0, 3.0], 30000),
+        np.concatenate([np.zeros(50000), [-1e300, 1e300]]),
+        np.array([5.0]),
+    ]:
+        # Small blocks and selections force several narrowing passes
+        estimates = chunked_percentile(
+            values, levels, block_size=10000, max_selected=100
+        )
+        assert np.array_equal(estimates, np.percentile(values, levels))
+
+    assert chunked_percentile(np.arange(11.0), 50) == 5.0
+    assert np.isnan(chunked_percentile(np.array([]), 50))
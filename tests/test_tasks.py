@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import pytest
+from library.tasks import BackgroundRun, TaskCancelledError, run_sampler
+
+
+@pytest.mark.parametrize(
+    "sampler, iterations",
+    [("mh", 200000), ("amh", 200000), ("pt", 20000), ("mala", 20000), ("hmc", 5000)],
+)
+def test_background_run_matches_run_sampler(sampler, iterations):
+    """Test that a background run's samples grow as it runs and its result is exact."""
+    params = {"iterations": iterations, "thin": 2, "seed": 42}
+    run = BackgroundRun(sampler, params, chunk_size=1000)
+    assert run.total == iterations + 1000
+    observed = []
+    while not run.done:
+        observed.append(len(run.samples()))
+        time.sleep(0.01)
+    assert observed == sorted(observed)
+
+    result = run.result()
+    expected = run_sampler(sampler, params)
+    assert np.array_equal(result["samples"], expected["samples"])
+    assert np.array_equal(run.samples(), expected["samples"])
+    assert run.completed == run.total
+    for key in ("acceptance_rate", "mean", "median", "credible_interval"):
+        assert result[key] == expected[key]
+    assert result["diagnostics"].keys() == expected["diagnostics"].keys()
+    for key in ("acceptance_rates", "temperatures", "swap_rates", "step_size"):
+        assert result.get(key) == expected.get(key)
+    assert not result["truncated"]
+
+
+def test_background_run_cancel_and_errors():
+    """Test that cancelling stops a run quickly and errors are raised by result()."""
+    run = BackgroundRun("mh", {"iterations": 10**8})
+    time.sleep(0.2)
+    run.cancel()
+    with pytest.raises(TaskCancelledError):
+        run.result(timeout=5)
+    assert run.completed < run.total
+
+    with pytest.raises(ValueError):
+        BackgroundRun("mh", {"expression": "y"}).result(timeout=5)
+
+
+def test_background_run_stop_and_idle_timeout():
+    """Test that a stopped run keeps its samples, and an unread run is cancelled."""
+    params = {"iterations": 10**8, "seed": 1}
+    run = BackgroundRun("mh", params)
+    while len(run.samples()) < 10000:
+        time.sleep(0.01)
+    run.stop()
+    result = run.result(timeout=5)
+    assert run.stopped and result["truncated"]
+    assert 10000 <= len(result["samples"]) == run.completed - 1000 < 10**8
+    assert result["mean"] == np.mean(result["samples"])
+
+    run = BackgroundRun("mh", params, idle_timeout=0.2)
+    time.sleep(1.0)
+    assert run.done
+    with pytest.raises(TaskCancelledError):
+        run.result()
@@ -1,12 +1,34 @@
+import json
+import time
 import streamlit as st
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from library.mcmc_utils import target_distribution
-from library.mcmc_algorithms import metropolis_hastings, adaptive_metropolis_hastings
-from library.mcmc_utils import proposal_distribution
-from time import sleep
+from library.diagnostics import autocorrelation
+from library.plot_data import binned_histogram, density_curve, downsample_trace
+from library.tasks import BackgroundRun
+
+# Seconds between redraws of a running chain's plots
+LIVE_REFRESH_INTERVAL = 0.5
+
+# Samples per chunk a running chain hands to the live plots
+LIVE_CHUNK_SIZE = 5000
+
+# Seconds after which a run no session is watching any more is cancelled. A watched
+# run is read at every redraw
+RUN_IDLE_TIMEOUT = 10
+
+SAMPLER_NAMES = {
+    "mh": "Metropolis-Hastings",
+    "amh": "Adaptive Metropolis-Hastings",
+    "mala": "Metropolis-Adjusted Langevin",
+    "hmc": "Hamiltonian Monte Carlo",
+}
+
+# The helper functions below reuse the names of the script's top-level variables
+# pylint: disable=redefined-outer-name
 
 # Set page configuration
 st.set_page_config(page_title="MCMC Sampling App", page_icon="📊", layout="wide")
@@ -32,9 +54,9 @@ st.markdown(
 st.title("📊 MCMC Sampling Application")
 st.markdown(
     """
-This application provides an interface for running Metropolis-Hastings (MH) and 
-Adaptive Metropolis-Hastings (AMH) MCMC samplers. Choose your sampler, set your parameters, 
-and visualize the results!
+This application provides an interface for running Metropolis-Hastings (MH), 
+Adaptive Metropolis-Hastings (AMH), Metropolis-adjusted Langevin (MALA) and Hamiltonian 
+Monte Carlo (HMC) samplers. Choose your sampler, set your parameters, and visualize the results!
 """
 )
 
@@ -44,14 +66,17 @@ check_interval = 200
 increase_factor = 1.1
 decrease_factor = 0.9
 
+# Initialize gradient sampler parameters with default values
+step_size = 1.0
+n_leapfrog = 10
+target_acceptance = 0.574
+
 # Sidebar for selecting sampler and parameters
 with st.sidebar:
     st.header("Sampler Configuration")
 
     # Select sampler
-    sampler_type = st.radio(
-        "Select MCMC Sampler", ["Metropolis-Hastings", "Adaptive Metropolis-Hastings"]
-    )
+    sampler_type = st.radio("Select MCMC Sampler", list(SAMPLER_NAMES.values()))
 
     # Add descriptions with LaTeX
     if sampler_type == "Metropolis-Hastings":
@@ -78,7 +103,7 @@ with st.sidebar:
         - $\\alpha(x, y)$ is the acceptance probability
         """
         )
-    else:
+    elif sampler_type == "Adaptive Metropolis-Hastings":
         st.markdown(
             """
         #### Adaptive Metropolis-Hastings Algorithm
@@ -105,6 +130,51 @@ with st.sidebar:
         - $f_{dec}$ is the decrease factor
         """
         )
+    elif sampler_type == "Metropolis-Adjusted Langevin":
+        st.markdown(
+            """
+        #### Metropolis-Adjusted Langevin Algorithm
+        
+        MALA drifts its proposals up the gradient of the log-density:
+
+        1. **Proposal Step**: Generate candidate $y$ from
+        $$y \\sim N\\left(x_t + \\tfrac{\\epsilon^2}{2} \\nabla \\log p(x_t), \\epsilon^2\\right)$$
+        
+        2. **Acceptance Step**: Accept $y$ with the MH probability, correcting for the
+        asymmetric proposal:
+        $$\\alpha(x_t, y) = min\\left(1, \\frac{p(y)q(x_t|y)}{p(x_t)q(y|x_t)}\\right)$$
+        
+        3. **Adaptation Step**: During burn-in, tune $\\epsilon$ towards the target
+        acceptance rate by dual averaging
+
+        where:
+        - $\\epsilon$ is the step size
+        - $\\nabla \\log p$ is the gradient of the log-density, derived symbolically
+        """
+        )
+    else:
+        st.markdown(
+            """
+        #### Hamiltonian Monte Carlo
+        
+        HMC follows the dynamics of a particle moving on the surface $-\\log p(x)$:
+
+        1. **Momentum Step**: Draw a momentum $m \\sim N(0, 1)$
+        
+        2. **Trajectory Step**: Take between 1 and $L$ leapfrog steps of size $\\epsilon$:
+        $$m \\leftarrow m + \\tfrac{\\epsilon}{2} \\nabla \\log p(x), \\quad
+        x \\leftarrow x + \\epsilon m, \\quad
+        m \\leftarrow m + \\tfrac{\\epsilon}{2} \\nabla \\log p(x)$$
+        
+        3. **Acceptance Step**: Accept the end point $(y, m')$ with probability:
+        $$\\alpha = min\\left(1, \\frac{p(y) e^{-m'^2/2}}{p(x_t) e^{-m^2/2}}\\right)$$
+
+        where:
+        - $\\epsilon$ is the step size, tuned during burn-in towards the target acceptance rate
+        - $L$ is the most leapfrog steps per iteration
+        - $\\nabla \\log p$ is the gradient of the log-density, derived symbolically
+        """
+        )
 
     # Common parameters
     st.subheader("Common Parameters")
@@ -113,6 +183,11 @@ with st.sidebar:
         value="exp(-0.5 * x**2) / sqrt(2 * pi)",
         help="Mathematical expression for the target distribution",
     )
+    log_density = st.checkbox(
+        "Expression is a log-density",
+        value=False,
+        help="Interpret the expression as log p(x), e.g. -1000 * x**2",
+    )
 
     col1, col2 = st.columns(2)
     with col1:
@@ -152,120 +227,280 @@ with st.sidebar:
                 "Decrease Factor", min_value=0.1, max_value=1.0, value=0.9, step=0.1
             )
 
+    # MALA and HMC specific parameters
+    if sampler_type in ("Metropolis-Adjusted Langevin", "Hamiltonian Monte Carlo"):
+        hmc_selected = sampler_type == "Hamiltonian Monte Carlo"
+        st.subheader("Gradient Sampler Parameters")
+        col3, col4 = st.columns(2)
+        with col3:
+            step_size = st.number_input(
+                "Initial Step Size",
+                min_value=0.001,
+                value=0.5 if hmc_selected else 1.0,
+                step=0.1,
+                help="Tuned towards the target acceptance rate during burn-in",
+            )
+            if hmc_selected:
+                n_leapfrog = st.number_input(
+                    "Leapfrog Steps",
+                    min_value=1,
+                    value=10,
+                    help="Most leapfrog steps per iteration",
+                )
+        with col4:
+            target_acceptance = st.number_input(
+                "Target Acceptance",
+                min_value=0.05,
+                max_value=0.95,
+                value=0.8 if hmc_selected else 0.574,
+                step=0.05,
+            )
+
+
+# Compiled targets, runs and results are cached across reruns, so changing a widget,
+# switching tabs or resizing the page never recompiles a target or reruns a chain.
+@st.cache_resource(show_spinner=False)
+def compile_target(expression, log_density):
+    """Compile a target once per expression, shared by all sessions."""
+    return target_distribution(expression, log_density=log_density)
+
+
+@st.cache_resource(show_spinner=False)
+def finished_runs():
+    """Keys of the runs whose results have been cached, shared by all sessions."""
+    return set()
+
+
+@st.cache_data(max_entries=8, show_spinner="Running sampler...")
+def sampling_result(run_key, _run=None):
+    """
+    Result of the run with the given key, cached by its parameters.
+
+    Every run is seeded, so equal parameters always give the same result. ``_run``
+    is a run already started for the key; it is not part of the cache key.
+    """
+    if _run is None:
+        sampler, params = json.loads(run_key)
+        _run = BackgroundRun(sampler, params)
+    return _run.result()
+
+
+def samples_to_csv(samples):
+    """CSV download of samples."""
+    return pd.DataFrame(samples, columns=["value"]).to_csv(index=False).encode("utf-8")
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def samples_csv(run_key):
+    """CSV download of a cached run's samples."""
+    return samples_to_csv(sampling_result(run_key)["samples"])
+
+
+def trace_figure(samples, title="MCMC Trace Plot"):
+    """Trace plot, downsampled so the payload stays small however long the chain."""
+    iterations, values = downsample_trace(samples)
+    figure = go.Figure()
+    figure.add_trace(go.Scatter(x=iterations, y=values, mode="lines", name="Samples"))
+    figure.update_layout(
+        title=title,
+        xaxis_title="Iteration",
+        yaxis_title="Sample Value",
+        height=500,
+    )
+    return figure
+
+
+def histogram_figure(samples, target_dist):
+    """Histogram binned here rather than in the browser, with the target distribution."""
+    densities, edges = binned_histogram(samples)
+    x, target_values = density_curve(target_dist, edges[0], edges[-1])
+
+    figure = go.Figure()
+    figure.add_trace(
+        go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=densities,
+            width=np.diff(edges),
+            name="Samples",
+        )
+    )
+    figure.add_trace(
+        go.Scatter(
+            x=x,
+            y=target_values,
+            name="Target Distribution",
+            line=dict(color="red"),
+        )
+    )
+    figure.update_layout(
+        title="Sample Distribution vs Target",
+        xaxis_title="Value",
+        yaxis_title="Density",
+        height=500,
+        bargap=0,
+    )
+    return figure
+
+
+def show_live_run(run, target_dist):
+    """
+    Redraw a running chain's progress, trace and histogram until it finishes.
+
+    The stop button ends the run early, keeping the samples so far.
+    """
+    if st.button("Stop Sampling", key="stop_run"):
+        run.stop()
+    progress_bar = st.progress(0.0)
+    status_text = st.empty()
+    col1, col2 = st.columns(2)
+    with col1:
+        trace_placeholder = st.empty()
+    with col2:
+        histogram_placeholder = st.empty()
+
+    frame = 0
+    while not run.done:
+        completed = run.completed
+        progress_bar.progress(min(1.0, completed / max(1, run.total)))
+        status_text.text(f"Sampling: {completed:,}/{run.total:,} iterations")
+        samples = run.samples()
+        if len(samples) > 1:
+            trace_placeholder.plotly_chart(
+                trace_figure(samples, title="Trace (running)"),
+                use_container_width=True,
+                key=f"live_trace_{frame}",
+            )
+            histogram_placeholder.plotly_chart(
+                histogram_figure(samples, target_dist),
+                use_container_width=True,
+                key=f"live_histogram_{frame}",
+            )
+        frame += 1
+        time.sleep(LIVE_REFRESH_INTERVAL)
+
+    for element in (
+        progress_bar,
+        status_text,
+        trace_placeholder,
+        histogram_placeholder,
+    ):
+        element.empty()
+
+
 # Main content
+sampler = next(name for name, title in SAMPLER_NAMES.items() if title == sampler_type)
+params = {
+    "expression": expression,
+    "log_density": log_density,
+    "initial": initial,
+    "iterations": int(iterations),
+    "burn_in": int(burn_in),
+    "thin": int(thin),
+    "seed": int(seed),
+    "credible_interval": credible_interval,
+}
+if sampler == "amh":
+    params.update(
+        initial_variance=initial_variance,
+        check_interval=int(check_interval),
+        increase_factor=increase_factor,
+        decrease_factor=decrease_factor,
+    )
+elif sampler in ("mala", "hmc"):
+    params.update(step_size=step_size, target_acceptance=target_acceptance)
+    if sampler == "hmc":
+        params["n_leapfrog"] = int(n_leapfrog)
+
 try:
     if st.button("Run Sampler", type="primary"):
-        # Create progress bar
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-
-        # Initialize sampler
-        status_text.text("Initializing sampler...")
-        progress_bar.progress(10)
-
-        # Get target distribution
-        target_dist = target_distribution(expression)
-        progress_bar.progress(20)
-
-        # Run selected sampler
-        if sampler_type == "Metropolis-Hastings":
-            status_text.text("Running Metropolis-Hastings sampler...")
-            samples, elapsed_time, acceptance_rate, mean, median, ci = (
-                metropolis_hastings(
-                    target_dist,
-                    proposal_distribution,
-                    initial,
-                    iterations,
-                    burn_in=burn_in,
-                    thin=thin,
-                    seed=seed,
-                    credible_interval=credible_interval,
+        run_key = json.dumps([sampler, params], sort_keys=True)
+        # Invalid expressions fail here, before any chain is started or stopped
+        compile_target(expression, log_density)
+        previous_run = st.session_state.get("run")
+        if run_key != st.session_state.get("run_key") or (
+            previous_run is not None and previous_run.stopped
+        ):
+            # Stop a chain that is still running for earlier parameters
+            if previous_run is not None:
+                previous_run.cancel()
+            st.session_state.run_key = run_key
+            st.session_state.run = (
+                None
+                if run_key in finished_runs()
+                else BackgroundRun(
+                    sampler,
+                    params,
+                    chunk_size=LIVE_CHUNK_SIZE,
+                    idle_timeout=RUN_IDLE_TIMEOUT,
                 )
             )
-            acceptance_rates = None
+
+    run_key = st.session_state.get("run_key")
+    if run_key is not None:
+        run_sampler_name, run_params = json.loads(run_key)
+        target_dist = compile_target(
+            run_params["expression"], run_params["log_density"]
+        )
+        run = st.session_state.get("run")
+        if run is not None and not run.done:
+            show_live_run(run, target_dist)
+        if run is not None and run.stopped:
+            # A run stopped early is kept for the session, rather than cached as the
+            # result of its parameters
+            result = run.result()
         else:
-            status_text.text("Running Adaptive Metropolis-Hastings sampler...")
-            (
-                samples,
-                elapsed_time,
-                acceptance_rate,
-                acceptance_rates,
-                mean,
-                median,
-                ci,
-            ) = adaptive_metropolis_hastings(
-                target_dist,
-                initial,
-                iterations,
-                initial_variance=initial_variance,
-                check_interval=check_interval,
-                increase_factor=increase_factor,
-                decrease_factor=decrease_factor,
-                burn_in=burn_in,
-                thin=thin,
-                seed=seed,
-                credible_interval=credible_interval,
+            try:
+                result = sampling_result(run_key, _run=run)
+            finally:
+                # A failed run is not retried on every rerun
+                st.session_state.run = None
+            finished_runs().add(run_key)
+
+        if result.get("truncated"):
+            st.warning(
+                f"Sampling was stopped after {run.completed:,} of {run.total:,} "
+                "iterations, so the results are for the samples so far."
             )
-
-        progress_bar.progress(70)
-        status_text.text("Generating visualizations...")
+            if not len(result["samples"]):
+                st.info("The run stopped during burn-in, before keeping any samples.")
+                st.stop()
+
+        samples = result["samples"]
+        ci = result["credible_interval"]
+        acceptance_rates = result.get("acceptance_rates")
+        step_size_adapted = result.get("step_size")
+        diagnostics = {
+            key: float("nan") if value is None else value
+            for key, value in result["diagnostics"].items()
+        }
 
         # Display results in columns
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Elapsed Time", f"{elapsed_time:.2f} seconds")
-            st.metric("Mean", f"{mean:.4f}")
+            st.metric("Elapsed Time", f"{result['elapsed_time']:.2f} seconds")
+            st.metric("Mean", f"{result['mean']:.4f}")
         with col2:
-            st.metric("Acceptance Rate", f"{acceptance_rate:.2%}")
-            st.metric("Median", f"{median:.4f}")
+            st.metric("Acceptance Rate", f"{result['acceptance_rate']:.2%}")
+            st.metric("Median", f"{result['median']:.4f}")
         with col3:
             st.metric("Number of Samples", len(samples))
             st.metric(
-                f"{credible_interval*100:.0f}% Credible Interval",
+                f"{run_params['credible_interval']*100:.0f}% Credible Interval",
                 f"({ci[0]:.4f}, {ci[1]:.4f})",
             )
+        if step_size_adapted is not None:
+            st.metric("Adapted Step Size", f"{step_size_adapted:.4g}")
 
         # Create tabs for different visualizations
         tab1, tab2, tab3 = st.tabs(["📈 Trace Plot", "📊 Histogram", "📉 Diagnostics"])
 
         with tab1:
-            # Trace plot using Plotly
-            fig_trace = go.Figure()
-            fig_trace.add_trace(go.Scatter(y=samples, mode="lines", name="Samples"))
-            fig_trace.update_layout(
-                title="MCMC Trace Plot",
-                xaxis_title="Iteration",
-                yaxis_title="Sample Value",
-                height=500,
-            )
-            st.plotly_chart(fig_trace, use_container_width=True)
+            st.plotly_chart(trace_figure(samples), use_container_width=True)
 
         with tab2:
-            # Histogram with target distribution
-            x = np.linspace(min(samples), max(samples), 1000)
-            target_values = [target_dist(xi) for xi in x]
-
-            fig_hist = go.Figure()
-            fig_hist.add_trace(
-                go.Histogram(
-                    x=samples, name="Samples", nbinsx=50, histnorm="probability density"
-                )
-            )
-            fig_hist.add_trace(
-                go.Scatter(
-                    x=x,
-                    y=target_values,
-                    name="Target Distribution",
-                    line=dict(color="red"),
-                )
-            )
-            fig_hist.update_layout(
-                title="Sample Distribution vs Target",
-                xaxis_title="Value",
-                yaxis_title="Density",
-                height=500,
+            st.plotly_chart(
+                histogram_figure(samples, target_dist), use_container_width=True
             )
-            st.plotly_chart(fig_hist, use_container_width=True)
 
         with tab3:
             if acceptance_rates is not None:
@@ -277,41 +512,58 @@ try:
                 )
                 st.plotly_chart(fig_acc, use_container_width=True)
 
-            # Add autocorrelation plot
-            autocorr = pd.Series(samples).autocorr()
-            st.metric("Autocorrelation (lag 1)", f"{autocorr:.3f}")
-
-        progress_bar.progress(90)
-        status_text.text("Preparing download options...")
+            # Throughput and convergence diagnostics
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Effective Sample Size", f"{diagnostics['ess']:,.0f}")
+            with col2:
+                st.metric(
+                    "ESS per Second", f"{diagnostics['ess_per_second'] or 0:,.0f}"
+                )
+            with col3:
+                st.metric("Monte Carlo SE", f"{diagnostics['mcse']:.4f}")
+            with col4:
+                st.metric("Split R-hat", f"{diagnostics['r_hat']:.4f}")
+
+            # Autocorrelation plot
+            acf = autocorrelation(samples, max_lag=min(100, len(samples) - 1))
+            fig_acf = go.Figure()
+            fig_acf.add_trace(go.Bar(x=np.arange(len(acf)), y=acf, name="ACF"))
+            fig_acf.update_layout(
+                title="Autocorrelation Function",
+                xaxis_title="Lag",
+                yaxis_title="Autocorrelation",
+                height=400,
+            )
+            st.plotly_chart(fig_acf, use_container_width=True)
 
         # Download buttons
         st.subheader("Download Results")
         col1, col2 = st.columns(2)
         with col1:
-            df_samples = pd.DataFrame(samples, columns=["value"])
-            csv = df_samples.to_csv(index=False).encode("utf-8")
             st.download_button(
                 label="Download Samples (CSV)",
-                data=csv,
+                data=(
+                    samples_to_csv(samples)
+                    if result.get("truncated")
+                    else samples_csv(run_key)
+                ),
                 file_name="mcmc_samples.csv",
                 mime="text/csv",
             )
 
         with col2:
             results_dict = {
-                "sampler_type": sampler_type,
-                "expression": expression,
-                "iterations": iterations,
-                "burn_in": burn_in,
-                "thin": thin,
-                "seed": seed,
-                "elapsed_time": elapsed_time,
-                "acceptance_rate": acceptance_rate,
+                "sampler_type": SAMPLER_NAMES[run_sampler_name],
+                **run_params,
+                "elapsed_time": result["elapsed_time"],
+                "acceptance_rate": result["acceptance_rate"],
+                "diagnostics": result["diagnostics"],
             }
             if acceptance_rates is not None:
                 results_dict["acceptance_rates"] = acceptance_rates
-
-            import json
+            if step_size_adapted is not None:
+                results_dict["adapted_step_size"] = step_size_adapted
 
             results_json = json.dumps(results_dict)
             st.download_button(
@@ -321,12 +573,6 @@ try:
                 mime="application/json",
             )
 
-        progress_bar.progress(100)
-        status_text.text("Sampling completed successfully!")
-        sleep(1)  # Give users time to see the completion
-        progress_bar.empty()
-        status_text.empty()
-
 except ValueError as e:
     st.error(f"Value Error: {str(e)}")
 except TypeError as e: